@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from alignment_utils import *
+
+DEFAULT_CACHE_DIR = os.environ.get('SLAMRENDER_ALIGNMENT_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'slam-render', 'alignment'))
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+CACHE_VERSION = 1
+
+
+def fingerprint_file(path, mode='mtime'):
+    """
+    Fingerprints an input file.
+
+    Parameters:
+    - path (str): File path.
+    - mode (str): 'mtime' (size + modification time, cheap) or 'content' (SHA-256 of the bytes).
+
+    Returns:
+    - fingerprint (str): Fingerprint string.
+    """
+    st = os.stat(path)
+    if mode == 'mtime':
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class AlignmentCache:
+    """
+    On-disk cache of alignment results, keyed by the fingerprints of their input files.
+
+    Every entry is a folder of .npy arrays (loaded memory-mapped) plus a meta.json. A change in any
+    input changes the key, so stale results are never returned; the superseded entry of the same
+    sequence is dropped when the new one is stored, and the least recently used entries are
+    evicted once the cache grows over max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, fingerprint_mode='mtime'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fingerprint_mode = fingerprint_mode
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, name, dataset_path, inputs):
+        parts = [f"v{CACHE_VERSION}", name, os.path.abspath(dataset_path)]
+        parts += [f"{rel_path}={fingerprint_file(os.path.join(dataset_path, rel_path), self.fingerprint_mode)}" for rel_path in inputs]
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+    def get_or_compute(self, name, dataset_path, inputs, compute):
+        """
+        Returns the cached arrays of a computation, computing and storing them on a miss.
+
+        Parameters:
+        - name (str): Name of the computation.
+        - dataset_path (str): Path to the dataset directory.
+        - inputs (list): Input files, relative to dataset_path.
+        - compute (callable): Function returning a dict of name -> np.array.
+
+        Returns:
+        - arrays (dict): name -> memory-mapped np.array.
+        """
+        key = self.key(name, dataset_path, inputs)
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.exists(os.path.join(entry_dir, "meta.json")):
+            os.utime(entry_dir)   # mark as recently used
+            return self._load(entry_dir)
+
+        arrays = compute()
+        self._store(entry_dir, name, dataset_path, arrays)
+        self._drop_superseded(key, name, dataset_path)
+        self._evict(keep=key)
+        return self._load(entry_dir)
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _load(self, entry_dir):
+        with open(os.path.join(entry_dir, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        return {array_name: np.load(os.path.join(entry_dir, f"{array_name}.npy"), mmap_mode='r') for array_name in meta['arrays']}
+
+    def _store(self, entry_dir, name, dataset_path, arrays):
+        # write into a private folder and rename it, so readers never see a partial entry
+        tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{array_name}.npy"), np.asarray(array))
+        meta = {'name': name, 'dataset_path': os.path.abspath(dataset_path), 'arrays': list(arrays), 'created': time.time()}
+        with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)   # another process stored it first
+
+    def _entries(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            if not os.path.exists(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(entry_dir), size, key, meta_path))
+        return entries
+
+    def _drop_superseded(self, key, name, dataset_path):
+        dataset_path = os.path.abspath(dataset_path)
+        for _, _, other_key, meta_path in self._entries():
+            if other_key == key:
+                continue
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta['name'] == name and meta['dataset_path'] == dataset_path:
+                shutil.rmtree(os.path.join(self.cache_dir, other_key), ignore_errors=True)
+
+    def _evict(self, keep=None):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, key, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total -= size
+
+
+def poses_to_array(poses):
+    """
+    Converts a list of (quaternion, translation) tuples into an Nx7 array (qx, qy, qz, qw, tx, ty, tz).
+    """
+    return np.array([list(map(float, q)) + list(map(float, t)) for q, t in poses], dtype=float).reshape(-1, 7)
+
+def array_to_poses(array):
+    """
+    Converts an Nx7 array back into a list of (quaternion, translation) tuples (views, no copy).
+    """
+    array = np.asarray(array)
+    return [(row[:4], row[4:7]) for row in array]
+
+def cached_process_timestamps(dataset_path, cache=None, profiler=None):
+    """
+    Cached version of process_timestamps, invalidated when associations.txt, flange_poses.txt or groundtruth.txt change.
+    The optional profiler is passed to process_timestamps on a miss and counts cache hits and misses.
+
+    Hits and misses return the same types: in-memory int64 timestamp arrays and lists of
+    (quaternion, translation) float64 arrays, never the raw cache files or the strings parsed by
+    process_timestamps.
+
+    Returns:
+        tuple: (ts_assoc, matched_ts_flange, matched_flange_poses, matched_ts_gt, matched_gt_poses).
+    """
+    cache = cache or AlignmentCache()
+    missed = []
+
+    def compute():
+        missed.append(True)
+        ts_assoc, matched_ts_flange, matched_flange_poses, matched_ts_gt, matched_gt_poses = process_timestamps(dataset_path, profiler)
+        return {
+            'ts_assoc': ts_assoc,
+            'matched_ts_flange': matched_ts_flange,
+            'matched_flange_poses': poses_to_array(matched_flange_poses),
+            'matched_ts_gt': matched_ts_gt,
+            'matched_gt_poses': poses_to_array(matched_gt_poses),
+        }
+
+    inputs = ["associations.txt", "robot_data/flange_poses.txt", "groundtruth.txt"]
+    arrays = cache.get_or_compute('process_timestamps', dataset_path, inputs, compute)
+    if profiler is not None:
+        profiler.count('cache_misses' if missed else 'cache_hits')
+    # copies of the small memory-mapped arrays, so the result does not depend on where it came from
+    timestamps = {name: np.array(arrays[name], dtype=np.int64) for name in ('ts_assoc', 'matched_ts_flange', 'matched_ts_gt')}
+    poses = {name: np.array(arrays[name], dtype=float) for name in ('matched_flange_poses', 'matched_gt_poses')}
+    return (timestamps['ts_assoc'], timestamps['matched_ts_flange'], array_to_poses(poses['matched_flange_poses']),
+            timestamps['matched_ts_gt'], array_to_poses(poses['matched_gt_poses']))
+
+def compute_camera_trajectories(dataset_path):
+    """
+    Computes the camera trajectory in the world frame from both the robot kinematics and the ground truth.
+
+    Returns:
+    - arrays (dict): 'ts_flange', 'orientations', 'positions' (kinematics) and 'ts_gt', 'orientations_gt',
+      'positions_gt' (ground truth).
+    """
+    ts_flange, poses_flange = load_poses(os.path.join(dataset_path, "robot_data/flange_poses.txt"))   # flange wrt base robot
+    ts_gt, poses_gt = load_poses(os.path.join(dataset_path, "groundtruth.txt"))                        # flange-markers wrt world
+    transforms = load_yaml_transformations(os.path.join(dataset_path, "extrinsics.yaml"))
+
+    T_world_base_marker = transforms[('base_marker_ring', 'world')]                     # base markers --> world
+    T_robot_base_base_marker = transforms[('base_marker_ring', 'robot_base')]           # base markers --> robot base
+    T_robot_flange_rgb = transforms[('rgb_sensor', 'robot_flange')]                     # camera  --> flange
+    T_rgb_flange_markers = compute_T_rgb_flange_markers(transforms)                     # flange markers --> camera
+
+    orientations, positions = compute_camera_world_positions(poses_flange, T_world_base_marker, T_robot_base_base_marker, T_robot_flange_rgb)
+    orientations_gt, positions_gt = compute_camera_world_positions_gt(poses_gt, T_rgb_flange_markers)
+    return {
+        'ts_flange': ts_flange, 'orientations': orientations, 'positions': positions,
+        'ts_gt': ts_gt, 'orientations_gt': orientations_gt, 'positions_gt': positions_gt,
+    }
+
+def cached_camera_trajectories(dataset_path, cache=None):
+    """
+    Cached version of compute_camera_trajectories, invalidated when flange_poses.txt, groundtruth.txt or extrinsics.yaml change.
+    """
+    cache = cache or AlignmentCache()
+    inputs = ["robot_data/flange_poses.txt", "groundtruth.txt", "extrinsics.yaml"]
+    return cache.get_or_compute('camera_trajectories', dataset_path, inputs, lambda: compute_camera_trajectories(dataset_path))
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_rosbag import write_synthetic_bag
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# ru_maxrss is in bytes on macOS and in KiB on Linux
+RSS_UNITS_PER_MB = 1024 * 1024 if sys.platform == 'darwin' else 1024
+
+
+def folder_size(path):
+    """
+    Returns the number of files and bytes under a folder.
+    """
+    files, size = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+def run_conversion(bag_path, output_dir, extra_args=()):
+    """
+    Runs rosbag2TUM.py on a bag in a child process.
+
+    Parameters:
+    - bag_path (str): Input bag folder.
+    - output_dir (str): Output folder (must not exist).
+    - extra_args (list): Additional rosbag2TUM.py arguments.
+
+    Returns:
+    - result (dict): Wall time, frame rates, peak RSS of the child, files and bytes written, and
+      the stage timings and topic rates reported by rosbag2TUM.
+    """
+    report_file = f"{output_dir}.report.json"
+    cmd = [sys.executable, os.path.join(SCRIPT_DIR, "rosbag2TUM.py"), "--input", os.path.abspath(bag_path),
+           "--output", os.path.abspath(output_dir), "--quiet", "--report", report_file, *extra_args]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=SCRIPT_DIR)
+    _, status, usage = os.wait4(proc.pid, 0)   # rusage of this child only
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"rosbag2TUM.py failed with exit code {proc.returncode}")
+
+    frames = len(os.listdir(os.path.join(output_dir, "rgb")))
+    files, size = folder_size(output_dir)
+    with open(report_file, 'r') as f:
+        report = json.load(f)
+    os.remove(report_file)
+    return {
+        'wall_time_s': wall,
+        'frames': frames,
+        'fps': frames / wall,
+        'conversion_fps': frames / report['wall_time_s'],   # without interpreter start-up and imports
+        'files_written': files,
+        'bytes_written': size,
+        'peak_rss_mb': usage.ru_maxrss / RSS_UNITS_PER_MB,
+        'stages': report['stages'],
+        'topics': report['topics'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rosbag2TUM.py on synthetic bags (offline)')
+    parser.add_argument('--bag', type=str, help='Use this bag instead of generating one')
+    parser.add_argument('--duration', type=float, default=10.0, help='Synthetic bag duration in seconds')
+    parser.add_argument('--camera-rate', type=float, default=30.0, help='RGBD rate (Hz)')
+    parser.add_argument('--joint-rate', type=float, default=25.0, help='Joint state rate (Hz)')
+    parser.add_argument('--imu-rate', type=float, default=210.0, help='IMU rate (Hz)')
+    parser.add_argument('--size', type=int, nargs=2, default=[848, 480], metavar=('W', 'H'), help='Image size')
+    parser.add_argument('--storage', type=str, choices=['sqlite3', 'mcap'], default='sqlite3', help='rosbag2 storage plugin')
+    parser.add_argument('--depth-format', type=str, choices=['png', 'zdepth'], default='png', help='Depth format written by rosbag2TUM.py')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of conversion runs')
+    parser.add_argument('--work-dir', type=str, help='Folder for the bag and outputs (default: a temporary folder)')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated bag and outputs')
+    parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='rosbag2TUM_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        bag_path = args.bag
+        if bag_path is None:
+            bag_path = os.path.join(work_dir, "bag")
+            shutil.rmtree(bag_path, ignore_errors=True)
+            start = time.perf_counter()
+            counts = write_synthetic_bag(bag_path, args.duration, args.camera_rate, args.joint_rate, args.imu_rate,
+                                         args.size[0], args.size[1], args.storage)
+            print(f"Synthetic bag: {counts} in {time.perf_counter() - start:.1f} s")
+
+        runs = []
+        for i in range(args.repeat):
+            output_dir = os.path.join(work_dir, f"out_{i}")
+            shutil.rmtree(output_dir, ignore_errors=True)
+            run = run_conversion(bag_path, output_dir, ['--depth-format', args.depth_format])
+            runs.append(run)
+            print(f"Run {i + 1}/{args.repeat}: {run['frames']} frames in {run['wall_time_s']:.2f} s "
+                  f"({run['fps']:.1f} fps, {run['conversion_fps']:.1f} fps converting), {run['bytes_written'] / 1e6:.1f} MB written, peak RSS {run['peak_rss_mb']:.0f} MB")
+            if not args.keep:
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+        best = min(runs, key=lambda run: run['wall_time_s'])
+        for name, stage in sorted(best['stages'].items(), key=lambda item: -item[1]['total_s']):
+            print(f"  {name:<12} {stage['total_s']:8.2f} s {100 * stage['share']:5.1f} %")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'bag': os.path.abspath(bag_path), 'runs': runs}, f, indent=2)
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 benchmark_rosbag2TUM.py --duration 20 --repeat 3 --output bench.json
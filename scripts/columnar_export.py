@@ -0,0 +1,177 @@
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from alignment_utils import load_stream, parse_timestamp_ns
+from sensor_stream import STREAM_FILES
+from sequence_dataset import read_associations
+
+COLUMNAR_FILE = "sequence.parquet"
+ROW_GROUP_SECONDS = 2.0   # time span of a row group, whatever the stream rate
+
+
+def read_header(txt_path):
+    """
+    Reads the column names of a stream file from its '#' header, without units (e.g. 'accel_x(m/s^2)' -> 'accel_x').
+    """
+    with open(txt_path, 'r') as f:
+        for line in f:
+            if line.startswith('#'):
+                return [re.sub(r'\(.*\)$', '', name) for name in line[1:].split()]
+            break
+    return None
+
+def stream_to_table(dataset_path, stream):
+    """
+    Converts one text stream of a sequence into an Arrow table.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - stream (str): Stream name (key of STREAM_FILES).
+
+    Returns:
+    - table (pa.Table): 'stream' and int64 nanosecond 'timestamp' columns followed by the stream
+      columns, prefixed with the stream name ('imu.accel_x', 'camera.rgb_file', ...).
+    """
+    txt_path = os.path.join(dataset_path, STREAM_FILES[stream])
+    if stream == 'camera':
+        ts, rgb_files, ts_depth, depth_files = read_associations(txt_path)
+        columns = {
+            'camera.rgb_file': pa.array(rgb_files, pa.string()),
+            'camera.depth_timestamp': pa.array(ts_depth, pa.int64()),
+            'camera.depth_file': pa.array(depth_files, pa.string()),
+        }
+    else:
+        ts, values = load_stream(txt_path)
+        header = read_header(txt_path)
+        names = header[1:] if header and len(header) == values.shape[1] + 1 else [f"c{i}" for i in range(values.shape[1])]
+        columns = {f"{stream}.{name}": pa.array(values[:, i], pa.float64()) for i, name in enumerate(names)}
+    base = {
+        'stream': pa.array([stream] * len(ts), pa.string()).dictionary_encode(),
+        'timestamp': pa.array(ts, pa.int64()),
+    }
+    return pa.table({**base, **columns})
+
+def export_sequence(dataset_path, output_file=None, streams=None, row_group_seconds=ROW_GROUP_SECONDS):
+    """
+    Writes all text streams of a sequence into a single Parquet file.
+
+    Every stream is written as its own run of row groups (a row group never mixes streams), with
+    the columns of the other streams null. Row groups are cut by time rather than by row count, so
+    each spans at most row_group_seconds of its stream at any rate (a fixed row count would span
+    minutes of camera frames but seconds of IMU samples). Row-group statistics on 'stream' and
+    'timestamp' let the loader skip everything outside a query.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - output_file (str): Output path (default: <dataset_path>/sequence.parquet).
+    - streams (list): Streams to export (default: every stream file present).
+    - row_group_seconds (float): Maximum time span of a row group (seconds).
+
+    Returns:
+    - output_file (str): Path of the written file.
+    """
+    output_file = output_file or os.path.join(dataset_path, COLUMNAR_FILE)
+    if streams is None:
+        streams = [s for s, rel_path in STREAM_FILES.items() if os.path.exists(os.path.join(dataset_path, rel_path))]
+    tables = [stream_to_table(dataset_path, s) for s in streams]
+
+    # unified schema: shared stream/timestamp columns plus every stream's own columns
+    fields = [pa.field('stream', pa.dictionary(pa.int32(), pa.string())), pa.field('timestamp', pa.int64())]
+    for table in tables:
+        fields += [table.schema.field(name) for name in table.column_names[2:]]
+    schema = pa.schema(fields)
+
+    with pq.ParquetWriter(output_file, schema, compression='zstd', write_statistics=True) as writer:
+        for table in tables:
+            columns = [table.column(f.name) if f.name in table.column_names else pa.nulls(len(table), f.type)
+                       for f in schema]
+            table = pa.Table.from_arrays(columns, schema=schema)
+            ts = table.column('timestamp').to_numpy()
+            if not len(ts):
+                continue
+            bucket = (ts - ts[0]) // int(row_group_seconds * 1e9)
+            bounds = np.concatenate([[0], np.flatnonzero(np.diff(bucket)) + 1, [len(ts)]])
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                writer.write_table(table.slice(lo, hi - lo), row_group_size=hi - lo)
+    return output_file
+
+
+def load_stream_columnar(parquet_file, stream, start=None, end=None, columns=None):
+    """
+    Reads one stream from a sequence Parquet file, pushing the time range and column projection down.
+
+    Only the row groups of the stream that overlap [start, end] are read, and only for the
+    requested columns.
+
+    Parameters:
+    - parquet_file (str): Path to the sequence Parquet file.
+    - stream (str): Stream name.
+    - start (int): Start timestamp in nanoseconds (inclusive).
+    - end (int): End timestamp in nanoseconds (inclusive).
+    - columns (list): Stream column names without prefix (default: all of the stream).
+
+    Returns:
+    - table (pa.Table): 'timestamp' and the requested columns, without the stream prefix.
+    """
+    pf = pq.ParquetFile(parquet_file)
+    schema = pf.schema_arrow
+    prefix = f"{stream}."
+    stream_columns = [name for name in schema.names if name.startswith(prefix)]
+    if columns is not None:
+        stream_columns = [prefix + name for name in columns]
+    ts_index = schema.get_field_index('timestamp')
+    stream_index = schema.get_field_index('stream')
+
+    row_groups = []
+    for i in range(pf.metadata.num_row_groups):
+        rg = pf.metadata.row_group(i)
+        stream_stats = rg.column(stream_index).statistics
+        ts_stats = rg.column(ts_index).statistics
+        if stream_stats is not None and stream_stats.has_min_max and not (stream_stats.min <= stream <= stream_stats.max):
+            continue
+        if ts_stats is not None and ts_stats.has_min_max:
+            if (start is not None and ts_stats.max < start) or (end is not None and ts_stats.min > end):
+                continue
+        row_groups.append(i)
+
+    table = pf.read_row_groups(row_groups, columns=['stream', 'timestamp'] + stream_columns)
+    ts = table.column('timestamp').to_numpy()
+    mask = np.asarray(table.column('stream').cast(pa.string()).to_numpy(zero_copy_only=False) == stream)
+    if start is not None:
+        mask &= ts >= start
+    if end is not None:
+        mask &= ts <= end
+    table = table.filter(pa.array(mask)).drop_columns(['stream'])
+    return table.rename_columns(['timestamp'] + [name[len(prefix):] for name in stream_columns])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the text streams of a sequence to a single Parquet file')
+    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
+    parser.add_argument('--output', type=str, help='Output file (default: <path>/sequence.parquet)')
+    parser.add_argument('--query', type=str, choices=list(STREAM_FILES), help='Read back this stream instead of exporting')
+    parser.add_argument('--start', type=parse_timestamp_ns, help='Query start timestamp (seconds)')
+    parser.add_argument('--end', type=parse_timestamp_ns, help='Query end timestamp (seconds)')
+    args = parser.parse_args()
+
+    output_file = args.output or os.path.join(args.path, COLUMNAR_FILE)
+    start = time.perf_counter()
+    if args.query:
+        table = load_stream_columnar(output_file, args.query, args.start, args.end)
+        print(table.to_pandas())
+    else:
+        export_sequence(args.path, output_file)
+        print(f"Sequence exported to {output_file} ({os.path.getsize(output_file) / 1e6:.1f} MB)")
+    print(f"Done in {time.perf_counter() - start:.2f} s")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 columnar_export.py --path data/4-natural-tr
+#           python3 columnar_export.py --path data/4-natural-tr --query imu --start 1728571430 --end 1728571440
@@ -0,0 +1,277 @@
+import argparse
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pyarrow as pa
+
+ZDEPTH_EXT = ".zdepth"
+ZDEPTH_MAGIC = b'ZDP1'
+# magic, width, height, compression level, payload size
+HEADER = struct.Struct('<4sIIbQ')
+DEFAULT_LEVEL = 3
+
+
+def predict_rows(depth):
+    """
+    Row-delta prediction of a stack of 16-bit depth maps.
+
+    The first row is predicted from its left neighbour and every other row from the row above;
+    residuals wrap modulo 2^16, so the transform is exactly invertible.
+
+    Parameters:
+    - depth (np.array): ...xHxW uint16 depth maps.
+
+    Returns:
+    - residuals (np.array): ...xHxW uint16 residuals.
+    """
+    residuals = np.empty_like(depth)
+    residuals[..., 1:, :] = depth[..., 1:, :] - depth[..., :-1, :]
+    residuals[..., 0, 1:] = depth[..., 0, 1:] - depth[..., 0, :-1]
+    residuals[..., 0, 0] = depth[..., 0, 0]
+    return residuals
+
+def unpredict_rows(residuals):
+    """
+    Inverse of predict_rows.
+    """
+    depth = residuals.copy()
+    np.cumsum(depth[..., 0, :], axis=-1, dtype=np.uint16, out=depth[..., 0, :])
+    np.cumsum(depth, axis=-2, dtype=np.uint16, out=depth)
+    return depth
+
+def shuffle_bytes(residuals):
+    # low bytes then high bytes: small residuals leave the high plane almost constant
+    planes = residuals.astype('<u2', copy=False).reshape(-1).view(np.uint8).reshape(-1, 2)
+    return np.ascontiguousarray(planes.T)
+
+def unshuffle_bytes(data, shape):
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(2, -1)
+    return np.ascontiguousarray(planes.T).view('<u2').reshape(shape).astype(np.uint16, copy=False)
+
+def encode_residuals(residuals, level=DEFAULT_LEVEL):
+    height, width = residuals.shape
+    payload = pa.Codec('zstd', compression_level=level).compress(shuffle_bytes(residuals), asbytes=True)
+    return HEADER.pack(ZDEPTH_MAGIC, width, height, level, len(payload)) + payload
+
+def encode_depth(depth, level=DEFAULT_LEVEL):
+    """
+    Encodes a 16-bit depth map losslessly.
+
+    Parameters:
+    - depth (np.array): HxW uint16 depth map.
+    - level (int): zstd compression level.
+
+    Returns:
+    - data (bytes): Encoded frame (header + zstd-compressed, byte-shuffled row residuals).
+    """
+    if depth.dtype != np.uint16 or depth.ndim != 2:
+        raise ValueError(f"Expected a HxW uint16 depth map, got {depth.dtype} {depth.shape}")
+    return encode_residuals(predict_rows(depth), level)
+
+def read_header(data):
+    """
+    Parses the header of an encoded frame.
+
+    Returns:
+    - header (tuple): (width, height, level, payload_size).
+    """
+    magic, width, height, level, payload_size = HEADER.unpack_from(data)
+    if magic != ZDEPTH_MAGIC:
+        raise ValueError("Not a zdepth frame")
+    return width, height, level, payload_size
+
+def decode_residuals(data):
+    width, height, _, payload_size = read_header(data)
+    raw = pa.Codec('zstd').decompress(memoryview(data)[HEADER.size:HEADER.size + payload_size],
+                                      decompressed_size=2 * width * height, asbytes=True)
+    return unshuffle_bytes(raw, (height, width))
+
+def decode_depth(data):
+    """
+    Decodes a frame written by encode_depth.
+
+    Returns:
+    - depth (np.array): HxW uint16 depth map.
+    """
+    return unpredict_rows(decode_residuals(data))
+
+def encode_batch(depths, level=DEFAULT_LEVEL, workers=8):
+    """
+    Encodes a stack of depth maps.
+
+    The prediction runs once over the whole stack; the frames are then compressed in a thread pool.
+
+    Parameters:
+    - depths (np.array): NxHxW uint16 depth maps.
+    - level (int): zstd compression level.
+    - workers (int): Number of threads.
+
+    Returns:
+    - frames (list): N encoded frames (bytes).
+    """
+    depths = np.asarray(depths)
+    if depths.dtype != np.uint16 or depths.ndim != 3:
+        raise ValueError(f"Expected NxHxW uint16 depth maps, got {depths.dtype} {depths.shape}")
+    residuals = predict_rows(depths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda r: encode_residuals(r, level), residuals))
+
+def decode_batch(frames, workers=8):
+    """
+    Decodes frames of the same size into a stack.
+
+    Returns:
+    - depths (np.array): NxHxW uint16 depth maps.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        residuals = np.stack(list(pool.map(decode_residuals, frames)))
+    return unpredict_rows(residuals)
+
+def read_depth(path):
+    """
+    Reads a depth map stored either as a 16-bit PNG or as a zdepth frame.
+    """
+    if path.endswith(ZDEPTH_EXT):
+        with open(path, 'rb') as f:
+            return decode_depth(f.read())
+    return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+def write_depth(path, depth, level=DEFAULT_LEVEL):
+    """
+    Writes a depth map as a zdepth frame or, for any other extension, with cv2.imwrite.
+    """
+    if not path.endswith(ZDEPTH_EXT):
+        return cv2.imwrite(path, depth)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(encode_depth(depth, level))
+    os.replace(tmp_path, path)
+    return True
+
+
+def read_depth_column(association_file):
+    """
+    Returns the lines of an associations file and the depth file of every data line (None for comments).
+    """
+    with open(association_file, 'r') as f:
+        lines = f.readlines()
+    depth_files = []
+    for line in lines:
+        values = line.split()
+        depth_files.append(values[3] if not line.startswith('#') and len(values) >= 4 else None)
+    return lines, depth_files
+
+def migrate_sequence(dataset_path, level=DEFAULT_LEVEL, workers=8, remove_png=False):
+    """
+    Converts the depth PNGs of a sequence to zdepth frames and points associations.txt at them.
+
+    Every frame is decoded again and compared with its PNG before associations.txt is rewritten;
+    the PNGs are only deleted (remove_png) once every zdepth frame of the sequence has been verified.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - level (int): zstd compression level.
+    - workers (int): Number of threads.
+    - remove_png (bool): Delete the PNGs after a successful migration.
+
+    Returns:
+    - stats (dict): Frames converted, PNG and zdepth bytes.
+    """
+    association_file = os.path.join(dataset_path, "associations.txt")
+    lines, depth_files = read_depth_column(association_file)
+    png_files = [f for f in depth_files if f is not None and f.endswith('.png')]
+
+    def convert(rel_path):
+        png_path = os.path.join(dataset_path, rel_path)
+        depth = cv2.imread(png_path, cv2.IMREAD_UNCHANGED)
+        if depth is None or depth.dtype != np.uint16:
+            raise ValueError(f"{rel_path} is not a 16-bit depth PNG")
+        data = encode_depth(depth, level)
+        if not np.array_equal(decode_depth(data), depth):
+            raise RuntimeError(f"Round trip failed for {rel_path}")
+        out_path = os.path.splitext(png_path)[0] + ZDEPTH_EXT
+        with open(out_path, 'wb') as f:
+            f.write(data)
+        return os.path.getsize(png_path), len(data)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        sizes = list(pool.map(convert, png_files))
+
+    # rewrite the depth column of associations.txt
+    tmp_file = f"{association_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        for line, depth_file in zip(lines, depth_files):
+            if depth_file is None or not depth_file.endswith('.png'):
+                f.write(line)
+                continue
+            values = line.split()
+            values[3] = os.path.splitext(depth_file)[0] + ZDEPTH_EXT
+            f.write(' '.join(values) + '\n')
+    os.replace(tmp_file, association_file)
+
+    if remove_png:
+        # also covers sequences migrated by an earlier run
+        bad_files = verify_sequence(dataset_path, workers)
+        if bad_files:
+            raise RuntimeError(f"{len(bad_files)} zdepth frames differ from their PNGs, e.g. {bad_files[:5]}")
+        _, depth_files = read_depth_column(association_file)
+        for rel_path in depth_files:
+            png_path = os.path.splitext(os.path.join(dataset_path, rel_path))[0] + '.png' if rel_path is not None else None
+            if png_path is not None and rel_path.endswith(ZDEPTH_EXT) and os.path.exists(png_path):
+                os.remove(png_path)
+    return {'frames': len(png_files), 'png_bytes': sum(s[0] for s in sizes), 'zdepth_bytes': sum(s[1] for s in sizes)}
+
+def verify_sequence(dataset_path, workers=8):
+    """
+    Checks that every zdepth frame of a sequence decodes to its PNG, where the PNG still exists.
+
+    Returns:
+    - bad_files (list): zdepth files that are unreadable or differ from their PNG.
+    """
+    _, depth_files = read_depth_column(os.path.join(dataset_path, "associations.txt"))
+    depth_files = [f for f in depth_files if f is not None]
+
+    def check(rel_path):
+        path = os.path.join(dataset_path, rel_path)
+        png_path = os.path.splitext(path)[0] + '.png'
+        if not rel_path.endswith(ZDEPTH_EXT) or not os.path.exists(png_path):
+            return None
+        try:
+            same = np.array_equal(read_depth(path), cv2.imread(png_path, cv2.IMREAD_UNCHANGED))
+        except (OSError, ValueError):
+            same = False
+        return None if same else rel_path
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [rel_path for rel_path in pool.map(check, depth_files) if rel_path is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate depth PNGs to the lossless zdepth codec')
+    parser.add_argument('--path', type=str, nargs='+', required=True, help='Sequence folder(s)')
+    parser.add_argument('--level', type=int, default=DEFAULT_LEVEL, help='zstd compression level')
+    parser.add_argument('--workers', type=int, default=8, help='Number of threads')
+    parser.add_argument('--remove-png', action='store_true', help='Delete the PNGs after a verified migration')
+    parser.add_argument('--verify', action='store_true', help='Only compare existing zdepth frames with their PNGs')
+    args = parser.parse_args()
+
+    for dataset_path in args.path:
+        start = time.perf_counter()
+        if args.verify:
+            bad_files = verify_sequence(dataset_path, args.workers)
+            print(f"{dataset_path}: {'OK' if not bad_files else f'{len(bad_files)} bad frames, e.g. {bad_files[:5]}'}")
+            continue
+        stats = migrate_sequence(dataset_path, args.level, args.workers, args.remove_png)
+        ratio = stats['png_bytes'] / stats['zdepth_bytes'] if stats['zdepth_bytes'] else 0
+        print(f"{dataset_path}: {stats['frames']} frames, {stats['png_bytes'] / 1e6:.1f} MB PNG -> "
+              f"{stats['zdepth_bytes'] / 1e6:.1f} MB zdepth ({ratio:.2f}x) in {time.perf_counter() - start:.1f} s")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 depth_codec.py --path data/4-natural-tr data/4-dark-tr --workers 16
@@ -1,9 +1,16 @@
 import argparse
+import fcntl
+import hashlib
+import json
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import zipfile
 
+MANIFEST_NAME = "manifest.json"
+HASH_CHUNK_SIZE = 1 << 20
+
 SEQUENCES = {
     "setup-1-natural-train": "https://zenodo.org/records/15000694/files/1-natural-tr.zip?download=1",
     "setup-1-natural-test": "https://zenodo.org/records/15000694/files/1-natural-tt.zip?download=1",
@@ -53,8 +60,20 @@ SEQUENCES = {
 
 
 def download_file(url, dest_path):
+    """
+    Downloads a file and hashes it on the fly.
+
+    Parameters:
+    - url (str): Source URL.
+    - dest_path (str): Path where the file is written.
+
+    Returns:
+    - digest (str): SHA-256 hex digest of the downloaded bytes.
+    """
     response = requests.get(url, stream=True)
+    response.raise_for_status()
     total = int(response.headers.get('content-length', 0))
+    sha = hashlib.sha256()
 
     with open(dest_path, 'wb') as file, tqdm(
         desc=dest_path,
@@ -63,34 +82,187 @@ def download_file(url, dest_path):
         unit_scale=True,
         unit_divisor=1024,
     ) as bar:
-        for data in response.iter_content(chunk_size=1024):
+        for data in response.iter_content(chunk_size=HASH_CHUNK_SIZE):
+            sha.update(data)
             size = file.write(data)
             bar.update(size)
+    return sha.hexdigest()
 
 def unzip_file(zip_path, extract_to):
+    """
+    Extracts an archive, hashing every member while it is written.
+
+    Parameters:
+    - zip_path (str): Path to the zip archive.
+    - extract_to (str): Destination directory.
+
+    Returns:
+    - files (dict): Relative path -> {"size": int, "sha256": str} for every extracted file.
+    """
+    files = {}
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_to)
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                zip_ref.extract(info, extract_to)
+                continue
+            target = os.path.normpath(os.path.join(extract_to, info.filename))
+            if os.path.commonpath([os.path.abspath(target), os.path.abspath(extract_to)]) != os.path.abspath(extract_to):
+                raise ValueError(f"Archive member escapes the destination folder: {info.filename}")
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            sha = hashlib.sha256()
+            with zip_ref.open(info) as src, open(target, 'wb') as dst:
+                for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b''):
+                    sha.update(chunk)
+                    dst.write(chunk)
+            rel_path = os.path.relpath(target, extract_to).replace(os.sep, '/')
+            files[rel_path] = {"size": info.file_size, "sha256": sha.hexdigest()}
+    return files
+
+# Function to hash a file already on disk
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def load_manifest(cache_dir):
+    """
+    Loads the cache manifest (sequence -> archive hash and extracted file list).
+
+    Parameters:
+    - cache_dir (str): Cache directory.
+
+    Returns:
+    - manifest (dict): Parsed manifest, empty if the cache has none yet.
+    """
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+def save_manifest(cache_dir, manifest):
+    # write-then-rename so concurrent readers never see a half-written manifest
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def update_manifest(cache_dir, sequence, entry):
+    """
+    Sets the entry of one sequence in the on-disk manifest, keeping the entries other processes wrote.
+
+    The manifest is re-read and merged under an exclusive lock, so concurrent downloads of
+    different sequences into the same cache do not drop each other's entries.
+
+    Returns:
+    - manifest (dict): The merged manifest.
+    """
+    with open(os.path.join(cache_dir, f"{MANIFEST_NAME}.lock"), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            manifest = load_manifest(cache_dir)
+            manifest[sequence] = entry
+            save_manifest(cache_dir, manifest)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return manifest
+
+def verify_sequence(cache_dir, entry, deep=False, workers=8):
+    """
+    Checks that the extracted tree of a cached sequence is complete and intact.
+
+    Parameters:
+    - cache_dir (str): Cache directory.
+    - entry (dict): Manifest entry of the sequence.
+    - deep (bool): Re-hash every file instead of only checking sizes.
+    - workers (int): Number of threads used for verification.
+
+    Returns:
+    - bad_files (list): Relative paths that are missing, truncated or corrupted.
+    """
+    def check(item):
+        rel_path, info = item
+        path = os.path.join(cache_dir, rel_path)
+        try:
+            if os.path.getsize(path) != info['size']:
+                return rel_path
+        except OSError:
+            return rel_path
+        if deep and hash_file(path) != info['sha256']:
+            return rel_path
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(check, entry['files'].items())
+        return [rel_path for rel_path in results if rel_path is not None]
+
+def fetch_sequence(sequence, cache_dir, manifest, force=False, deep=False, workers=8):
+    """
+    Downloads and extracts a sequence unless a valid copy is already cached.
+
+    Parameters:
+    - sequence (str): Sequence name (key of SEQUENCES).
+    - cache_dir (str): Cache directory.
+    - manifest (dict): Cache manifest, updated in place (merged with the entries on disk).
+    - force (bool): Download even if the cached copy is valid.
+    - deep (bool): Re-hash cached files instead of only checking sizes.
+    - workers (int): Number of threads used for verification.
+    """
+    url = SEQUENCES[sequence]
+    entry = manifest.get(sequence)
+    if entry is not None and entry.get('url') == url and not force:
+        bad_files = verify_sequence(cache_dir, entry, deep, workers)
+        if not bad_files:
+            print(f"Sequence {sequence} already cached (archive sha256 {entry['sha256'][:12]}), skipping.")
+            return
+        print(f"Cached copy of {sequence} is invalid ({len(bad_files)} bad files), downloading again.")
+
+    zip_path = os.path.join(cache_dir, f"{sequence}.zip.part")
+    print(f"Downloading sequence: {sequence}")
+    digest = download_file(url, zip_path)
+
+    print("Unzipping...")
+    files = unzip_file(zip_path, cache_dir)
+    os.remove(zip_path)
+
+    manifest.update(update_manifest(cache_dir, sequence, {"url": url, "sha256": digest, "files": files}))
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--sequence', type=str, required=True, help="Name of the sequence to download (e.g. 4-natural-test)")
+    parser.add_argument('--sequence', type=str, nargs='+', required=True, help="Name of the sequence(s) to download (e.g. setup-4-natural-test)")
+    parser.add_argument('--cache-dir', type=str, default=os.environ.get('SLAMRENDER_CACHE', 'data'), help="Shared cache directory (default: $SLAMRENDER_CACHE or ./data)")
+    parser.add_argument('--force', action='store_true', help="Download even if a valid copy is cached")
+    parser.add_argument('--verify', action='store_true', help="Only verify cached sequences, do not download")
+    parser.add_argument('--deep', action='store_true', help="Re-hash cached files instead of only checking sizes")
+    parser.add_argument('--workers', type=int, default=8, help="Threads used to verify extracted trees")
     args = parser.parse_args()
 
-    if args.sequence not in SEQUENCES:
-        print(f"Sequence '{args.sequence}' not found.")
+    unknown = [s for s in args.sequence if s not in SEQUENCES]
+    if unknown:
+        print(f"Sequence '{unknown[0]}' not found.")
         print("Available sequences:", ", ".join(SEQUENCES.keys()))
         return
 
-    url = SEQUENCES[args.sequence]
-    os.makedirs('data', exist_ok=True)
-    zip_path = os.path.join('data', f"{args.sequence}.zip")
+    os.makedirs(args.cache_dir, exist_ok=True)
+    manifest = load_manifest(args.cache_dir)
 
-    print(f"Downloading sequence: {args.sequence}")
-    download_file(url, zip_path)
+    if args.verify:
+        for sequence in args.sequence:
+            entry = manifest.get(sequence)
+            if entry is None:
+                print(f"{sequence}: not cached")
+                continue
+            bad_files = verify_sequence(args.cache_dir, entry, args.deep, args.workers)
+            print(f"{sequence}: {'OK' if not bad_files else f'{len(bad_files)} bad files'}")
+            for rel_path in bad_files:
+                print(f"  {rel_path}")
+        return
 
-    print("Unzipping...")
-    unzip_file(zip_path, "data")
-    os.remove(zip_path)
+    for sequence in args.sequence:
+        fetch_sequence(sequence, args.cache_dir, manifest, args.force, args.deep, args.workers)
     print("Done!")
 
 if __name__ == "__main__":
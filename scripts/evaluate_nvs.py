@@ -0,0 +1,308 @@
+import argparse
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from scipy.ndimage import gaussian_filter
+from alignment_utils import find_nearest_indices, format_timestamp_ns, parse_timestamp_ns, sec_to_ns
+from depth_codec import read_depth
+from pose_index import find_setup_sequences, lighting_of
+from rgb_video import read_rgb
+from sequence_dataset import read_associations
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg')
+DEPTH_EXTS = ('.npy', '.png', '.zdepth')
+METRICS = ['psnr', 'ssim', 'depth_mae', 'depth_rmse', 'depth_absrel']
+
+# SSIM constants (Wang et al. 2004) for images in [0, 1], 11x11 Gaussian window with sigma 1.5
+SSIM_C1, SSIM_C2 = 0.01 ** 2, 0.03 ** 2
+SSIM_SIGMA, SSIM_TRUNCATE = 1.5, 5 / 1.5
+
+
+def pair_renders(dataset_path, render_dir, match='auto', tolerance=0.005, frame_step=1):
+    """
+    Pairs rendered images with the frames of associations.txt.
+
+    Renders named by timestamp (<ts>.png) are matched to the nearest frame within the tolerance;
+    any other names are sorted and paired by index with every frame_step-th frame.
+    A render of depth (<render_dir>/depth/<name>.npy in metres, or .png/.zdepth in dataset depth
+    units) is used when present.
+
+    Parameters:
+    - dataset_path (str): Path to the test sequence.
+    - render_dir (str): Folder with the rendered images.
+    - match (str): 'timestamp', 'index' or 'auto' (timestamp if every name is a timestamp).
+    - tolerance (float): Maximum timestamp difference in seconds.
+    - frame_step (int): Frame stride of index pairing.
+
+    Returns:
+    - pairs (list of tuples): (timestamp, gt_rgb, gt_depth, render_rgb, render_depth or None), absolute paths.
+    """
+    ts_rgb, rgb_files, _, depth_files = read_associations(os.path.join(dataset_path, "associations.txt"))
+    names = sorted(name for name in os.listdir(render_dir) if name.lower().endswith(IMAGE_EXTS))
+    stems = [os.path.splitext(name)[0] for name in names]
+
+    def render_ts(stem):
+        try:
+            return parse_timestamp_ns(stem) if '.' in stem else None
+        except ValueError:
+            return None
+
+    if match == 'auto':
+        match = 'timestamp' if names and all(render_ts(stem) is not None for stem in stems) else 'index'
+    if match == 'timestamp':
+        ts = np.array([render_ts(stem) for stem in stems], dtype=np.int64)
+        rows = find_nearest_indices(ts_rgb, ts)
+        far = np.abs(ts_rgb[rows] - ts) > sec_to_ns(tolerance)
+        if far.any():
+            raise ValueError(f"{int(far.sum())} renders in {render_dir} have no frame within {tolerance} s, e.g. {names[int(np.flatnonzero(far)[0])]}")
+    else:
+        name_of = dict(zip(stems, names))
+        names = [name_of[stem] for stem in sorted(stems, key=lambda stem: (len(stem), stem))]   # 2.png before 10.png
+        rows = np.arange(len(names)) * frame_step
+        if len(rows) and rows[-1] >= len(ts_rgb):
+            raise ValueError(f"{len(names)} renders with step {frame_step} but only {len(ts_rgb)} frames in {dataset_path}")
+
+    def depth_render(stem):
+        for ext in DEPTH_EXTS:
+            path = os.path.join(render_dir, "depth", stem + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    return [(int(ts_rgb[row]), os.path.join(dataset_path, rgb_files[row]), os.path.join(dataset_path, depth_files[row]),
+             os.path.join(render_dir, name), depth_render(os.path.splitext(name)[0]))
+            for name, row in zip(names, rows)]
+
+
+def psnr_batch(pred, gt):
+    """
+    PSNR of a batch of images in [0, 1].
+
+    Parameters:
+    - pred (np.array): BxHxWxC rendered images.
+    - gt (np.array): BxHxWxC ground-truth images.
+
+    Returns:
+    - psnr (np.array): B values in dB.
+    """
+    mse = np.mean((pred - gt) ** 2, axis=(1, 2, 3))
+    return 10 * np.log10(1 / np.maximum(mse, 1e-12))
+
+def ssim_batch(pred, gt):
+    """
+    Mean SSIM of a batch of images in [0, 1] (Gaussian window, averaged over the color channels).
+
+    Returns:
+    - ssim (np.array): B values.
+    """
+    sigma = (0, SSIM_SIGMA, SSIM_SIGMA, 0)   # blur only the image axes
+
+    def blur(x):
+        return gaussian_filter(x, sigma, truncate=SSIM_TRUNCATE)
+
+    mu_x, mu_y = blur(pred), blur(gt)
+    var_x = blur(pred * pred) - mu_x ** 2
+    var_y = blur(gt * gt) - mu_y ** 2
+    cov = blur(pred * gt) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + SSIM_C1) * (2 * cov + SSIM_C2)) / ((mu_x ** 2 + mu_y ** 2 + SSIM_C1) * (var_x + var_y + SSIM_C2))
+    return ssim_map.mean(axis=(1, 2, 3))
+
+def depth_errors(pred, gt):
+    """
+    Depth errors over the pixels with valid (positive) ground truth and prediction.
+
+    Parameters:
+    - pred (np.array): HxW rendered depth in metres.
+    - gt (np.array): HxW ground-truth depth in metres.
+
+    Returns:
+    - errors (dict): depth_mae and depth_rmse (metres), depth_absrel.
+    """
+    valid = (gt > 0) & (pred > 0) & np.isfinite(pred)
+    if not valid.any():
+        return {'depth_mae': np.nan, 'depth_rmse': np.nan, 'depth_absrel': np.nan}
+    diff = pred[valid] - gt[valid]
+    return {'depth_mae': float(np.abs(diff).mean()), 'depth_rmse': float(np.sqrt((diff ** 2).mean())),
+            'depth_absrel': float((np.abs(diff) / gt[valid]).mean())}
+
+def load_render_depth(path, depth_scale):
+    if path.endswith('.npy'):
+        return np.load(path).astype(np.float32).squeeze()
+    return read_depth(path).astype(np.float32) * depth_scale
+
+def evaluate_batch(job):
+    """
+    Loads and scores one batch of pairs (runs in a worker process).
+
+    Parameters:
+    - job (tuple): (pairs, depth_scale), pairs as returned by pair_renders.
+
+    Returns:
+    - rows (list of dict): Timestamp and metrics of every pair.
+    """
+    pairs, depth_scale = job
+    preds, gts = [], []
+    for _, gt_rgb, _, render_rgb, _ in pairs:
+        pred = cv2.imread(render_rgb, cv2.IMREAD_COLOR)
+        gt = read_rgb(gt_rgb)
+        if pred is None or gt is None:
+            raise FileNotFoundError(f"Could not read {render_rgb} or {gt_rgb}")
+        if gt.shape != pred.shape:
+            # renders at a lower resolution are compared with the downsampled ground truth
+            gt = cv2.resize(gt, (pred.shape[1], pred.shape[0]), interpolation=cv2.INTER_AREA)
+        preds.append(pred)
+        gts.append(gt)
+
+    # images of a batch may differ in size only across sequences, which are never batched together
+    pred = np.stack(preds).astype(np.float32) / 255
+    gt = np.stack(gts).astype(np.float32) / 255
+    psnr, ssim = psnr_batch(pred, gt), ssim_batch(pred, gt)
+
+    rows = []
+    for i, (ts, _, gt_depth, _, render_depth) in enumerate(pairs):
+        row = {'timestamp': ts, 'psnr': float(psnr[i]), 'ssim': float(ssim[i])}
+        if render_depth is not None:
+            depth_pred = load_render_depth(render_depth, depth_scale)
+            depth_gt = read_depth(gt_depth).astype(np.float32) * depth_scale
+            if depth_gt.shape != depth_pred.shape:
+                depth_gt = cv2.resize(depth_gt, (depth_pred.shape[1], depth_pred.shape[0]), interpolation=cv2.INTER_NEAREST)
+            row.update(depth_errors(depth_pred, depth_gt))
+        rows.append(row)
+    return rows
+
+
+class RunningMean:
+    """
+    Streaming per-metric mean, ignoring missing (NaN) values.
+    """
+
+    def __init__(self):
+        self.sums = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def update(self, row):
+        for metric in METRICS:
+            value = row.get(metric, np.nan)
+            if not np.isnan(value):
+                self.sums[metric] += value
+                self.counts[metric] += 1
+
+    def summary(self):
+        summary = {'frames': max(self.counts.values(), default=0)}
+        summary.update({metric: self.sums[metric] / self.counts[metric] for metric in METRICS if self.counts[metric]})
+        return summary
+
+
+def evaluate(sequences, workers=None, batch_size=8, depth_scale=0.001, csv_path=None, **pair_args):
+    """
+    Scores the renders of several test sequences, streaming the per-frame results.
+
+    The pairs are cut into batches scored in a process pool; only the per-frame metrics come
+    back, and they are written to csv_path and folded into running means as they arrive, so
+    memory does not grow with the number of frames.
+
+    Parameters:
+    - sequences (list of tuples): (dataset_path, render_dir) of each sequence.
+    - workers (int): Worker processes (default: CPU count).
+    - batch_size (int): Frames per batch.
+    - depth_scale (float): Metres per depth unit.
+    - csv_path (str): Optional per-frame CSV output.
+    - pair_args: Passed to pair_renders (match, tolerance, frame_step).
+
+    Returns:
+    - report (dict): Mean metrics per sequence, per lighting condition and overall.
+    """
+    means = {'sequences': defaultdict(RunningMean), 'lighting': defaultdict(RunningMean), 'overall': RunningMean()}
+    jobs, names = [], []
+    for dataset_path, render_dir in sequences:
+        name = os.path.basename(os.path.normpath(dataset_path))
+        pairs = pair_renders(dataset_path, render_dir, **pair_args)
+        for start in range(0, len(pairs), batch_size):
+            jobs.append((pairs[start:start + batch_size], depth_scale))
+            names.append(name)
+
+    csv_file = open(csv_path, 'w', newline='') if csv_path else None
+    try:
+        writer = None
+        if csv_file is not None:
+            writer = csv.DictWriter(csv_file, ['sequence', 'lighting', 'timestamp'] + METRICS, restval='')
+            writer.writeheader()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for name, rows in zip(names, pool.map(evaluate_batch, jobs)):
+                for row in rows:
+                    for running in (means['sequences'][name], means['lighting'][lighting_of(name)], means['overall']):
+                        running.update(row)
+                    if writer is not None:
+                        writer.writerow({**row, 'sequence': name, 'lighting': lighting_of(name), 'timestamp': format_timestamp_ns(row['timestamp'])})
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+
+    return {
+        'sequences': {name: running.summary() for name, running in sorted(means['sequences'].items())},
+        'lighting': {lighting: running.summary() for lighting, running in sorted(means['lighting'].items())},
+        'overall': means['overall'].summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate novel view synthesis renders (PSNR/SSIM/depth) against the test sequences')
+    parser.add_argument('--path', type=str, nargs='+', help='Test sequence folder(s)')
+    parser.add_argument('--renders', type=str, nargs='+', help='Render folder of each --path')
+    parser.add_argument('--root', type=str, help='Folder containing the sequences (with --setup)')
+    parser.add_argument('--setup', type=str, help='Evaluate every test (-tt) sequence of this setup found in --root')
+    parser.add_argument('--renders-root', type=str, help='Folder with one render folder per sequence name (with --setup)')
+    parser.add_argument('--match', type=str, choices=['auto', 'timestamp', 'index'], default='auto', help='How renders are paired with frames')
+    parser.add_argument('--tolerance', type=float, default=0.005, help='Maximum timestamp difference (seconds)')
+    parser.add_argument('--frame-step', type=int, default=1, help='Frame stride of index pairing')
+    parser.add_argument('--depth-scale', type=float, default=0.001, help='Metres per depth unit')
+    parser.add_argument('--batch-size', type=int, default=8, help='Frames per batch')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--csv', type=str, help='Write the per-frame metrics to this CSV file')
+    parser.add_argument('--output', type=str, help='Write the report to this JSON file')
+    args = parser.parse_args()
+
+    if args.setup:
+        if not args.root or not args.renders_root:
+            parser.error("--setup needs --root and --renders-root")
+        names = [name for name in find_setup_sequences(args.root, args.setup)
+                 if name.endswith('-tt') and os.path.isdir(os.path.join(args.renders_root, name))]
+        sequences = [(os.path.join(args.root, name), os.path.join(args.renders_root, name)) for name in names]
+    elif args.path and args.renders and len(args.path) == len(args.renders):
+        sequences = list(zip(args.path, args.renders))
+    else:
+        parser.error("give --path and --renders of the same length, or --root/--setup/--renders-root")
+    if not sequences:
+        parser.error("no sequences with renders found")
+
+    start = time.perf_counter()
+    report = evaluate(sequences, args.workers, args.batch_size, args.depth_scale, args.csv,
+                      match=args.match, tolerance=args.tolerance, frame_step=args.frame_step)
+    elapsed = time.perf_counter() - start
+
+    def line(label, summary):
+        depth = f"  depth MAE {1000 * summary['depth_mae']:.1f} mm" if 'depth_mae' in summary else ''
+        return f"{label:<20} {summary['frames']:6d} frames  PSNR {summary.get('psnr', np.nan):6.2f} dB  SSIM {summary.get('ssim', np.nan):.4f}{depth}"
+
+    for name, summary in report['sequences'].items():
+        print(line(name, summary))
+    for lighting, summary in report['lighting'].items():
+        print(line(f"[{lighting}]", summary))
+    print(line("overall", report['overall']))
+    print(f"Evaluated in {elapsed:.1f} s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 evaluate_nvs.py --path data/4-natural-tt --renders output/4-natural/test/ours_30000/renders
+#           python3 evaluate_nvs.py --root data --setup 4 --renders-root renders --csv nvs_frames.csv --output nvs.json
@@ -4,49 +4,128 @@ import yaml
 from scipy.spatial.transform import Rotation as R
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from alignment_utils import *
+from alignment_cache import AlignmentCache, DEFAULT_CACHE_DIR, cached_camera_trajectories, compute_camera_trajectories
 
-def main():
-    # pointing to the dataset folder
-    parser = argparse.ArgumentParser(description='Compare poses (obtained by joint-robot vs gt)')
-    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
-    args = parser.parse_args()
-        
-    dataset_path = os.path.join(args.path)
-    # we retrieve the data from the files
-    _ , poses_flange = load_poses(os.path.join(dataset_path, "robot_data/flange_poses.txt")) # flange wrt base robot
-    _ , poses_gt = load_poses(os.path.join(dataset_path, "groundtruth.txt"))    # flange-markers wrt world
-    
-    # 
-    
-    transforms = load_yaml_transformations(os.path.join(dataset_path,  "extrinsics.yaml"))  # to obtain the transform matrixs
-
-    #----- retrieving all transformations (T_target_source) -------
-    T_world_base_marker = transforms[('base_marker_ring', 'world')]                     # base markers --> world
-    T_robot_base_base_marker = transforms[('base_marker_ring', 'robot_base')]           # base markers --> robot base
-    T_robot_flange_flange_marker = transforms[('flange_marker_ring', 'robot_flange')]   # flange markers --> flange 
-    T_robot_flange_rgb = transforms[('rgb_sensor', 'robot_flange')]                     # camera  --> flange
-    
-    # ---- calculation for useful transformations ---
-    T_flange_marker_robot_flange = np.linalg.inv(T_robot_flange_flange_marker)          # flange  --> flange markers
-    T_rgb_flange_markers = np.linalg.inv(T_robot_flange_rgb) @ np.linalg.inv(T_flange_marker_robot_flange)  # flange markers --> camera 
-    T_base_marker_robot_base =  np.linalg.inv(T_robot_base_base_marker)                      # robot base --> robot marker
-    T_world_robot_base = T_world_base_marker @ T_base_marker_robot_base                      # robot base --> world
-
-    # we convert the data into a same world reference frame
-    _ , camera_world_positions  = compute_camera_world_positions(poses_flange, T_world_base_marker, T_robot_base_base_marker, T_robot_flange_rgb)
-    _ , camera_world_positions_gt = compute_camera_world_positions_gt(poses_gt, T_rgb_flange_markers)
+def decimate_polyline(points, epsilon):
+    """
+    Simplifies a polyline with the Douglas-Peucker algorithm.
+
+    Every removed point lies within epsilon of the simplified polyline, so the plot error is bounded.
+
+    Parameters:
+    - points (np.array): NxD polyline vertices.
+    - epsilon (float): Maximum distance between the original and the simplified polyline.
+
+    Returns:
+    - indices (np.array): Sorted indices of the vertices kept.
+    """
+    n = len(points)
+    if n < 3 or epsilon <= 0:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last <= first + 1:
+            continue
+        a, b = points[first], points[last]
+        ab = b - a
+        inner = points[first + 1:last] - a
+        length2 = ab @ ab
+        # distance to the segment [a, b]
+        t = np.clip(inner @ ab / length2, 0.0, 1.0) if length2 > 0 else np.zeros(len(inner))
+        dist = np.linalg.norm(inner - t[:, None] * ab, axis=1)
+        i = int(np.argmax(dist))
+        if dist[i] > epsilon:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+def plot_trajectories(dataset_path, epsilon=0.001, save_path=None, use_cache=True, cache_dir=DEFAULT_CACHE_DIR, thumbnail=False):
+    """
+    Plots the camera trajectory obtained from the robot kinematics against the ground truth.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - epsilon (float): Douglas-Peucker tolerance in metres applied before plotting (0 plots every point).
+    - save_path (str): Render to this file (.png, .svg, ...) instead of opening a window.
+    - use_cache (bool): Use the alignment cache.
+    - cache_dir (str): Alignment cache folder.
+    - thumbnail (bool): Small figure without legend, for batch previews.
+    """
+    # we retrieve the data from the files and convert it into a same world reference frame
+    # (flange poses wrt base robot, gt flange-markers wrt world; see compute_camera_trajectories)
+    if use_cache:
+        trajectories = cached_camera_trajectories(dataset_path, AlignmentCache(cache_dir))
+    else:
+        trajectories = compute_camera_trajectories(dataset_path)
+    camera_world_positions = np.asarray(trajectories['positions'])
+    camera_world_positions_gt = np.asarray(trajectories['positions_gt'])
+
+    # level of detail: drop the points that do not change the plotted curve by more than epsilon
+    camera_world_positions = camera_world_positions[decimate_polyline(camera_world_positions, epsilon)]
+    camera_world_positions_gt = camera_world_positions_gt[decimate_polyline(camera_world_positions_gt, epsilon)]
 
     # plotting
-    fig = plt.figure()
+    fig = plt.figure(figsize=(3, 3) if thumbnail else None)
     ax = fig.add_subplot(111, projection='3d')
     ax.plot(camera_world_positions[:, 0], camera_world_positions[:, 1], camera_world_positions[:, 2], label="Camera (obtained by robot-joints)", linestyle='--')
     ax.plot(camera_world_positions_gt[:, 0], camera_world_positions_gt[:, 1], camera_world_positions_gt[:, 2], label="Groundtruth ", linestyle=':')
-    ax.legend()
-    plt.show()
+    if thumbnail:
+        ax.set_title(os.path.basename(os.path.normpath(dataset_path)), fontsize=8)
+        ax.tick_params(labelsize=5)
+    else:
+        ax.legend()
+    if save_path is None:
+        plt.show()
+    else:
+        fig.savefig(save_path, dpi=100 if thumbnail else 200, bbox_inches='tight')
+        plt.close(fig)
+
+def render_thumbnail(job):
+    dataset_path, save_path, epsilon, use_cache, cache_dir = job
+    plt.switch_backend('Agg')
+    plot_trajectories(dataset_path, epsilon, save_path, use_cache, cache_dir, thumbnail=True)
+    return save_path
+
+def main():
+    # pointing to the dataset folder
+    parser = argparse.ArgumentParser(description='Compare poses (obtained by joint-robot vs gt)')
+    parser.add_argument('--path', type=str, help='Folder containing dataset')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute instead of using the alignment cache')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, help='Alignment cache folder')
+    parser.add_argument('--epsilon', type=float, default=0.001, help='Plot simplification tolerance in metres (0 = plot every point)')
+    parser.add_argument('--save', type=str, help='Render to this file (.png/.svg) with a non-interactive backend')
+    parser.add_argument('--batch', type=str, help='Folder with many sequences: render one thumbnail per sequence')
+    parser.add_argument('--out-dir', type=str, default="thumbnails", help='Output folder for --batch')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Parallel renderers for --batch')
+    args = parser.parse_args()
+
+    if args.batch:
+        os.makedirs(args.out_dir, exist_ok=True)
+        jobs = [(os.path.join(args.batch, name), os.path.join(args.out_dir, f"{name}.png"), args.epsilon, not args.no_cache, args.cache_dir)
+                for name in sorted(os.listdir(args.batch))
+                if os.path.exists(os.path.join(args.batch, name, "extrinsics.yaml"))]
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for save_path in pool.map(render_thumbnail, jobs):
+                print(f"Saved {save_path}")
+        return
+
+    if args.path is None:
+        parser.error("--path is required unless --batch is given")
+    if args.save:
+        plt.switch_backend('Agg')
+    plot_trajectories(os.path.join(args.path), args.epsilon, args.save, not args.no_cache, args.cache_dir)
 
 if __name__ == '__main__':
     main()
 
 # example:
 #           python3 fFlange2world.py --path /Volumes/SSD/archivos/KUKA_dev/environment_modeling/ROSBAGS/1-dark-tr
+#           python3 fFlange2world.py --path data/1-dark-tr --save 1-dark-tr.svg
+#           python3 fFlange2world.py --batch data --out-dir thumbnails
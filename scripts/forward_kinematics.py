@@ -0,0 +1,142 @@
+import argparse
+import os
+
+import numpy as np
+import yaml
+from scipy.spatial.transform import Rotation as R
+from alignment_utils import *
+from sequence_dataset import read_associations
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "kuka_kinematics.yaml")
+
+
+def origin_to_homogeneous(xyz, rpy):
+    """
+    Converts a URDF origin (xyz, roll-pitch-yaw) into a 4x4 homogeneous transformation matrix.
+    """
+    T = np.eye(4)
+    T[:3, :3] = R.from_euler('xyz', rpy).as_matrix()
+    T[:3, 3] = xyz
+    return T
+
+def load_kinematics(config_path):
+    """
+    Loads the kinematic chain of the arm.
+
+    Parameters:
+    - config_path (str): Path to the kinematics YAML file.
+
+    Returns:
+    - chain (dict): 'names' (list), 'origins' (Jx4x4), 'axes' (Jx3 unit vectors) and 'flange' (4x4).
+    """
+    with open(config_path, 'r') as f:
+        data = yaml.safe_load(f)
+    joints = data['joints']
+    axes = np.array([j['axis'] for j in joints], dtype=float)
+    flange = data.get('flange', {'xyz': [0, 0, 0], 'rpy': [0, 0, 0]})
+    return {
+        'names': [j['name'] for j in joints],
+        'origins': np.stack([origin_to_homogeneous(j['xyz'], j['rpy']) for j in joints]),
+        'axes': axes / np.linalg.norm(axes, axis=1, keepdims=True),
+        'flange': origin_to_homogeneous(flange['xyz'], flange['rpy']),
+    }
+
+def axis_angle_to_matrices(axis, angles):
+    """
+    Rotation matrices about a fixed axis for a batch of angles (Rodrigues' formula).
+
+    Parameters:
+    - axis (np.array): Unit rotation axis (3,).
+    - angles (np.array): N angles in radians.
+
+    Returns:
+    - rot (np.array): Nx3x3 rotation matrices.
+    """
+    K = np.array([[0, -axis[2], axis[1]],
+                  [axis[2], 0, -axis[0]],
+                  [-axis[1], axis[0], 0]])
+    s = np.sin(angles)[:, None, None]
+    c = np.cos(angles)[:, None, None]
+    return np.eye(3) + s * K + (1 - c) * (K @ K)
+
+def forward_kinematics(chain, joint_positions):
+    """
+    Computes the flange pose for a batch of joint configurations.
+
+    Parameters:
+    - chain (dict): Kinematic chain as returned by load_kinematics.
+    - joint_positions (np.array): NxJ joint angles in radians.
+
+    Returns:
+    - T_base_flange (np.array): Nx4x4 flange poses with respect to the robot base.
+    """
+    joint_positions = np.atleast_2d(joint_positions)
+    n = len(joint_positions)
+    T = np.tile(np.eye(4), (n, 1, 1))
+    joint_T = np.tile(np.eye(4), (n, 1, 1))
+    for j in range(len(chain['names'])):
+        joint_T[:, :3, :3] = axis_angle_to_matrices(chain['axes'][j], joint_positions[:, j])
+        T = T @ chain['origins'][j] @ joint_T
+    return T @ chain['flange']
+
+def load_joint_positions(txt_path):
+    """
+    Loads joint positions as written by rosbag2TUM.py.
+
+    Parameters:
+    - txt_path (str): Path to joint_positions.txt.
+
+    Returns:
+    - timestamps (np.array): Array of N int64 timestamps in nanoseconds.
+    - joint_positions (np.array): NxJ joint angles.
+    """
+    return load_stream(txt_path)
+
+def resample_joint_positions(timestamps, joint_positions, target_timestamps):
+    """
+    Linearly interpolates joint angles at the target timestamps (clipped to the recorded range).
+    """
+    inside = (target_timestamps >= timestamps[0]) & (target_timestamps <= timestamps[-1])
+    target_timestamps = target_timestamps[inside]
+    # interpolate on offsets from the first sample, which floats represent exactly enough
+    x = ns_to_sec(target_timestamps - timestamps[0])
+    xp = ns_to_sec(timestamps - timestamps[0])
+    resampled = np.stack([np.interp(x, xp, joint_positions[:, j])
+                          for j in range(joint_positions.shape[1])], axis=1)
+    return target_timestamps, resampled
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute flange poses from joint positions (forward kinematics)')
+    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
+    parser.add_argument('--config', type=str, default=DEFAULT_CONFIG, help='Kinematics YAML file')
+    parser.add_argument('--joints', type=str, default="joint_data/joint_positions.txt", help='Joint positions file, relative to --path')
+    parser.add_argument('--output', type=str, default="robot_data/flange_poses_fk.txt", help='Output file, relative to --path')
+    parser.add_argument('--camera-rate', action='store_true', help='Resample the poses to the timestamps of associations.txt')
+    parser.add_argument('--overwrite', action='store_true', help='Allow replacing an existing output file (e.g. the recorded robot_data/flange_poses.txt)')
+    args = parser.parse_args()
+
+    dataset_path = os.path.join(args.path)
+    output_file = os.path.join(dataset_path, args.output)
+    if os.path.exists(output_file) and not args.overwrite:
+        parser.error(f"{output_file} already exists; pass --overwrite to replace it")
+    chain = load_kinematics(args.config)
+    timestamps, joint_positions = load_joint_positions(os.path.join(dataset_path, args.joints))
+
+    if args.camera_rate:
+        ts_assoc, _, _, _ = read_associations(os.path.join(dataset_path, "associations.txt"))
+        timestamps, joint_positions = resample_joint_positions(timestamps, joint_positions, ts_assoc)
+
+    T_base_flange = forward_kinematics(chain, joint_positions)
+    quats = R.from_matrix(T_base_flange[:, :3, :3]).as_quat()
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    save_poses(output_file, timestamps, quats, T_base_flange[:, :3, 3])
+    print(f"{len(timestamps)} flange poses written to {output_file}")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 forward_kinematics.py --path data/4-natural-tr
+#           python3 forward_kinematics.py --path data/4-natural-tr --camera-rate --output robot_data/flange_poses_rgb.txt
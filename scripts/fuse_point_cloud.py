@@ -0,0 +1,261 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from sequence_dataset import SequenceDataset
+
+KEY_BITS = 21                       # bits per voxel coordinate in the packed key
+KEY_OFFSET = 1 << (KEY_BITS - 1)    # coordinates are stored shifted to be non-negative
+KEY_MASK = (1 << KEY_BITS) - 1
+EMPTY_KEY = -1                      # packed keys are non-negative (63 bits)
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def compute_ray_directions(width, height, fx, fy, cx, cy, stride=1):
+    """
+    Precomputes the (unnormalised, z = 1) viewing ray of every pixel.
+
+    Parameters:
+    - width, height (int): Image size.
+    - fx, fy, cx, cy (float): Pinhole intrinsics.
+    - stride (int): Keep one pixel out of stride in each direction.
+
+    Returns:
+    - rays (np.array): (H/stride)x(W/stride)x3 ray directions in the camera frame.
+    """
+    u, v = np.meshgrid(np.arange(0, width, stride), np.arange(0, height, stride))
+    return np.stack([(u - cx) / fx, (v - cy) / fy, np.ones_like(u, dtype=float)], axis=-1)
+
+def backproject(depth, rays, depth_scale, stride=1, max_depth=None):
+    """
+    Back-projects a depth image into camera-frame points with cached ray directions.
+
+    Parameters:
+    - depth (np.array): HxW depth image.
+    - rays (np.array): Ray directions from compute_ray_directions.
+    - depth_scale (float): Metres per depth unit.
+    - stride (int): Pixel stride used to build the rays.
+    - max_depth (float): Discard points further than this (metres).
+
+    Returns:
+    - points (np.array): Px3 points in the camera frame.
+    - mask (np.array): Boolean mask of the pixels kept (on the strided grid).
+    """
+    z = depth[::stride, ::stride].astype(float) * depth_scale
+    mask = z > 0
+    if max_depth is not None:
+        mask &= z <= max_depth
+    return rays[mask] * z[mask][:, None], mask
+
+def pack_voxel_keys(voxels):
+    """
+    Packs Nx3 integer voxel coordinates into N int64 hash keys.
+    """
+    v = (voxels + KEY_OFFSET).astype(np.int64) & KEY_MASK
+    return (v[:, 0] << (2 * KEY_BITS)) | (v[:, 1] << KEY_BITS) | v[:, 2]
+
+
+class VoxelGrid:
+    """
+    Sparse voxel-hashed accumulator of coloured points.
+
+    Each occupied voxel keeps the running sum of its point positions and colours and a point count,
+    so memory grows with the observed scene volume rather than with the number of fused frames.
+    Voxels live in append-only arrays and an open-addressing hash table (linear probing, at most
+    half full) maps their keys to rows, so merging a frame costs O(points) however large the grid
+    is; the table and arrays double when they fill up.
+    """
+
+    def __init__(self, voxel_size, capacity=1 << 16):
+        self.voxel_size = voxel_size
+        self.size = 0
+        self._table_keys = np.full(capacity, EMPTY_KEY, dtype=np.int64)
+        self._table_rows = np.zeros(capacity, dtype=np.int64)
+        self._keys = np.zeros(capacity // 2, dtype=np.int64)
+        self._position_sums = np.zeros((capacity // 2, 3))
+        self._color_sums = np.zeros((capacity // 2, 3))
+        self._counts = np.zeros(capacity // 2, dtype=np.int64)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def keys(self):
+        return self._keys[:self.size]
+
+    @property
+    def position_sums(self):
+        return self._position_sums[:self.size]
+
+    @property
+    def color_sums(self):
+        return self._color_sums[:self.size]
+
+    @property
+    def counts(self):
+        return self._counts[:self.size]
+
+    def _home_slots(self, keys):
+        # multiplicative (Fibonacci) hashing on the top bits
+        bits = len(self._table_keys).bit_length() - 1
+        return ((keys.astype(np.uint64) * HASH_MULTIPLIER) >> np.uint64(64 - bits)).astype(np.int64)
+
+    def _lookup(self, keys):
+        # row of every key, -1 if absent (probes all keys in parallel, one step per round)
+        mask = len(self._table_keys) - 1
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        slots = self._home_slots(keys)
+        active = np.arange(len(keys))
+        while len(active):
+            table_keys = self._table_keys[slots[active]]
+            hit = table_keys == keys[active]
+            rows[active[hit]] = self._table_rows[slots[active[hit]]]
+            active = active[~hit & (table_keys != EMPTY_KEY)]
+            slots[active] = (slots[active] + 1) & mask
+        return rows
+
+    def _insert(self, keys, rows):
+        # keys are distinct and absent from the table
+        mask = len(self._table_keys) - 1
+        slots = self._home_slots(keys)
+        active = np.arange(len(keys))
+        while len(active):
+            free = self._table_keys[slots[active]] == EMPTY_KEY
+            # several keys may probe the same free slot: the first one takes it, the others move on
+            _, first = np.unique(slots[active[free]], return_index=True)
+            winners = active[free][first]
+            self._table_keys[slots[winners]] = keys[winners]
+            self._table_rows[slots[winners]] = rows[winners]
+            active = np.setdiff1d(active, winners, assume_unique=True)
+            slots[active] = (slots[active] + 1) & mask
+
+    def _reserve(self, n):
+        if n > len(self._keys):
+            capacity = max(n, 2 * len(self._keys))
+            for name in ('_keys', '_position_sums', '_color_sums', '_counts'):
+                old = getattr(self, name)
+                grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:self.size] = old[:self.size]
+                setattr(self, name, grown)
+        if 2 * n > len(self._table_keys):
+            table_size = len(self._table_keys)
+            while 2 * n > table_size:
+                table_size *= 2
+            self._table_keys = np.full(table_size, EMPTY_KEY, dtype=np.int64)
+            self._table_rows = np.zeros(table_size, dtype=np.int64)
+            self._insert(self.keys, np.arange(self.size))
+
+    def integrate(self, points, colors):
+        """
+        Accumulates world-frame points and their colours.
+
+        Parameters:
+        - points (np.array): Px3 points.
+        - colors (np.array): Px3 colours (RGB, 0-255).
+        """
+        if len(points) == 0:
+            return
+        keys = pack_voxel_keys(np.floor(points / self.voxel_size))
+        frame_keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(frame_keys))
+        pos_sums = np.stack([np.bincount(inverse, points[:, i], len(frame_keys)) for i in range(3)], axis=1)
+        col_sums = np.stack([np.bincount(inverse, colors[:, i], len(frame_keys)) for i in range(3)], axis=1)
+
+        rows = self._lookup(frame_keys)
+        new = rows < 0
+        if np.any(new):
+            n_new = int(new.sum())
+            self._reserve(self.size + n_new)
+            rows[new] = np.arange(self.size, self.size + n_new)
+            self._keys[rows[new]] = frame_keys[new]
+            self._insert(frame_keys[new], rows[new])
+            self.size += n_new
+
+        # rows are distinct within a frame, so plain fancy-index accumulation is safe
+        self._position_sums[rows] += pos_sums
+        self._color_sums[rows] += col_sums
+        self._counts[rows] += counts
+
+    def extract(self, min_count=1):
+        """
+        Returns the averaged point and colour of every voxel observed at least min_count times.
+        """
+        keep = self.counts >= min_count
+        n = self.counts[keep][:, None]
+        return self.position_sums[keep] / n, self.color_sums[keep] / n
+
+
+def save_ply(ply_path, points, colors):
+    """
+    Saves a coloured point cloud as a binary PLY file.
+
+    Parameters:
+    - ply_path (str): Output path.
+    - points (np.array): Nx3 positions.
+    - colors (np.array): Nx3 colours (RGB, 0-255).
+    """
+    vertex = np.empty(len(points), dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+                                          ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+    vertex['x'], vertex['y'], vertex['z'] = points.T
+    rgb = np.clip(np.round(colors), 0, 255).astype(np.uint8)
+    vertex['red'], vertex['green'], vertex['blue'] = rgb.T
+    header = ("ply\n"
+              "format binary_little_endian 1.0\n"
+              f"element vertex {len(points)}\n"
+              "property float x\nproperty float y\nproperty float z\n"
+              "property uchar red\nproperty uchar green\nproperty uchar blue\n"
+              "end_header\n")
+    with open(ply_path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        f.write(vertex.tobytes())
+
+def fuse_sequence(dataset_path, fx, fy, cx, cy, voxel_size=0.01, depth_scale=0.001, stride=2, max_depth=3.0, frame_step=1):
+    """
+    Fuses the depth images of a sequence into a voxel grid using the ground-truth camera poses.
+
+    Returns:
+    - grid (VoxelGrid): Fused grid.
+    """
+    grid = VoxelGrid(voxel_size)
+    rays = None
+    with SequenceDataset(dataset_path) as dataset:
+        for _, rgb, depth, T_world_cam in dataset.iterate(range(0, len(dataset), frame_step)):
+            if rays is None:
+                rays = compute_ray_directions(depth.shape[1], depth.shape[0], fx, fy, cx, cy, stride)
+            points, mask = backproject(depth, rays, depth_scale, stride, max_depth)
+            colors = rgb[::stride, ::stride][mask][:, ::-1].astype(float)   # BGR -> RGB
+            points_world = points @ T_world_cam[:3, :3].T + T_world_cam[:3, 3]
+            grid.integrate(points_world, colors)
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuse the depth images of a sequence into a point cloud (PLY)')
+    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
+    parser.add_argument('--fx', type=float, required=True, help='Depth camera focal length x (pixels)')
+    parser.add_argument('--fy', type=float, required=True, help='Depth camera focal length y (pixels)')
+    parser.add_argument('--cx', type=float, required=True, help='Depth camera principal point x (pixels)')
+    parser.add_argument('--cy', type=float, required=True, help='Depth camera principal point y (pixels)')
+    parser.add_argument('--depth-scale', type=float, default=0.001, help='Metres per depth unit')
+    parser.add_argument('--voxel-size', type=float, default=0.01, help='Voxel size (m)')
+    parser.add_argument('--stride', type=int, default=2, help='Pixel stride')
+    parser.add_argument('--max-depth', type=float, default=3.0, help='Maximum depth (m)')
+    parser.add_argument('--frame-step', type=int, default=1, help='Fuse one frame every frame-step')
+    parser.add_argument('--min-count', type=int, default=1, help='Minimum number of points per voxel')
+    parser.add_argument('--output', type=str, default="points3d.ply", help='Output PLY, relative to --path')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    grid = fuse_sequence(args.path, args.fx, args.fy, args.cx, args.cy, args.voxel_size,
+                         args.depth_scale, args.stride, args.max_depth, args.frame_step)
+    points, colors = grid.extract(args.min_count)
+    output_file = os.path.join(args.path, args.output)
+    save_ply(output_file, points, colors)
+    print(f"{len(points)} points written to {output_file} in {time.perf_counter() - start:.2f} s")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 fuse_point_cloud.py --path data/4-natural-tr --fx 425.0 --fy 425.0 --cx 424.0 --cy 240.0
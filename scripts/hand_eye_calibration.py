@@ -0,0 +1,332 @@
+import argparse
+import os
+
+import numpy as np
+import yaml
+from scipy.optimize import least_squares
+from scipy.spatial.transform import Rotation as R
+from alignment_utils import *
+from alignment_cache import AlignmentCache, DEFAULT_CACHE_DIR, cached_process_timestamps
+from pose_index import find_setup_sequences
+
+
+def load_pose_pairs(dataset_path, max_dt=0.01, cache=None):
+    """
+    Loads the matched flange / ground-truth pose pairs of a sequence.
+
+    The pairs come from process_timestamps (both streams matched to the camera frames); pairs whose
+    flange and ground-truth timestamps are more than max_dt apart are dropped, and pairs repeated
+    by several frames are kept once.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - max_dt (float): Maximum flange / ground-truth time difference in seconds.
+    - cache (AlignmentCache): Optional alignment cache.
+
+    Returns:
+    - F (np.array): Nx4x4 flange poses in the robot base frame.
+    - G (np.array): Nx4x4 flange-marker poses in the world frame.
+    """
+    if cache is None:
+        _, ts_flange, flange_poses, ts_gt, gt_poses = process_timestamps(dataset_path)
+    else:
+        _, ts_flange, flange_poses, ts_gt, gt_poses = cached_process_timestamps(dataset_path, cache)
+    ts_flange, ts_gt = np.asarray(ts_flange), np.asarray(ts_gt)
+    keep = np.abs(ts_flange - ts_gt) <= sec_to_ns(max_dt)
+    _, first = np.unique(np.stack([ts_flange, ts_gt], axis=1)[keep], axis=0, return_index=True)
+    rows = np.flatnonzero(keep)[np.sort(first)]
+    F = poses_to_homogeneous([flange_poses[i] for i in rows])
+    G = poses_to_homogeneous([gt_poses[i] for i in rows])
+    return F, G
+
+def project_to_so3(M):
+    """
+    Closest rotation matrix (Frobenius norm) to a 3x3 matrix.
+    """
+    U, _, Vt = np.linalg.svd(M)
+    return U @ np.diag([1.0, 1.0, np.linalg.det(U @ Vt)]) @ Vt
+
+def make_transform(rotation, translation):
+    T = np.eye(4)
+    T[:3, :3] = rotation
+    T[:3, 3] = translation
+    return T
+
+def closed_form_axzb(A, B):
+    """
+    Closed-form batched solution of A_i X = Z B_i.
+
+    Rotations: the Kronecker system (R_A ⊗ I) vec(R_X) = (I ⊗ R_B^T) vec(R_Z) is solved through the
+    top singular vectors of the 9x9 matrix sum_i R_A^T ⊗ R_B^T, so memory does not grow with N.
+    Translations: linear least squares R_A t_X - t_Z = R_Z t_B - t_A through 6x6 normal equations.
+
+    Parameters:
+    - A (np.array): Nx4x4 transformations.
+    - B (np.array): Nx4x4 transformations.
+
+    Returns:
+    - X (np.array): 4x4 transformation.
+    - Z (np.array): 4x4 transformation.
+    """
+    RA, tA = A[:, :3, :3], A[:, :3, 3]
+    RB, tB = B[:, :3, :3], B[:, :3, 3]
+    K = np.einsum('nji,nlk->ikjl', RA, RB).reshape(9, 9)
+    U, _, Vt = np.linalg.svd(K)
+    RX, RZ = U[:, 0].reshape(3, 3), Vt[0].reshape(3, 3)
+    if np.linalg.det(RX) < 0:
+        RX, RZ = -RX, -RZ
+    RX, RZ = project_to_so3(RX), project_to_so3(RZ)
+
+    n = len(A)
+    d = np.einsum('ij,nj->ni', RZ, tB) - tA
+    sum_RA = RA.sum(axis=0)
+    lhs = np.block([[n * np.eye(3), -sum_RA.T], [-sum_RA, n * np.eye(3)]])
+    rhs = np.concatenate([np.einsum('nji,nj->i', RA, d), -d.sum(axis=0)])
+    t = np.linalg.solve(lhs, rhs)
+    return make_transform(RX, t[:3]), make_transform(RZ, t[3:])
+
+def closed_form_axxb(A, B):
+    """
+    Closed-form batched solution of A_i X = X B_i (Park & Martin).
+
+    Parameters:
+    - A (np.array): Nx4x4 relative motions.
+    - B (np.array): Nx4x4 relative motions.
+
+    Returns:
+    - X (np.array): 4x4 transformation.
+    """
+    alpha = R.from_matrix(A[:, :3, :3]).as_rotvec()
+    beta = R.from_matrix(B[:, :3, :3]).as_rotvec()
+    RX = project_to_so3(alpha.T @ beta)      # alpha_i = R_X beta_i
+
+    # (R_A - I) t_X = R_X t_B - t_A
+    C = A[:, :3, :3] - np.eye(3)
+    d = np.einsum('ij,nj->ni', RX, B[:, :3, 3]) - A[:, :3, 3]
+    t = np.linalg.lstsq(np.einsum('nji,njk->ik', C, C), np.einsum('nji,nj->i', C, d), rcond=None)[0]
+    return make_transform(RX, t)
+
+def relative_motions(F, G, stride=10):
+    """
+    Relative motions (F_i^-1 F_j, G_i^-1 G_j) for j = i + stride, the A and B of A X = X B.
+    """
+    i = np.arange(len(F) - stride)
+    A = np.linalg.inv(F[i]) @ F[i + stride]
+    B = np.linalg.inv(G[i]) @ G[i + stride]
+    return A, B
+
+def average_transform(T):
+    """
+    Chordal mean of a stack of transformations.
+    """
+    return make_transform(project_to_so3(T[:, :3, :3].sum(axis=0)), T[:, :3, 3].mean(axis=0))
+
+def rotation_log(Rm):
+    """
+    Batched rotation vectors of Nx3x3 rotation matrices.
+
+    Uses the closed-form logarithm, falling back to scipy only for angles close to pi where it is
+    ill-conditioned.
+    """
+    v = 0.5 * np.stack([Rm[:, 2, 1] - Rm[:, 1, 2], Rm[:, 0, 2] - Rm[:, 2, 0], Rm[:, 1, 0] - Rm[:, 0, 1]], axis=1)
+    theta = np.arccos(np.clip((np.trace(Rm, axis1=1, axis2=2) - 1) / 2, -1, 1))
+    sin = np.sin(theta)
+    small = sin < 1e-8
+    rotvec = v * np.where(small, 1.0, theta / np.where(small, 1.0, sin))[:, None]
+    near_pi = theta > np.pi - 1e-3
+    if near_pi.any():
+        rotvec[near_pi] = R.from_matrix(Rm[near_pi]).as_rotvec()
+    return rotvec
+
+class PosePairs:
+    """
+    Flange / ground-truth pose pairs, stored as the rotation and translation arrays used by the residuals.
+    """
+
+    def __init__(self, F, G):
+        self.RF = np.ascontiguousarray(F[:, :3, :3])
+        self.tF = np.ascontiguousarray(F[:, :3, 3])
+        self.RG_T = np.ascontiguousarray(np.swapaxes(G[:, :3, :3], 1, 2))
+        self.tG = np.ascontiguousarray(G[:, :3, 3])
+
+    def __len__(self):
+        return len(self.RF)
+
+    def residual_poses(self, X, Z):
+        """
+        Rotations (Nx3x3) and translations (Nx3) of the residual transformations G_i^-1 Z F_i X.
+        """
+        RE = self.RG_T @ (Z[:3, :3] @ self.RF @ X[:3, :3])
+        t_world = (self.RF @ X[:3, 3] + self.tF) @ Z[:3, :3].T + Z[:3, 3]
+        return RE, np.einsum('nij,nj->ni', self.RG_T, t_world - self.tG)
+
+    def errors(self, X, Z):
+        """
+        Per-pair error G_i^-1 Z F_i X of the model G_i = Z F_i X.
+
+        Returns:
+        - t_err (np.array): Nx3 translation errors (m), in the flange-marker frame.
+        - r_err (np.array): Nx3 rotation errors (rotation vectors, rad).
+        """
+        RE, t_err = self.residual_poses(X, Z)
+        return t_err, rotation_log(RE)
+
+def skew(v):
+    """
+    Batched cross-product matrices of Nx3 vectors.
+    """
+    S = np.zeros(v.shape[:-1] + (3, 3))
+    S[..., 0, 1], S[..., 0, 2], S[..., 1, 2] = -v[..., 2], v[..., 1], -v[..., 0]
+    S[..., 1, 0], S[..., 2, 0], S[..., 2, 1] = v[..., 2], -v[..., 1], v[..., 0]
+    return S
+
+def pose_errors(F, G, X, Z):
+    """
+    Per-pair error of the model G_i = Z F_i X (see PosePairs.errors).
+    """
+    return PosePairs(F, G).errors(X, Z)
+
+def refine(F, G, X0, Z0, sigma_t=0.002, sigma_r=np.deg2rad(0.5), loss='huber', f_scale=3.0):
+    """
+    Robust least-squares refinement of X and Z in G_i = Z F_i X over all pairs.
+
+    X and Z are updated by right / left multiplicative perturbations; residuals are the translation
+    and rotation errors of every pair normalised by sigma_t and sigma_r. Residuals and the analytic
+    Jacobian (small-residual approximation of the rotation logarithm) are evaluated in batched passes.
+
+    Parameters:
+    - F (np.array): Nx4x4 flange poses in the robot base frame.
+    - G (np.array): Nx4x4 flange-marker poses in the world frame.
+    - X0 (np.array): Initial flange markers --> flange transformation.
+    - Z0 (np.array): Initial robot base --> world transformation.
+    - sigma_t (float): Translation noise (m).
+    - sigma_r (float): Rotation noise (rad).
+    - loss (str): scipy.optimize.least_squares robust loss.
+    - f_scale (float): Inlier threshold, in sigmas.
+
+    Returns:
+    - X (np.array): Refined 4x4 transformation.
+    - Z (np.array): Refined 4x4 transformation.
+    - result (OptimizeResult): Solver result.
+    """
+    def update(params):
+        dX = make_transform(R.from_rotvec(params[0:3]).as_matrix(), params[3:6])
+        dZ = make_transform(R.from_rotvec(params[6:9]).as_matrix(), params[9:12])
+        return X0 @ dX, dZ @ Z0
+
+    pairs = PosePairs(F, G)
+
+    def residuals(params):
+        X, Z = update(params)
+        t_err, r_err = pairs.errors(X, Z)
+        return np.concatenate([t_err / sigma_t, r_err / sigma_r], axis=1).ravel()
+
+    def jacobian(params):
+        X, Z = update(params)
+        RE, tE = pairs.residual_poses(X, Z)
+        R_dX = R.from_rotvec(params[0:3]).as_matrix()
+        J = np.zeros((len(pairs), 6, 12))
+        # X: t_E changes by R_E R_dX^T d_rho, r_E by d_phi
+        J[:, 0:3, 3:6] = RE @ R_dX.T / sigma_t
+        J[:, 3:6, 0:3] = np.eye(3) / sigma_r
+        # Z: the perturbation seen from the marker frame is rotated by R_G^T
+        RG_T = pairs.RG_T
+        lever = tE + np.einsum('nij,nj->ni', RG_T, pairs.tG)
+        J[:, 0:3, 6:9] = (RG_T @ skew(params[9:12]) - skew(lever) @ RG_T) / sigma_t
+        J[:, 0:3, 9:12] = RG_T / sigma_t
+        J[:, 3:6, 6:9] = RG_T / sigma_r
+        return J.reshape(-1, 12)
+
+    result = least_squares(residuals, np.zeros(12), jac=jacobian, loss=loss, f_scale=f_scale, tr_solver='lsmr')
+    X, Z = update(result.x)
+    return X, Z, result
+
+def error_stats(F, G, X, Z):
+    t_err, r_err = pose_errors(F, G, X, Z)
+    t_norm = np.linalg.norm(t_err, axis=1) * 1e3
+    r_norm = np.rad2deg(np.linalg.norm(r_err, axis=1))
+    return {'pairs': len(F), 't_rms_mm': float(np.sqrt(np.mean(t_norm ** 2))), 't_median_mm': float(np.median(t_norm)),
+            'r_rms_deg': float(np.sqrt(np.mean(r_norm ** 2))), 'r_median_deg': float(np.median(r_norm))}
+
+def save_yaml_transformations(yaml_path, data, updates):
+    """
+    Writes an extrinsics file with some of its transformations replaced.
+
+    Parameters:
+    - yaml_path (str): Output path.
+    - data (dict): Extrinsics as loaded with yaml.safe_load.
+    - updates (dict): (source_frame, target_frame) -> 4x4 matrix.
+    """
+    for entry in data['T']:
+        key = (entry['source_frame'], entry['target_frame'])
+        if key in updates:
+            entry['matrix']['data'] = np.asarray(updates[key], dtype=float).ravel().tolist()
+    with open(yaml_path, 'w') as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refine the flange-marker and base-marker extrinsics from flange vs. mocap poses')
+    parser.add_argument('--path', type=str, nargs='+', help='Sequence folder(s) sharing the same extrinsics')
+    parser.add_argument('--root', type=str, help='Folder containing the sequences (with --setup)')
+    parser.add_argument('--setup', type=str, help='Use every sequence of this setup found in --root')
+    parser.add_argument('--method', type=str, choices=['axzb', 'axxb'], default='axzb', help='Closed-form initialization')
+    parser.add_argument('--stride', type=int, default=10, help='Pose pair stride of the relative motions (axxb)')
+    parser.add_argument('--max-dt', type=float, default=0.01, help='Maximum flange / ground-truth time difference (s)')
+    parser.add_argument('--sigma-t', type=float, default=0.002, help='Translation noise (m)')
+    parser.add_argument('--sigma-r', type=float, default=0.5, help='Rotation noise (deg)')
+    parser.add_argument('--f-scale', type=float, default=3.0, help='Robust loss inlier threshold (sigmas)')
+    parser.add_argument('--output', type=str, help='Updated extrinsics file (default: <first sequence>/extrinsics_calibrated.yaml)')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute instead of using the alignment cache')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, help='Alignment cache folder')
+    args = parser.parse_args()
+
+    paths = args.path or [os.path.join(args.root, name) for name in find_setup_sequences(args.root, args.setup)]
+    if not paths:
+        parser.error("no sequences given (--path or --root/--setup)")
+    cache = None if args.no_cache else AlignmentCache(args.cache_dir)
+
+    pairs = [load_pose_pairs(path, args.max_dt, cache) for path in paths]
+    F = np.concatenate([p[0] for p in pairs])
+    G = np.concatenate([p[1] for p in pairs])
+    print(f"{len(F)} pose pairs from {len(paths)} sequences")
+
+    extrinsics_file = os.path.join(paths[0], "extrinsics.yaml")
+    with open(extrinsics_file, 'r') as f:
+        data = yaml.safe_load(f)
+    transforms = load_yaml_transformations(extrinsics_file)
+    T_world_base_marker = transforms[('base_marker_ring', 'world')]                     # base markers --> world (mocap)
+    X_prior = transforms[('flange_marker_ring', 'robot_flange')]                        # flange markers --> flange
+    Z_prior = T_world_base_marker @ np.linalg.inv(transforms[('base_marker_ring', 'robot_base')])   # robot base --> world
+
+    if args.method == 'axzb':
+        # G_i X^-1 = Z F_i
+        X_inv, Z0 = closed_form_axzb(G, F)
+        X0 = np.linalg.inv(X_inv)
+    else:
+        X0 = closed_form_axxb(*relative_motions(F, G, args.stride))
+        Z0 = average_transform(G @ np.linalg.inv(X0) @ np.linalg.inv(F))
+    X, Z, result = refine(F, G, X0, Z0, args.sigma_t, np.deg2rad(args.sigma_r), f_scale=args.f_scale)
+
+    for name, (X_, Z_) in [('current', (X_prior, Z_prior)), ('closed form', (X0, Z0)), ('refined', (X, Z))]:
+        stats = error_stats(F, G, X_, Z_)
+        print(f"{name:>12}: t rms {stats['t_rms_mm']:.2f} mm (median {stats['t_median_mm']:.2f}), "
+              f"r rms {stats['r_rms_deg']:.3f} deg (median {stats['r_median_deg']:.3f})")
+    for path, (F_seq, G_seq) in zip(paths, pairs):
+        stats = error_stats(F_seq, G_seq, X, Z)
+        print(f"  {os.path.basename(os.path.normpath(path))}: {stats['pairs']} pairs, t rms {stats['t_rms_mm']:.2f} mm, r rms {stats['r_rms_deg']:.3f} deg")
+    print(f"Solver: {result.nfev} evaluations, {result.message}")
+
+    # the mocap-measured base-marker pose is kept; the robot base is re-attached to it
+    T_robot_base_base_marker = np.linalg.inv(Z) @ T_world_base_marker
+    output_file = args.output or os.path.join(paths[0], "extrinsics_calibrated.yaml")
+    save_yaml_transformations(output_file, data, {('flange_marker_ring', 'robot_flange'): X,
+                                                  ('base_marker_ring', 'robot_base'): T_robot_base_base_marker})
+    print(f"Updated extrinsics written to {output_file}")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 hand_eye_calibration.py --root data --setup 4
+#           python3 hand_eye_calibration.py --path data/4-natural-tr data/4-dark-tr --output extrinsics_4.yaml
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from numpy.lib.format import open_memmap
+from alignment_utils import format_timestamp_ns, parse_timestamp_ns, sec_to_ns
+from depth_codec import read_depth
+from rgb_video import read_rgb
+from sequence_dataset import read_associations
+
+PYRAMID_DIR = "pyramid"
+DEFAULT_LEVELS = (1, 2, 3)   # 1/2, 1/4 and 1/8 of the full resolution
+
+
+def downsample_rgb(img, factor):
+    """
+    Downsamples an image by an integer factor using area interpolation.
+
+    Parameters:
+    - img (np.array): HxWx3 image.
+    - factor (int): Downsampling factor.
+
+    Returns:
+    - img_small (np.array): (H/factor)x(W/factor)x3 image.
+    """
+    h, w = img.shape[0] // factor, img.shape[1] // factor
+    return cv2.resize(img[:h * factor, :w * factor], (w, h), interpolation=cv2.INTER_AREA)
+
+def downsample_depth(depth, factor):
+    """
+    Downsamples a depth image by averaging the valid (non-zero) pixels of each factor x factor block.
+    Blocks without valid pixels stay invalid (0), so missing depth never bleeds into its neighbours.
+
+    Parameters:
+    - depth (np.array): HxW uint16 depth image.
+    - factor (int): Downsampling factor.
+
+    Returns:
+    - depth_small (np.array): (H/factor)x(W/factor) uint16 depth image.
+    """
+    h, w = depth.shape[0] // factor, depth.shape[1] // factor
+    blocks = depth[:h * factor, :w * factor].reshape(h, factor, w, factor)
+    total = blocks.sum(axis=(1, 3), dtype=np.uint64)
+    count = (blocks > 0).sum(axis=(1, 3), dtype=np.uint64)
+    out = np.zeros((h, w), dtype=depth.dtype)
+    valid = count > 0
+    out[valid] = (total[valid] + count[valid] // 2) // count[valid]   # rounded mean of valid pixels
+    return out
+
+def level_path(pyramid_dir, stream, level):
+    return os.path.join(pyramid_dir, f"{stream}_l{level}.npy")
+
+def build_pyramid(dataset_path, levels=DEFAULT_LEVELS, num_workers=8):
+    """
+    Precomputes the RGB and depth pyramids of a sequence.
+
+    Every level is stored as a single .npy stack (one array per stream and level, frames in
+    association order), which can be memory-mapped and sliced without decoding any PNG. The
+    stacks are uncompressed by design, since memory-mapping needs the raw arrays: levels 1-3 take
+    about 1/3 of the size of the raw full-resolution frames.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - levels (tuple): Pyramid levels; level l is downsampled by 2**l.
+    - num_workers (int): Number of decoding threads.
+
+    Returns:
+    - pyramid_dir (str): Folder holding the pyramid.
+    """
+    ts_rgb, rgb_files, ts_depth, depth_files = read_associations(os.path.join(dataset_path, "associations.txt"))
+    pyramid_dir = os.path.join(dataset_path, PYRAMID_DIR)
+    os.makedirs(pyramid_dir, exist_ok=True)
+
+    first_rgb = read_rgb(os.path.join(dataset_path, rgb_files[0]))
+    first_depth = read_depth(os.path.join(dataset_path, depth_files[0]))
+    n = len(rgb_files)
+
+    stacks = {}
+    for level in levels:
+        factor = 2 ** level
+        rgb_shape = (n,) + downsample_rgb(first_rgb, factor).shape
+        depth_shape = (n,) + downsample_depth(first_depth, factor).shape
+        stacks[('rgb', level)] = open_memmap(level_path(pyramid_dir, 'rgb', level), mode='w+', dtype=np.uint8, shape=rgb_shape)
+        stacks[('depth', level)] = open_memmap(level_path(pyramid_dir, 'depth', level), mode='w+', dtype=first_depth.dtype, shape=depth_shape)
+
+    def process(i):
+        rgb = read_rgb(os.path.join(dataset_path, rgb_files[i]))
+        depth = read_depth(os.path.join(dataset_path, depth_files[i]))
+        for level in levels:
+            factor = 2 ** level
+            stacks[('rgb', level)][i] = downsample_rgb(rgb, factor)
+            stacks[('depth', level)][i] = downsample_depth(depth, factor)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        list(pool.map(process, range(n)))
+
+    for stack in stacks.values():
+        stack.flush()
+
+    meta = {
+        "levels": list(levels),
+        "full_resolution": list(first_rgb.shape[:2]),
+        "rgb_timestamps": [format_timestamp_ns(ts) for ts in ts_rgb],
+        "rgb_files": rgb_files,
+        "depth_files": depth_files,
+    }
+    with open(os.path.join(pyramid_dir, "index.json"), 'w') as f:
+        json.dump(meta, f)
+    return pyramid_dir
+
+
+class PyramidLoader:
+    """
+    Serves precomputed pyramid levels of a sequence (see build_pyramid) from memory-mapped stacks.
+
+    Frames are indexed in association order; get(level, index) returns (rgb, depth) at
+    1/2**level of the full resolution, and level 0 falls back to decoding the original PNGs.
+    """
+
+    def __init__(self, dataset_path):
+        self.dataset_path = dataset_path
+        self.pyramid_dir = os.path.join(dataset_path, PYRAMID_DIR)
+        with open(os.path.join(self.pyramid_dir, "index.json"), 'r') as f:
+            self.meta = json.load(f)
+        self.levels = self.meta["levels"]
+        self.timestamps = np.array([parse_timestamp_ns(ts) for ts in self.meta["rgb_timestamps"]], dtype=np.int64)
+        self._stacks = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _stack(self, stream, level):
+        key = (stream, level)
+        if key not in self._stacks:
+            if level not in self.levels:
+                raise KeyError(f"Level {level} not in the pyramid (available: {self.levels})")
+            self._stacks[key] = np.load(level_path(self.pyramid_dir, stream, level), mmap_mode='r')
+        return self._stacks[key]
+
+    def get(self, level, index):
+        """
+        Returns a frame at the requested level.
+
+        Parameters:
+        - level (int): Pyramid level (0 = full resolution).
+        - index (int): Frame index in association order.
+
+        Returns:
+        - rgb (np.array): BGR image.
+        - depth (np.array): Depth image.
+        """
+        if level == 0:
+            rgb = read_rgb(os.path.join(self.dataset_path, self.meta["rgb_files"][index]))
+            depth = read_depth(os.path.join(self.dataset_path, self.meta["depth_files"][index]))
+            return rgb, depth
+        return np.asarray(self._stack('rgb', level)[index]), np.asarray(self._stack('depth', level)[index])
+
+    def get_batch(self, level, indices, num_workers=8):
+        """
+        Returns a batch of frames at the requested level as (B,h,w,3) and (B,h,w) arrays.
+
+        Level 0 decodes the original frames, num_workers at a time.
+        """
+        indices = np.asarray(indices)
+        if level == 0:
+            with ThreadPoolExecutor(max_workers=num_workers) as pool:
+                frames = list(pool.map(lambda i: self.get(0, int(i)), indices))
+            return np.stack([rgb for rgb, _ in frames]), np.stack([depth for _, depth in frames])
+        return self._stack('rgb', level)[indices], self._stack('depth', level)[indices]
+
+    def get_by_timestamp(self, level, timestamp):
+        # timestamp in int nanoseconds (float seconds are accepted too)
+        if isinstance(timestamp, float):
+            timestamp = sec_to_ns(timestamp)
+        index = int(np.argmin(np.abs(self.timestamps - timestamp)))
+        return self.get(level, index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the multi-resolution RGB/depth pyramid of a sequence')
+    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
+    parser.add_argument('--levels', type=int, nargs='+', default=list(DEFAULT_LEVELS), help='Pyramid levels (level l = 1/2**l resolution)')
+    parser.add_argument('--workers', type=int, default=8, help='Decoding threads')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pyramid_dir = build_pyramid(args.path, tuple(args.levels), args.workers)
+    print(f"Pyramid written to {pyramid_dir} in {time.perf_counter() - start:.2f} s")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 image_pyramid.py --path data/4-natural-tr --levels 1 2 3
@@ -0,0 +1,179 @@
+import argparse
+import os
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+from alignment_utils import *
+from sequence_dataset import read_associations
+
+
+def load_imu(txt_path):
+    """
+    Loads IMU data as written by write_imu_data.
+
+    Parameters:
+    - txt_path (str): Path to imu.txt.
+
+    Returns:
+    - timestamps (np.array): Array of N int64 timestamps in nanoseconds.
+    - accel (np.array): Nx3 accelerations (m/s^2).
+    - gyro (np.array): Nx3 angular velocities (rad/s).
+    """
+    timestamps, data = load_stream(txt_path)
+    return timestamps, data[:, 0:3], data[:, 3:6]
+
+def get_R_rgb_imu(transforms, imu_frame='imu_sensor'):
+    """
+    Retrieves the rotation from the IMU frame to the RGB camera frame from the extrinsics.
+
+    Parameters:
+    - transforms (dict): Transformations as returned by load_yaml_transformations.
+    - imu_frame (str): Name of the IMU frame in extrinsics.yaml.
+
+    Returns:
+    - R_rgb_imu (np.array): 3x3 rotation matrix (IMU --> camera).
+    """
+    if (imu_frame, 'rgb_sensor') in transforms:
+        return transforms[(imu_frame, 'rgb_sensor')][:3, :3]
+    if ('rgb_sensor', imu_frame) in transforms:
+        return transforms[('rgb_sensor', imu_frame)][:3, :3].T
+    frames = sorted({frame for pair in transforms for frame in pair})
+    raise KeyError(f"No transformation between '{imu_frame}' and 'rgb_sensor' in the extrinsics "
+                   f"(available frames: {', '.join(frames)})")
+
+def segmented_cumprod(matrices, segments):
+    """
+    Inclusive cumulative matrix product that restarts at every segment boundary.
+
+    Uses a Hillis-Steele scan, so the work is done in log2(N) batched matmuls instead of N
+    sequential ones.
+
+    Parameters:
+    - matrices (np.array): Nx3x3 matrices, in time order.
+    - segments (np.array): N segment ids, non-decreasing.
+
+    Returns:
+    - prefix (np.array): Nx3x3 products M[start] @ ... @ M[i] within each segment.
+    """
+    prefix = matrices.copy()
+    n = len(prefix)
+    step = 1
+    while step < n:
+        idx = np.arange(step, n)
+        idx = idx[segments[idx] == segments[idx - step]]
+        updated = prefix.copy()
+        updated[idx] = prefix[idx - step] @ prefix[idx]
+        prefix = updated
+        step *= 2
+    return prefix
+
+def preintegrate(imu_ts, accel, gyro, frame_ts, R_rgb_imu=None, bias_accel=None, bias_gyro=None):
+    """
+    Preintegrates IMU measurements between consecutive camera frames.
+
+    Measurements are held constant between samples; every interval between two consecutive
+    IMU samples or frame timestamps is integrated exactly once. Gravity is not removed. Repeated
+    frame timestamps are merged (a zero-length frame pair has nothing to integrate), and the
+    frame pairs are returned in time order.
+
+    Parameters:
+    - imu_ts (np.array): N IMU timestamps (int64 nanoseconds).
+    - accel (np.array): Nx3 accelerations.
+    - gyro (np.array): Nx3 angular velocities.
+    - frame_ts (np.array): M frame timestamps (int64 nanoseconds), duplicates allowed.
+    - R_rgb_imu (np.array): Optional 3x3 rotation expressing the results in the camera frame.
+    - bias_accel (np.array): Optional accelerometer bias (3,).
+    - bias_gyro (np.array): Optional gyroscope bias (3,).
+
+    Returns:
+    - result (dict): 'ts_start', 'ts_end' (K, int64 nanoseconds), 'dt' (K, seconds), 'delta_R' (Kx3x3), 'delta_v' (Kx3) and
+      'delta_p' (Kx3) for the K frame pairs covered by the IMU data.
+    """
+    accel = accel - (0 if bias_accel is None else np.asarray(bias_accel))
+    gyro = gyro - (0 if bias_gyro is None else np.asarray(bias_gyro))
+    if R_rgb_imu is not None:
+        accel = accel @ R_rgb_imu.T
+        gyro = gyro @ R_rgb_imu.T
+
+    imu_ts = np.asarray(imu_ts, dtype=np.int64)
+    frame_ts = np.unique(np.asarray(frame_ts, dtype=np.int64))
+    frame_ts = frame_ts[(frame_ts >= imu_ts[0]) & (frame_ts <= imu_ts[-1])]
+    if len(frame_ts) < 2:
+        raise ValueError("Fewer than two distinct frame timestamps inside the IMU time range")
+
+    # integration intervals: IMU samples and frame timestamps inside [first frame, last frame]
+    inner_imu = imu_ts[(imu_ts > frame_ts[0]) & (imu_ts < frame_ts[-1])]
+    breakpoints = np.unique(np.concatenate([frame_ts, inner_imu]))
+    t0, t1 = breakpoints[:-1], breakpoints[1:]
+    dt = ns_to_sec(t1 - t0)
+    sample = np.searchsorted(imu_ts, t0, side='right') - 1          # zero-order hold
+    window = np.searchsorted(frame_ts, t0, side='right') - 1        # frame pair of each interval
+
+    a = accel[sample]
+    dR = R.from_rotvec(gyro[sample] * dt[:, None]).as_matrix()
+    R_incl = segmented_cumprod(dR, window)
+
+    # rotation at the start of each interval (identity at the start of each window)
+    first = np.ones(len(window), dtype=bool)
+    first[1:] = window[1:] != window[:-1]
+    R_excl = np.empty_like(R_incl)
+    R_excl[first] = np.eye(3)
+    R_excl[~first] = R_incl[np.flatnonzero(~first) - 1]
+
+    a_rot = np.einsum('nij,nj->ni', R_excl, a)
+    dv = a_rot * dt[:, None]
+
+    # segmented exclusive cumulative sum of the velocity increments
+    v_cum = np.cumsum(dv, axis=0)
+    start_idx = np.flatnonzero(first)
+    seg_offset = (v_cum[start_idx] - dv[start_idx])[np.cumsum(first) - 1]
+    v_excl = v_cum - dv - seg_offset
+    dp = v_excl * dt[:, None] + 0.5 * a_rot * dt[:, None] ** 2
+
+    k = len(frame_ts) - 1
+    last = np.append(start_idx[1:], len(window)) - 1
+    delta_v = np.zeros((k, 3))
+    delta_p = np.zeros((k, 3))
+    np.add.at(delta_v, window, dv)
+    np.add.at(delta_p, window, dp)
+    return {
+        'ts_start': frame_ts[:-1],
+        'ts_end': frame_ts[1:],
+        'dt': ns_to_sec(np.diff(frame_ts)),
+        'delta_R': R_incl[last],
+        'delta_v': delta_v,
+        'delta_p': delta_p,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Preintegrate IMU measurements between camera frames')
+    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
+    parser.add_argument('--imu', type=str, default="imu.txt", help='IMU file, relative to --path')
+    parser.add_argument('--imu-frame', type=str, default="imu_sensor", help='IMU frame name in extrinsics.yaml')
+    parser.add_argument('--imu-body', action='store_true', help='Keep the results in the IMU frame (ignore the extrinsics)')
+    parser.add_argument('--output', type=str, default="imu_preintegration.npz", help='Output file, relative to --path')
+    args = parser.parse_args()
+
+    dataset_path = os.path.join(args.path)
+    imu_ts, accel, gyro = load_imu(os.path.join(dataset_path, args.imu))
+    frame_ts, _, _, _ = read_associations(os.path.join(dataset_path, "associations.txt"))
+
+    R_rgb_imu = None
+    if not args.imu_body:
+        transforms = load_yaml_transformations(os.path.join(dataset_path, "extrinsics.yaml"))
+        try:
+            R_rgb_imu = get_R_rgb_imu(transforms, args.imu_frame)
+        except KeyError as e:
+            parser.error(f"{e.args[0]}; set --imu-frame or use --imu-body")
+
+    result = preintegrate(imu_ts, accel, gyro, frame_ts, R_rgb_imu)
+    output_file = os.path.join(dataset_path, args.output)
+    np.savez(output_file, **result)
+    print(f"{len(result['dt'])} frame pairs preintegrated, saved to {output_file}")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 imu_preintegration.py --path data/4-natural-tr
@@ -0,0 +1,99 @@
+import json
+import os
+import socket
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# verbosity levels shared by the command-line tools
+QUIET, INFO, DEBUG = 0, 1, 2
+
+
+class Profiler:
+    """
+    Collects per-stage timers, counters and per-topic message statistics for a pipeline run.
+
+    Stages are timed with `with profiler.stage('decode'): ...`; the accumulated times, call
+    counts and message rates are returned by report() and can be written as JSON for monitoring.
+    """
+
+    def __init__(self, name, verbosity=INFO):
+        self.name = name
+        self.verbosity = verbosity
+        self.stages = defaultdict(lambda: [0.0, 0])
+        self.counters = Counter()
+        self.topic_messages = Counter()
+        self.topic_bytes = Counter()
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages[name]
+            stage[0] += time.perf_counter() - start
+            stage[1] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def message(self, topic, nbytes=0):
+        self.topic_messages[topic] += 1
+        self.topic_bytes[topic] += nbytes
+
+    def log(self, level, text):
+        # per-message output goes through here so it can be silenced with the verbosity level
+        if self.verbosity >= level:
+            print(text)
+
+    def report(self):
+        """
+        Returns the run statistics as a JSON-serialisable dict.
+        """
+        wall = time.perf_counter() - self._start
+        stages = {}
+        for name, (total, calls) in self.stages.items():
+            stages[name] = {
+                'total_s': total,
+                'calls': calls,
+                'mean_ms': 1e3 * total / calls if calls else 0.0,
+                'share': total / wall if wall > 0 else 0.0,
+            }
+        topics = {}
+        for topic, messages in self.topic_messages.items():
+            topics[topic] = {
+                'messages': messages,
+                'bytes': self.topic_bytes[topic],
+                'messages_per_s': messages / wall if wall > 0 else 0.0,
+            }
+        return {
+            'name': self.name,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'start_time': self.start_time,
+            'wall_time_s': wall,
+            'stages': stages,
+            'counters': dict(self.counters),
+            'topics': topics,
+        }
+
+    def write_json(self, json_path):
+        with open(json_path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self):
+        """
+        Returns a human-readable summary of the report.
+        """
+        report = self.report()
+        lines = [f"{self.name}: {report['wall_time_s']:.2f} s"]
+        for name, stage in sorted(report['stages'].items(), key=lambda item: -item[1]['total_s']):
+            lines.append(f"  {name:<12} {stage['total_s']:8.2f} s {stage['calls']:8d} calls {stage['mean_ms']:8.3f} ms/call {100 * stage['share']:5.1f} %")
+        for topic, stats in sorted(report['topics'].items()):
+            lines.append(f"  {topic}: {stats['messages']} msgs ({stats['messages_per_s']:.1f} msg/s, {stats['bytes'] / 1e6:.1f} MB)")
+        for name, value in sorted(report['counters'].items()):
+            lines.append(f"  {name}: {value}")
+        return '\n'.join(lines)
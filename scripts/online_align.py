@@ -0,0 +1,283 @@
+import argparse
+import os
+import time
+from collections import Counter, deque, namedtuple
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+from alignment_utils import (compute_T_rgb_flange_markers, format_timestamp_ns, load_yaml_transformations,
+                             pose_to_homogeneous, process_timestamps)
+from sensor_stream import merged_stream, replay
+
+AlignedFrame = namedtuple('AlignedFrame', ['timestamp', 'ts_flange', 'flange_pose', 'ts_gt', 'gt_pose'])
+
+
+def slerp(q0, q1, alpha):
+    """
+    Spherical linear interpolation between two unit quaternions (qx, qy, qz, qw).
+    """
+    dot = float(np.dot(q0, q1))
+    if dot < 0:
+        q1, dot = -q1, -dot
+    if dot > 0.9995:
+        q = q0 + alpha * (q1 - q0)
+        return q / np.linalg.norm(q)
+    theta = np.arccos(dot)
+    return (np.sin((1 - alpha) * theta) * q0 + np.sin(alpha * theta) * q1) / np.sin(theta)
+
+
+class PoseRing:
+    """
+    Fixed-capacity ring buffer of timestamped poses, addressed by the absolute sample number.
+
+    Samples older than the last `capacity` ones are overwritten, so memory stays bounded however
+    long the recording is.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.poses = np.zeros((capacity, 7))   # qx qy qz qw tx ty tz
+        self.count = 0                         # samples pushed so far
+
+    @property
+    def oldest(self):
+        return max(0, self.count - self.capacity)
+
+    @property
+    def last_ts(self):
+        return int(self.ts[(self.count - 1) % self.capacity]) if self.count else None
+
+    def push(self, ts, pose):
+        """
+        Appends a sample; returns False (and ignores it) if it is not newer than the last one.
+        """
+        if self.count and ts <= self.last_ts:
+            return False
+        slot = self.count % self.capacity
+        self.ts[slot] = ts
+        self.poses[slot] = pose
+        self.count += 1
+        return True
+
+    def timestamp(self, n):
+        return int(self.ts[n % self.capacity])
+
+    def pose(self, n):
+        return self.poses[n % self.capacity]
+
+
+class OnlineAligner:
+    """
+    Incremental version of process_timestamps for streams that arrive live.
+
+    Flange and ground-truth poses go into ring buffers and camera timestamps wait in a bounded
+    queue. A frame is emitted as soon as both pose streams have a sample at or after it (its
+    future bracket), either matched to the nearest sample of each stream (as process_timestamps
+    does, ties go to the earlier sample) or interpolated between the bracketing samples (lerp +
+    slerp). Frames are emitted in order and each stream keeps a cursor that only moves forward,
+    so every sample costs O(1) amortized time. Samples are not clipped to the common time range,
+    so the first and last frames may get a closer sample than in the batch version.
+
+    Frames that cannot be aligned are dropped and counted in `dropped`: before the first pose
+    sample ('before_start'), whose bracket was already overwritten ('overrun'), whose bracket is
+    wider than max_gap ('gap'), when the queue overflows ('overflow'), out of order
+    ('out_of_order'), or still waiting at flush() ('after_end').
+    """
+
+    STREAMS = ('flange', 'groundtruth')
+
+    def __init__(self, interpolate=False, buffer_size=2048, max_pending=512, max_gap=None):
+        """
+        Parameters:
+        - interpolate (bool): Interpolate the poses at the frame timestamp instead of taking the nearest samples.
+        - buffer_size (int): Samples kept per pose stream.
+        - max_pending (int): Camera frames allowed to wait for their future bracket.
+        - max_gap (float): Maximum bracket width in seconds (None: no limit).
+        """
+        self.interpolate = interpolate
+        self.rings = {stream: PoseRing(buffer_size) for stream in self.STREAMS}
+        self.cursors = dict.fromkeys(self.STREAMS, 0)
+        self.pending = deque()
+        self.max_pending = max_pending
+        self.max_gap_ns = int(max_gap * 1e9) if max_gap is not None else None
+        self.last_frame_ts = None
+        self.emitted = 0
+        self.dropped = Counter()
+
+    def push(self, stream, ts, values=None):
+        """
+        Adds one sample of any stream.
+
+        Parameters:
+        - stream (str): 'camera', 'flange' or 'groundtruth'.
+        - ts (int): Timestamp (nanoseconds).
+        - values (list): Pose (qx, qy, qz, qw, tx, ty, tz) for the pose streams; ignored for the camera.
+
+        Returns:
+        - frames (list): AlignedFrames that became available.
+        """
+        if stream == 'camera':
+            return self.push_camera(ts)
+        return self.push_pose(stream, ts, values)
+
+    def push_camera(self, ts):
+        if (self.last_frame_ts is not None and ts <= self.last_frame_ts) or (self.pending and ts <= self.pending[-1]):
+            self.dropped['out_of_order'] += 1
+            return []
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft()
+            self.dropped['overflow'] += 1
+        self.pending.append(ts)
+        return self._emit()
+
+    def push_pose(self, stream, ts, pose):
+        if not self.rings[stream].push(ts, np.asarray(pose[:7], dtype=float)):
+            return []
+        return self._emit()
+
+    def flush(self):
+        """
+        Ends the recording: frames still waiting have no future bracket and are dropped.
+        """
+        self.dropped['after_end'] += len(self.pending)
+        self.pending.clear()
+        return []
+
+    def _emit(self):
+        frames = []
+        while self.pending and all(ring.count and ring.last_ts >= self.pending[0] for ring in self.rings.values()):
+            ts = self.pending.popleft()
+            self.last_frame_ts = ts
+            matches = [self._match(stream, ts) for stream in self.STREAMS]
+            reasons = [match for match in matches if isinstance(match, str)]
+            if reasons:
+                self.dropped[reasons[0]] += 1
+                continue
+            (ts_flange, flange_pose), (ts_gt, gt_pose) = matches
+            frames.append(AlignedFrame(ts, ts_flange, flange_pose, ts_gt, gt_pose))
+            self.emitted += 1
+        return frames
+
+    def _match(self, stream, ts):
+        # (timestamp, pose) of the stream at ts, or the reason why the frame cannot be aligned
+        ring = self.rings[stream]
+        n = max(self.cursors[stream], ring.oldest)
+        # advance to the last sample at or before ts (the stream reaches ts, so n + 1 exists while it is <= ts)
+        while n + 1 < ring.count and ring.timestamp(n + 1) <= ts:
+            n += 1
+        self.cursors[stream] = n
+        t0 = ring.timestamp(n)
+        if t0 > ts:
+            return 'overrun' if n > 0 else 'before_start'
+        if t0 == ts:
+            return t0, ring.pose(n).copy()
+        t1 = ring.timestamp(n + 1)
+        if self.max_gap_ns is not None and t1 - t0 > self.max_gap_ns:
+            return 'gap'
+        if not self.interpolate:
+            nearest = n if ts - t0 <= t1 - ts else n + 1
+            return ring.timestamp(nearest), ring.pose(nearest).copy()
+        alpha = (ts - t0) / (t1 - t0)
+        p0, p1 = ring.pose(n), ring.pose(n + 1)
+        return ts, np.concatenate([slerp(p0[:4], p1[:4], alpha), p0[4:] + alpha * (p1[4:] - p0[4:])])
+
+
+class GapMonitor:
+    """
+    Running kinematics-vs-mocap discrepancy of the camera pose over a sliding window of frames.
+    """
+
+    def __init__(self, transforms, window=300):
+        T_world_base_marker = transforms[('base_marker_ring', 'world')]                     # base markers --> world
+        T_robot_base_base_marker = transforms[('base_marker_ring', 'robot_base')]           # base markers --> robot base
+        self.T_left = T_world_base_marker @ np.linalg.inv(T_robot_base_base_marker)
+        self.T_robot_flange_rgb = transforms[('rgb_sensor', 'robot_flange')]                # camera  --> flange
+        self.T_flange_markers_rgb = np.linalg.inv(compute_T_rgb_flange_markers(transforms))
+        self.errors = deque(maxlen=window)
+        self.frames = 0
+
+    def update(self, frame):
+        """
+        Returns the (translation in m, rotation in degrees) gap of one aligned frame.
+        """
+        q, t = frame.flange_pose[:4], frame.flange_pose[4:]
+        T_kin = self.T_left @ pose_to_homogeneous(q, t) @ self.T_robot_flange_rgb
+        q, t = frame.gt_pose[:4], frame.gt_pose[4:]
+        T_gt = pose_to_homogeneous(q, t) @ self.T_flange_markers_rgb
+        trans = float(np.linalg.norm(T_kin[:3, 3] - T_gt[:3, 3]))
+        rot = float(np.degrees(R.from_matrix(T_kin[:3, :3].T @ T_gt[:3, :3]).magnitude()))
+        self.errors.append((trans, rot))
+        self.frames += 1
+        return trans, rot
+
+    def summary(self):
+        """
+        Mean, median and max gap over the window.
+        """
+        if not self.errors:
+            return {'frames': self.frames}
+        errors = np.array(self.errors)
+        return {'frames': self.frames, 'window': len(errors),
+                'trans_mean_m': float(errors[:, 0].mean()), 'trans_median_m': float(np.median(errors[:, 0])), 'trans_max_m': float(errors[:, 0].max()),
+                'rot_mean_deg': float(errors[:, 1].mean()), 'rot_median_deg': float(np.median(errors[:, 1])), 'rot_max_deg': float(errors[:, 1].max())}
+
+
+def compare_with_batch(dataset_path, frames):
+    """
+    Counts the frames whose nearest matches differ from process_timestamps (only the recording edges may).
+    """
+    ts_assoc, ts_flange, _, ts_gt, _ = process_timestamps(dataset_path)
+    batch = {int(ts): (int(f), int(g)) for ts, f, g in zip(ts_assoc, ts_flange, ts_gt)}
+    online = {frame.timestamp: (frame.ts_flange, frame.ts_gt) for frame in frames}
+    common = batch.keys() & online.keys()
+    return {'batch': len(batch), 'online': len(online), 'common': len(common),
+            'different': sum(batch[ts] != online[ts] for ts in common)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Align camera, flange and ground-truth streams online and monitor the kinematics-vs-mocap gap')
+    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset (replayed as a live capture)')
+    parser.add_argument('--interpolate', action='store_true', help='Interpolate the poses at the frame timestamps')
+    parser.add_argument('--speed', type=float, help='Replay in real time at this speed factor')
+    parser.add_argument('--buffer-size', type=int, default=2048, help='Samples kept per pose stream')
+    parser.add_argument('--max-gap', type=float, help='Maximum bracket width (seconds)')
+    parser.add_argument('--window', type=int, default=300, help='Frames in the gap window')
+    parser.add_argument('--every', type=int, default=100, help='Print the gap every N frames')
+    parser.add_argument('--check', action='store_true', help='Compare the nearest matches with process_timestamps')
+    args = parser.parse_args()
+
+    aligner = OnlineAligner(args.interpolate, args.buffer_size, max_gap=args.max_gap)
+    monitor = GapMonitor(load_yaml_transformations(os.path.join(args.path, "extrinsics.yaml")), args.window)
+    events = merged_stream(args.path, ['camera', 'flange', 'groundtruth'])
+    if args.speed:
+        events = replay(events, args.speed)
+
+    frames = []
+    samples = 0
+    start = time.perf_counter()
+    for event in events:
+        samples += 1
+        for frame in aligner.push(event.stream, event.timestamp, event.values):
+            trans, rot = monitor.update(frame)
+            if args.check:
+                frames.append(frame)
+            if monitor.frames % args.every == 0:
+                s = monitor.summary()
+                print(f"{format_timestamp_ns(frame.timestamp)} gap {1000 * trans:.1f} mm {rot:.2f} deg | "
+                      f"window mean {1000 * s['trans_mean_m']:.1f} mm {s['rot_mean_deg']:.2f} deg, max {1000 * s['trans_max_m']:.1f} mm")
+    aligner.flush()
+    elapsed = time.perf_counter() - start
+
+    print(f"{aligner.emitted} frames from {samples} samples in {elapsed:.2f} s "
+          f"({1e6 * elapsed / max(samples, 1):.1f} us/sample), dropped {dict(aligner.dropped)}")
+    print(monitor.summary())
+    if args.check:
+        print(compare_with_batch(args.path, frames))
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 online_align.py --path data/4-natural-tr --speed 1.0
+#           python3 online_align.py --path data/4-natural-tr --check
@@ -0,0 +1,189 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+from alignment_utils import *
+
+
+def find_setup_sequences(root, setup):
+    """
+    Lists the sequences of a setup (e.g. 4-natural-tr, 4-dark-tt, ...) found in a folder.
+
+    Parameters:
+    - root (str): Folder containing the extracted sequences.
+    - setup (int or str): Setup number.
+
+    Returns:
+    - sequences (list): Sorted sequence folder names.
+    """
+    prefix = f"{setup}-"
+    return sorted(name for name in os.listdir(root)
+                  if name.startswith(prefix) and os.path.exists(os.path.join(root, name, "associations.txt")))
+
+def lighting_of(sequence):
+    """
+    Lighting condition of a sequence name such as 4-natural-tt ('natural'), or the name itself.
+    """
+    parts = sequence.split('-')
+    return parts[1] if len(parts) == 3 else sequence
+
+def load_camera_poses(dataset_path):
+    """
+    Computes the ground-truth camera pose of every associated frame of a sequence.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+
+    Returns:
+    - ts_assoc (np.array): Frame timestamps (int64 nanoseconds).
+    - quats (np.array): Nx4 camera orientations (qx, qy, qz, qw) in the world frame.
+    - positions (np.array): Nx3 camera positions in the world frame.
+    """
+    ts_assoc, _, _, _, matched_gt_poses = process_timestamps(dataset_path)
+    transforms = load_yaml_transformations(os.path.join(dataset_path, "extrinsics.yaml"))
+    T_rgb_flange_markers = compute_T_rgb_flange_markers(transforms)
+    poses_gt = [(list(map(float, q)), list(map(float, t))) for q, t in matched_gt_poses]
+    quats, positions = compute_camera_world_positions_gt(poses_gt, T_rgb_flange_markers)
+    return ts_assoc, quats, positions
+
+
+class PoseIndex:
+    """
+    Spatial index over the camera poses of several sequences.
+
+    Positions are stored in a KD-tree; a radius query gives the candidates and a vectorized
+    quaternion-distance test keeps only those whose viewing direction is close enough.
+    """
+
+    def __init__(self, sequences, timestamps, quats, positions):
+        """
+        Parameters:
+        - sequences (list): Sequence names, one per block of poses.
+        - timestamps (list of np.array): Frame timestamps of each sequence (int64 nanoseconds).
+        - quats (list of np.array): Nx4 camera orientations of each sequence.
+        - positions (list of np.array): Nx3 camera positions of each sequence.
+        """
+        self.sequences = list(sequences)
+        self.lightings = [lighting_of(name) for name in self.sequences]
+        self.sequence_ids = np.concatenate([np.full(len(ts), i, dtype=np.int32) for i, ts in enumerate(timestamps)])
+        self.frame_indices = np.concatenate([np.arange(len(ts)) for ts in timestamps])
+        self.timestamps = np.concatenate(timestamps)
+        quats = np.concatenate(quats)
+        self.quats = quats / np.linalg.norm(quats, axis=1, keepdims=True)
+        self.positions = np.concatenate(positions)
+        self.tree = cKDTree(self.positions)
+
+    @classmethod
+    def from_setup(cls, root, setup):
+        """
+        Builds the index over every sequence of a setup found in root.
+        """
+        names, timestamps, quats, positions = [], [], [], []
+        for name in find_setup_sequences(root, setup):
+            ts, q, p = load_camera_poses(os.path.join(root, name))
+            names.append(name)
+            timestamps.append(ts)
+            quats.append(q)
+            positions.append(p)
+        if not names:
+            raise FileNotFoundError(f"No sequences of setup {setup} found in {root}")
+        return cls(names, timestamps, quats, positions)
+
+    def query(self, quats, positions, radius=0.05, max_angle_deg=10.0, exclude_sequence=None, exclude_lighting=None):
+        """
+        Finds the indexed frames that view each query pose.
+
+        Parameters:
+        - quats (np.array): Mx4 query orientations (qx, qy, qz, qw).
+        - positions (np.array): Mx3 query positions.
+        - radius (float): Maximum camera-centre distance (metres).
+        - max_angle_deg (float): Maximum relative rotation angle (degrees).
+        - exclude_sequence (str): Sequence whose frames are ignored (e.g. the one being queried).
+        - exclude_lighting (str): Lighting condition whose frames are ignored (e.g. 'natural', so that
+          the train and test sequences of the query lighting do not match each other).
+
+        Returns:
+        - matches (list of dict): One dict per query with arrays 'sequence_id', 'frame_index',
+          'timestamp', 'distance' and 'angle_deg', sorted by distance.
+        """
+        quats = np.atleast_2d(np.asarray(quats, dtype=float))
+        quats = quats / np.linalg.norm(quats, axis=1, keepdims=True)
+        positions = np.atleast_2d(np.asarray(positions, dtype=float))
+
+        neighbours = self.tree.query_ball_point(positions, r=radius, workers=-1)
+        counts = np.array([len(n) for n in neighbours])
+        query_ids = np.repeat(np.arange(len(positions)), counts)
+        cand = np.concatenate([np.asarray(n, dtype=np.int64) for n in neighbours]) if counts.sum() else np.zeros(0, dtype=np.int64)
+
+        # relative rotation angle between unit quaternions: 2 * acos(|<q1, q2>|)
+        dots = np.abs(np.einsum('ij,ij->i', quats[query_ids], self.quats[cand]))
+        angles = np.degrees(2.0 * np.arccos(np.clip(dots, -1.0, 1.0)))
+        distances = np.linalg.norm(positions[query_ids] - self.positions[cand], axis=1)
+
+        keep = angles <= max_angle_deg
+        if exclude_sequence is not None:
+            keep &= self.sequence_ids[cand] != self.sequences.index(exclude_sequence)
+        if exclude_lighting is not None:
+            excluded = [i for i, lighting in enumerate(self.lightings) if lighting == exclude_lighting]
+            keep &= ~np.isin(self.sequence_ids[cand], excluded)
+        query_ids, cand, angles, distances = query_ids[keep], cand[keep], angles[keep], distances[keep]
+
+        # group by query, closest first
+        order = np.lexsort((distances, query_ids))
+        query_ids, cand, angles, distances = query_ids[order], cand[order], angles[order], distances[order]
+        bounds = np.searchsorted(query_ids, np.arange(len(positions) + 1))
+
+        matches = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            c = cand[start:end]
+            matches.append({
+                'sequence_id': self.sequence_ids[c],
+                'frame_index': self.frame_indices[c],
+                'timestamp': self.timestamps[c],
+                'distance': distances[start:end],
+                'angle_deg': angles[start:end],
+            })
+        return matches
+
+    def query_sequence(self, sequence, radius=0.05, max_angle_deg=10.0, other_lightings=False):
+        """
+        Finds, for every frame of an indexed sequence, the frames of the other sequences viewing the same pose.
+
+        With other_lightings, only sequences recorded under a different lighting condition are matched.
+        """
+        mask = self.sequence_ids == self.sequences.index(sequence)
+        return self.query(self.quats[mask], self.positions[mask], radius, max_angle_deg, exclude_sequence=sequence,
+                          exclude_lighting=lighting_of(sequence) if other_lightings else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the frames of other lighting conditions that view the same poses')
+    parser.add_argument('--root', type=str, required=True, help='Folder containing the sequences')
+    parser.add_argument('--setup', type=str, required=True, help='Setup number (e.g. 4)')
+    parser.add_argument('--sequence', type=str, required=True, help='Query sequence (e.g. 4-natural-tt)')
+    parser.add_argument('--radius', type=float, default=0.05, help='Maximum position distance (m)')
+    parser.add_argument('--max-angle', type=float, default=10.0, help='Maximum rotation distance (deg)')
+    parser.add_argument('--other-lightings', action='store_true', help='Skip the sequences with the lighting of the query sequence')
+    args = parser.parse_args()
+
+    index = PoseIndex.from_setup(args.root, args.setup)
+    start = time.perf_counter()
+    matches = index.query_sequence(args.sequence, args.radius, args.max_angle, args.other_lightings)
+    elapsed = time.perf_counter() - start
+
+    print(f"Indexed {len(index.timestamps)} frames from {len(index.sequences)} sequences")
+    print(f"Queried {len(matches)} frames in {elapsed * 1e3:.1f} ms")
+    for seq_id, name in enumerate(index.sequences):
+        if name == args.sequence or (args.other_lightings and lighting_of(name) == lighting_of(args.sequence)):
+            continue
+        covered = sum(np.any(m['sequence_id'] == seq_id) for m in matches)
+        print(f"  {name}: {covered}/{len(matches)} frames have a match")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 pose_index.py --root data --setup 4 --sequence 4-natural-tt
+#           python3 pose_index.py --root data --setup 4 --sequence 4-natural-tt --other-lightings
@@ -3,6 +3,7 @@ import csv
 import argparse
 from datetime import datetime
 import os
+from alignment_utils import NS_PER_SEC, format_timestamp_ns, parse_timestamp_ns
 
 # Función para cargar y extraer los datos del archivo CSV
 def extract_metadata(file_name):
@@ -23,20 +24,19 @@ def extract_metadata(file_name):
                     break
         # Convertir la hora de inicio de captura a objeto datetime
         time_obj = datetime.strptime(capture_start_time, "%Y-%m-%d %I.%M.%S.%f %p")
-        # Convertir a timestamp Unix
-        #zero_unix_time_sec = int(time_obj.timestamp())
-        zero_unix_time_sec = time_obj.timestamp()  # No usar int(), para no perder mseg
+        # Convertir a timestamp Unix en nanosegundos enteros (sin pasar por float, para no perder resolución)
+        zero_unix_time_ns = int(time_obj.replace(microsecond=0).timestamp()) * NS_PER_SEC + time_obj.microsecond * 1000
 
-        return frame_rate, capture_start_time, total_exported_frames, zero_unix_time_sec
+        return frame_rate, capture_start_time, total_exported_frames, zero_unix_time_ns
     except Exception as e:
         print(f"Error al leer el archivo CSV: {e}")
         return None
 
 # Función para limpiar y procesar los datos
-def process_data(file_name, zero_unix_time_sec):
+def process_data(file_name, zero_unix_time_ns):
     try:
-        # Cargar el archivo CSV en un DataFrame
-        df = pd.read_csv(file_name, skiprows=6)
+        # Cargar el archivo CSV en un DataFrame (el tiempo como texto, para convertirlo sin pérdidas)
+        df = pd.read_csv(file_name, skiprows=6, dtype={'Time (Seconds)': str})
 
         # Filtrar las columnas necesarias
         filtered_data = df[['Time (Seconds)', 'qX', 'qY', 'qZ', 'qW', 'X', 'Y', 'Z']].copy()
@@ -44,17 +44,12 @@ def process_data(file_name, zero_unix_time_sec):
         # Renombrar las columnas para mayor claridad
         filtered_data.columns = ['Time', 'qX', 'qY', 'qZ', 'qW', 'PosX', 'PosY', 'PosZ']
 
-        # Convertir 'Time' a formato numérico
-        filtered_data.loc[:, "Time"] = pd.to_numeric(filtered_data["Time"], errors="coerce")
-
-        # Añadir el tiempo de inicio
-        filtered_data.loc[:, "Time"] += zero_unix_time_sec
-
-        # Eliminar filas con valores NaN
+        # Eliminar filas con tiempos no numéricos o valores NaN
+        filtered_data = filtered_data[pd.to_numeric(filtered_data["Time"], errors="coerce").notna()]
         filtered_data = filtered_data.dropna()
 
-        filtered_data["Time"] = filtered_data["Time"].apply(lambda x: f"{x:.9f}")
-        filtered_data["Time"] = filtered_data["Time"].astype(str)  # Asegura que todo sea de tipo str
+        # Añadir el tiempo de inicio en nanosegundos enteros y formatear en segundos
+        filtered_data["Time"] = filtered_data["Time"].apply(lambda x: format_timestamp_ns(zero_unix_time_ns + parse_timestamp_ns(x)))
 
         return filtered_data
     except Exception as e:
@@ -103,16 +98,16 @@ def main():
     if not metadata:
         return
 
-    frame_rate, capture_start_time, total_exported_frames, zero_unix_time_sec = metadata
+    frame_rate, capture_start_time, total_exported_frames, zero_unix_time_ns = metadata
 
     # Mostrar los metadatos extraídos
     print(f"Frame Rate: {frame_rate}")
     print(f"Capture Start Time: {capture_start_time}")
-    print(f"Capture Start Time (Unix): {zero_unix_time_sec:.9f}")
+    print(f"Capture Start Time (Unix): {format_timestamp_ns(zero_unix_time_ns)}")
     print(f"Total Exported Frames: {total_exported_frames}")
 
     # Procesar los datos del archivo CSV
-    filtered_data = process_data(dataset_path, zero_unix_time_sec)
+    filtered_data = process_data(dataset_path, zero_unix_time_ns)
     if filtered_data is None:
         return
 
@@ -0,0 +1,340 @@
+import argparse
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from alignment_utils import format_timestamp_ns, parse_timestamp_ns
+
+RGB_VIDEO = "rgb.avi"
+RGB_INDEX = "rgb_index.txt"
+
+# codec -> (fourcc, lossless); both are intra-only, every frame is a keyframe stored as one image.
+# 'png' keeps the frames bit-exact but saves almost nothing over the PNG files (~0.98x): it only
+# buys one file and O(1) seeks. 'mjpg' is the one that shrinks the RGB data (several times smaller).
+CODECS = {
+    'png': ('png ', True),
+    'mjpg': ('MJPG', False),
+}
+DEFAULT_CODEC = 'png'
+
+# frames decoded ahead of the writer while packing
+CHUNK = 64
+
+
+def read_rgb_column(association_file):
+    """
+    Returns the RGB file paths of an associations file, in file order.
+    """
+    rgb_files = []
+    with open(association_file, 'r') as f:
+        for line in f:
+            values = line.split()
+            if not line.startswith('#') and len(values) >= 2:
+                rgb_files.append(values[1])
+    return rgb_files
+
+def timestamp_of(rgb_file):
+    return parse_timestamp_ns(os.path.splitext(os.path.basename(rgb_file))[0])
+
+def avi_frame_chunks(video_path):
+    """
+    Lists the video frames of an AVI file (including OpenDML RIFF-AVIX extensions).
+
+    Returns:
+    - chunks (list of tuples): (offset, size) of the data of every video chunk, in file order.
+    """
+    chunks = []
+    with open(video_path, 'rb') as f:
+        file_size = f.seek(0, os.SEEK_END)
+
+        def scan(pos, end, in_movi):
+            while pos + 8 <= end:
+                f.seek(pos)
+                chunk_id, size = struct.unpack('<4sI', f.read(8))
+                if chunk_id in (b'RIFF', b'LIST'):
+                    scan(pos + 12, pos + 8 + size, in_movi or f.read(4) == b'movi')
+                elif in_movi and chunk_id[2:] in (b'dc', b'db'):
+                    chunks.append((pos + 8, size))
+                pos += 8 + size + (size & 1)   # chunks are padded to an even size
+
+        scan(0, file_size, False)
+    return chunks
+
+def read_index(index_file):
+    """
+    Reads a video index.
+
+    Returns:
+    - header (dict): Video file name, codec, width and height.
+    - timestamps (np.array): Frame timestamps (int64 nanoseconds), in video order.
+    - chunks (np.array): Nx2 (offset, size) of every frame in the video file.
+    """
+    header, timestamps, chunks = {}, [], []
+    with open(index_file, 'r') as f:
+        for line in f:
+            if line.startswith('# video'):
+                _, _, video, codec, width, height = line.split()
+                header = {'video': video, 'codec': codec, 'width': int(width), 'height': int(height)}
+                continue
+            if line.startswith('#') or not line.strip():
+                continue
+            ts, _, offset, size = line.split()
+            timestamps.append(parse_timestamp_ns(ts))
+            chunks.append((int(offset), int(size)))
+    return header, np.array(timestamps, dtype=np.int64), np.array(chunks, dtype=np.int64).reshape(-1, 2)
+
+def write_index(index_file, header, timestamps, chunks):
+    tmp_file = f"{index_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        f.write(f"# video {header['video']} {header['codec']} {header['width']} {header['height']}\n")
+        f.write("#timestamp frame offset size\n")
+        for frame, (ts, (offset, size)) in enumerate(zip(timestamps, chunks)):
+            f.write(f"{format_timestamp_ns(ts)} {frame} {offset} {size}\n")
+    os.replace(tmp_file, index_file)
+
+
+class RGBVideo:
+    """
+    Random access to the RGB frames of a sequence packed into a video file.
+
+    The video is an AVI with an intra-only codec, so every frame is a keyframe holding one PNG
+    or JPEG image. The index maps each association timestamp to the byte range of its frame:
+    a read is one positioned read plus an image decode, whatever the access order, and
+    threads can read in parallel without sharing a decoder.
+    """
+
+    def __init__(self, dataset_path):
+        self.dataset_path = dataset_path
+        self.header, self.timestamps, self.chunks = read_index(os.path.join(dataset_path, RGB_INDEX))
+        self.video_path = os.path.join(dataset_path, self.header['video'])
+        self.frame_of_ts = {ts: frame for frame, ts in enumerate(self.timestamps.tolist())}
+        self._fd = os.open(self.video_path, os.O_RDONLY)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __contains__(self, timestamp):
+        return timestamp in self.frame_of_ts
+
+    def frame(self, n):
+        """
+        Decodes frame n (video order) as an 8-bit BGR image.
+        """
+        offset, size = self.chunks[n]
+        data = os.pread(self._fd, int(size), int(offset))
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise IOError(f"Could not decode frame {n} of {self.video_path}")
+        return img
+
+    def read(self, timestamp):
+        """
+        Decodes the frame of an association timestamp (int nanoseconds).
+        """
+        return self.frame(self.frame_of_ts[timestamp])
+
+    def close(self):
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_videos = {}
+_videos_lock = threading.Lock()
+
+def _reset_videos_lock():
+    # a fork can happen while another thread holds the lock, which the child would never see released
+    global _videos_lock
+    _videos_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_videos_lock)
+
+def open_video(dataset_path):
+    """
+    Returns the RGBVideo of a sequence, shared within the process, or None if it has no video.
+
+    Only opened videos are cached, so a sequence packed while the process runs is picked up.
+    """
+    key = os.path.abspath(dataset_path)
+    with _videos_lock:
+        if key not in _videos:
+            if not os.path.exists(os.path.join(dataset_path, RGB_INDEX)):
+                return None
+            _videos[key] = RGBVideo(dataset_path)
+        return _videos[key]
+
+def read_rgb(path):
+    """
+    Drop-in replacement for cv2.imread(path, cv2.IMREAD_COLOR) on <sequence>/rgb/<ts>.png.
+
+    Decodes the frame from the sequence video when the sequence has a video index, and only reads
+    the PNG when it has none; like cv2.imread, returns None if the frame is not found.
+    """
+    video = open_video(os.path.dirname(os.path.dirname(path)))
+    if video is None:
+        return cv2.imread(path, cv2.IMREAD_COLOR)
+    try:
+        timestamp = timestamp_of(path)
+    except ValueError:
+        return None
+    return video.read(timestamp) if timestamp in video else None
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return float('inf') if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+
+def load_png(path):
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError(f"Could not read {path}")
+    return img
+
+def chunked_map(pool, fn, items):
+    # a chunk at a time, so at most CHUNK decoded frames are held ahead of the consumer
+    for start in range(0, len(items), CHUNK):
+        yield from pool.map(fn, items[start:start + CHUNK])
+
+def write_video(video_path, paths, codec, fps, quality=95, workers=8):
+    """
+    Writes PNGs into an AVI and reads every frame back through its byte range.
+
+    Returns:
+    - size (tuple): (width, height) of the frames.
+    - chunks (list of tuples): (offset, size) of every frame.
+    - min_psnr (float): Minimum PSNR of a decoded frame against its PNG (inf if all are identical).
+    """
+    fourcc, lossless = CODECS[codec]
+    writer = None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for img in chunked_map(pool, load_png, paths):
+            if writer is None:
+                height, width = img.shape[:2]
+                writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+                if not writer.isOpened():
+                    raise IOError(f"OpenCV cannot write {codec} video")
+                if not lossless:
+                    writer.set(cv2.VIDEOWRITER_PROP_QUALITY, quality)
+            writer.write(img)
+    if writer is None:
+        raise ValueError("No RGB frames to pack")
+    writer.release()
+
+    chunks = avi_frame_chunks(video_path)
+    if len(chunks) != len(paths):
+        raise RuntimeError(f"{video_path} holds {len(chunks)} frames, expected {len(paths)}")
+
+    fd = os.open(video_path, os.O_RDONLY)
+    try:
+        def check(item):
+            path, (offset, size) = item
+            decoded = cv2.imdecode(np.frombuffer(os.pread(fd, size, offset), dtype=np.uint8), cv2.IMREAD_COLOR)
+            return psnr(decoded, load_png(path)) if decoded is not None else 0.0
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            min_psnr = min(chunked_map(pool, check, list(zip(paths, chunks))))
+    finally:
+        os.close(fd)
+    return (width, height), chunks, min_psnr
+
+def pack_sequence(dataset_path, codec=DEFAULT_CODEC, quality=95, workers=8, remove_png=False):
+    """
+    Packs the RGB PNGs of a sequence into one video and writes its timestamp/byte-offset index.
+
+    The PNGs are decoded ahead of the writer in a thread pool, a chunk at a time. Every frame
+    is then read back through its byte range and compared with its PNG before the index is
+    written; lossless codecs must match exactly and the PNGs are only deleted (remove_png)
+    after that check.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - codec (str): 'png' (lossless) or 'mjpg' (near-lossless).
+    - quality (int): JPEG quality of 'mjpg'.
+    - workers (int): Number of threads.
+    - remove_png (bool): Delete the PNGs after a verified packing.
+
+    Returns:
+    - stats (dict): Frames, PNG and video bytes and the minimum PSNR of the video frames.
+    """
+    rgb_files = list(dict.fromkeys(read_rgb_column(os.path.join(dataset_path, "associations.txt"))))
+    timestamps = np.array([timestamp_of(f) for f in rgb_files], dtype=np.int64)
+    paths = [os.path.join(dataset_path, f) for f in rgb_files]
+
+    # the container frame rate is nominal: the index holds the real timestamps
+    fps = 1e9 / np.median(np.diff(timestamps)) if len(timestamps) > 1 else 30.0
+    tmp_path = os.path.join(dataset_path, "rgb.tmp.avi")
+    try:
+        (width, height), chunks, min_psnr = write_video(tmp_path, paths, codec, fps, quality, workers)
+        if CODECS[codec][1] and min_psnr != float('inf'):
+            raise RuntimeError(f"Round trip failed for {dataset_path} (min PSNR {min_psnr:.1f} dB)")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, os.path.join(dataset_path, RGB_VIDEO))
+    header = {'video': RGB_VIDEO, 'codec': codec, 'width': width, 'height': height}
+    write_index(os.path.join(dataset_path, RGB_INDEX), header, timestamps, chunks)
+
+    png_bytes = sum(os.path.getsize(p) for p in paths)
+    if remove_png:
+        for path in paths:
+            os.remove(path)
+    return {'frames': len(paths), 'png_bytes': png_bytes, 'video_bytes': os.path.getsize(os.path.join(dataset_path, RGB_VIDEO)),
+            'min_psnr': min_psnr}
+
+def unpack_sequence(dataset_path, workers=8):
+    """
+    Writes the frames of the sequence video back to rgb/<ts>.png.
+
+    Returns:
+    - frames (int): Number of PNGs written.
+    """
+    rgb_files = {timestamp_of(f): f for f in read_rgb_column(os.path.join(dataset_path, "associations.txt"))}
+    os.makedirs(os.path.join(dataset_path, "rgb"), exist_ok=True)
+    with RGBVideo(dataset_path) as video:
+        def save(n):
+            ts = int(video.timestamps[n])
+            rel_path = rgb_files.get(ts, os.path.join("rgb", f"{format_timestamp_ns(ts)}.png"))
+            return cv2.imwrite(os.path.join(dataset_path, rel_path), video.frame(n))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return sum(pool.map(save, range(len(video))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack the RGB PNGs of sequences into seekable video files with a timestamp index')
+    parser.add_argument('--path', type=str, nargs='+', required=True, help='Sequence folder(s)')
+    parser.add_argument('--codec', type=str, choices=list(CODECS), default=DEFAULT_CODEC, help='Video codec (png: lossless, ~0.98x the PNG size; mjpg: near-lossless, much smaller)')
+    parser.add_argument('--quality', type=int, default=95, help='JPEG quality for mjpg')
+    parser.add_argument('--workers', type=int, default=8, help='Number of threads')
+    parser.add_argument('--remove-png', action='store_true', help='Delete the PNGs after a verified packing')
+    parser.add_argument('--unpack', action='store_true', help='Write the video frames back to rgb/<ts>.png')
+    args = parser.parse_args()
+
+    for dataset_path in args.path:
+        start = time.perf_counter()
+        if args.unpack:
+            frames = unpack_sequence(dataset_path, args.workers)
+            print(f"{dataset_path}: {frames} PNGs written in {time.perf_counter() - start:.1f} s")
+            continue
+        stats = pack_sequence(dataset_path, args.codec, args.quality, args.workers, args.remove_png)
+        ratio = stats['png_bytes'] / stats['video_bytes'] if stats['video_bytes'] else 0
+        print(f"{dataset_path}: {stats['frames']} frames, {stats['png_bytes'] / 1e6:.1f} MB PNG -> "
+              f"{stats['video_bytes'] / 1e6:.1f} MB video ({ratio:.2f}x, min PSNR {stats['min_psnr']:.1f} dB) in {time.perf_counter() - start:.1f} s")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 rgb_video.py --path data/4-natural-tr data/4-dark-tr --remove-png
+#           python3 rgb_video.py --path data/4-natural-tr --codec mjpg --quality 95
+#           python3 rgb_video.py --path data/4-natural-tr --unpack
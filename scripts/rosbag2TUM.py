@@ -1,13 +1,21 @@
 import argparse
 import cv2
+import numpy as np
 import os
+import sys
 from rosbags.rosbag2 import Reader
 from rosbags.typesys import Stores, get_typestore
-from rosbags.typesys import get_types_from_msg, register_types, get_types_from_idl
+from rosbags.typesys import get_types_from_msg
 from rosbags.typesys.stores.ros2_humble import *
 from rosbags.image import image_to_cvimage
 from collections import defaultdict
 from pathlib import Path
+from alignment_utils import find_nearest_indices, format_timestamp_ns
+from instrumentation import Profiler, QUIET, INFO, DEBUG
+from depth_codec import ZDEPTH_EXT, encode_depth
+
+# RealSense RGBD message definition shipped with the repository, so no ROS installation is needed
+DEFAULT_RGBD_MSG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "msg", "realsense2_camera_msgs", "msg", "RGBD.msg")
 
 def guess_msgtype(path: Path) -> str:
     """Guess message type name from path."""
@@ -81,7 +89,7 @@ def create_imu_data_file(joint_data_path):
 def write_joint_data(file_path, timestamp, data):
     with open(file_path, 'a') as f:
         data_str = ' '.join(map(str, data))
-        f.write(f"{timestamp:.9f} {data_str}\n")
+        f.write(f"{format_timestamp_ns(timestamp)} {data_str}\n")
                 
 
 # Function to write IMU data
@@ -89,18 +97,31 @@ def write_imu_data(imu_file, timestamp, accel_data, gyro_data):
     accel_str = ' '.join(map(str, accel_data))
     gyro_str = ' '.join(map(str, gyro_data))
     with open(imu_file, 'a') as f:
-        f.write(f"{timestamp:.9f} {accel_str} {gyro_str}\n")
+        f.write(f"{format_timestamp_ns(timestamp)} {accel_str} {gyro_str}\n")
+
+# Function to encode and write an image, timing both stages separately
+def save_image(file_path, img, profiler):
+    with profiler.stage('encode'):
+        if file_path.endswith(ZDEPTH_EXT):
+            ok, buf = True, encode_depth(img)
+        else:
+            ok, buf = cv2.imencode('.png', img)
+    if not ok:
+        raise RuntimeError(f"Could not encode {file_path}")
+    with profiler.stage('write'):
+        with open(file_path, 'wb') as f:
+            f.write(buf)
+    profiler.count('bytes_written', len(buf))
 
 # Function to find closest timestamps
 def find_closest_timestamps(rgb_timestamps, depth_timestamps):
-    associations = []
-    for rgb_ts in rgb_timestamps:
-        closest_depth_ts = min(depth_timestamps, key=lambda x: abs(x - rgb_ts))
-        associations.append((rgb_ts, closest_depth_ts))
-    return associations
+    depth_sorted = np.sort(np.array(depth_timestamps, dtype=np.int64))
+    closest = depth_sorted[find_nearest_indices(depth_sorted, np.array(rgb_timestamps, dtype=np.int64))]
+    return list(zip(rgb_timestamps, closest.tolist()))
 
 # Function to extract and save data from the ROSBAG
-def extract_and_save_data(reader, typestore, rgb_path, depth_path, joint_data_path, imu_data_path, available_topics, topics, joints_header_written):
+def extract_and_save_data(reader, typestore, rgb_path, depth_path, joint_data_path, imu_data_path, available_topics, topics, joints_header_written, profiler=None, depth_ext='.png'):
+    profiler = profiler or Profiler('rosbag2TUM')
     msg_count = 0    
     rgb_timestamps = []
     depth_timestamps = []
@@ -108,27 +129,39 @@ def extract_and_save_data(reader, typestore, rgb_path, depth_path, joint_data_pa
     # Create IMU data files
     imu_file = create_imu_data_file(imu_data_path)
 
-    for connection, timestamp, rawdata in reader.messages():
+    messages = iter(reader.messages())
+    while True:
+        # reading covers the storage access of the bag, so it is timed on its own
+        with profiler.stage('read'):
+            item = next(messages, None)
+        if item is None:
+            break
+        connection, timestamp, rawdata = item
+        profiler.message(connection.topic, len(rawdata))
 
-        timestamp = timestamp/1e9   # convert the time: nanosec -> sec
+        # the time stays in integer nanoseconds; it is only formatted as seconds when written
 
         # Save color image
         if connection.topic == topics['color_images']:
-            msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
-            img = image_to_cvimage(msg, 'bgr8')
-            img_name = f'{timestamp:.9f}.png'
-            cv2.imwrite(os.path.join(rgb_path, img_name), img)
+            with profiler.stage('deserialize'):
+                msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
+            with profiler.stage('decode'):
+                img = image_to_cvimage(msg, 'bgr8')
+            img_name = f'{format_timestamp_ns(timestamp)}.png'
+            save_image(os.path.join(rgb_path, img_name), img, profiler)
             rgb_timestamps.append(timestamp)
-            print(f"Saved RGB image: {img_name}")
+            profiler.log(DEBUG, f"Saved RGB image: {img_name}")
 
         # Save depth image
         if connection.topic == topics['depth_images']:
-            msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
-            img = image_to_cvimage(msg)
-            img_name = f'{timestamp:.9f}.png'
-            cv2.imwrite(os.path.join(depth_path, img_name), img)
+            with profiler.stage('deserialize'):
+                msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
+            with profiler.stage('decode'):
+                img = image_to_cvimage(msg)
+            img_name = f'{format_timestamp_ns(timestamp)}{depth_ext}'
+            save_image(os.path.join(depth_path, img_name), img, profiler)
             depth_timestamps.append(timestamp)
-            print(f"Saved Depth image: {img_name}")
+            profiler.log(DEBUG, f"Saved Depth image: {img_name}")
 
         # Save RGBD image
         if connection.topic == topics['rgbd']:
@@ -140,28 +173,32 @@ def extract_and_save_data(reader, typestore, rgb_path, depth_path, joint_data_pa
              
              __msgtype__='realsense2_camera_msgs/msg/RGBD')
             '''
-            msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
+            with profiler.stage('deserialize'):
+                msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
             # Extract the RGB and depth image data
             rgb_image_msg = msg.rgb  # The RGB image data
             depth_image_msg = msg.depth  # The depth image data
             # rgb image
-            rgb_image_cv = image_to_cvimage(rgb_image_msg, 'bgr8')
-            rgb_img_name = f'{timestamp:.9f}.png'
-            cv2.imwrite(os.path.join(rgb_path, rgb_img_name), rgb_image_cv)
-            print(f"Saved RGB image: {rgb_img_name}")
+            with profiler.stage('decode'):
+                rgb_image_cv = image_to_cvimage(rgb_image_msg, 'bgr8')
+            rgb_img_name = f'{format_timestamp_ns(timestamp)}.png'
+            save_image(os.path.join(rgb_path, rgb_img_name), rgb_image_cv, profiler)
+            profiler.log(DEBUG, f"Saved RGB image: {rgb_img_name}")
             rgb_timestamps.append(timestamp)
 
             # depth image
-            depth_img_cv = image_to_cvimage(depth_image_msg)
-            depth_img_name = f'{timestamp:.9f}.png'
-            cv2.imwrite(os.path.join(depth_path, depth_img_name), depth_img_cv)
-            print(f"Saved Depth image: {depth_img_name}")
+            with profiler.stage('decode'):
+                depth_img_cv = image_to_cvimage(depth_image_msg)
+            depth_img_name = f'{format_timestamp_ns(timestamp)}{depth_ext}'
+            save_image(os.path.join(depth_path, depth_img_name), depth_img_cv, profiler)
+            profiler.log(DEBUG, f"Saved Depth image: {depth_img_name}")
             depth_timestamps.append(timestamp)
 
             
         # Save joint states
         if connection.topic == topics['joint_states']:
-            msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
+            with profiler.stage('deserialize'):
+                msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
             if (joints_header_written == False):
                 #joint_header = msg.name
                 joint_header = ['joint1', 'joint2', 'joint3', 'joint4', 'joint5', 'joint6']
@@ -183,9 +220,10 @@ def extract_and_save_data(reader, typestore, rgb_path, depth_path, joint_data_pa
                                     joint_name_to_position['joint5'], 
                                     joint_name_to_position['joint6']]
                 # Write the reordered positions to the file
-                write_joint_data(position_file, timestamp, ordered_positions)
+                with profiler.stage('write'):
+                    write_joint_data(position_file, timestamp, ordered_positions)
                 #write_joint_data(position_file, timestamp, msg.position)
-                print(f"Saved joint positions at timestamp: {timestamp:.9f}")
+                profiler.log(DEBUG, f"Saved joint positions at timestamp: {format_timestamp_ns(timestamp)}")
                 
             # we don not need velocities and efforts
             #if hasattr(msg, 'velocity') and len(msg.velocity) > 0:
@@ -197,29 +235,32 @@ def extract_and_save_data(reader, typestore, rgb_path, depth_path, joint_data_pa
 
         # Save IMU data
         if connection.topic == topics['imu']:
-            msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
+            with profiler.stage('deserialize'):
+                msg = typestore.deserialize_cdr(rawdata, connection.msgtype)
             if hasattr(msg, 'linear_acceleration') and hasattr(msg, 'angular_velocity'):
                 accel_data = (msg.linear_acceleration.x, msg.linear_acceleration.y, msg.linear_acceleration.z)
                 gyro_data = (msg.angular_velocity.x, msg.angular_velocity.y, msg.angular_velocity.z)
-                write_imu_data(imu_file, timestamp, accel_data, gyro_data)
-                print(f"Saved IMU data at timestamp: {timestamp:.9f}")
+                with profiler.stage('write'):
+                    write_imu_data(imu_file, timestamp, accel_data, gyro_data)
+                profiler.log(DEBUG, f"Saved IMU data at timestamp: {format_timestamp_ns(timestamp)}")
 
         msg_count += 1
 
+    profiler.count('messages', msg_count)
     return rgb_timestamps, depth_timestamps
 
 # Function to create associations file
-def create_associations_file(output_dir, associations):
+def create_associations_file(output_dir, associations, log=print, depth_ext='.png'):
     associations_path = os.path.join(output_dir, 'associations.txt')
     assoc_header = "#rgb_timestamp rgb_file depth_timestamp depth_file\n"
     with open(associations_path, 'w') as f:
         f.write(assoc_header)
         for rgb_ts, depth_ts in associations:
             # Formatear los timestamps con precisión de 9 decimales
-            rgb_ts_sec = f"{rgb_ts:.9f}"
-            depth_ts_sec = f"{depth_ts:.9f}"
-            f.write(f"{rgb_ts_sec} rgb/{rgb_ts_sec}.png {depth_ts_sec} depth/{depth_ts_sec}.png\n")
-    print(f"\nAssociations file created at: {associations_path}")
+            rgb_ts_sec = format_timestamp_ns(rgb_ts)
+            depth_ts_sec = format_timestamp_ns(depth_ts)
+            f.write(f"{rgb_ts_sec} rgb/{rgb_ts_sec}.png {depth_ts_sec} depth/{depth_ts_sec}{depth_ext}\n")
+    log(f"\nAssociations file created at: {associations_path}")
     '''
     with open(associations_path, 'w') as f:
         f.write(assoc_header)
@@ -229,11 +270,11 @@ def create_associations_file(output_dir, associations):
     '''
 
 # Function to list available topics in ROSBAG
-def list_topics(reader):
+def list_topics(reader, log=print):
     available_topics = []
-    print("Available Topics in the ROSBAG file:")
+    log("Available Topics in the ROSBAG file:")
     for i, connection in enumerate(reader.connections, start=1):
-        print(f"Topic {i}: {connection.topic}, Message Type: {connection.msgtype}")
+        log(f"Topic {i}: {connection.topic}, Message Type: {connection.msgtype}")
         available_topics.append(connection.topic)
     return available_topics
 
@@ -245,23 +286,44 @@ def main():
         "--input",
         type=str,
         required=True,
-        help="Nombre del archivo de entrada (sin la carpeta base '/ROSBAGS')."
+        help="Archivo (carpeta rosbag2) de entrada, relativo a --base-dir."
     )
     parser.add_argument(
         "--output",
         type=str,
         required=True,
-        help="Nombre de la carpeta de salida donde se guardará el contenido procesado."
+        help="Carpeta de salida donde se guardará el contenido procesado, relativa a --base-dir."
+    )
+    parser.add_argument(
+        "--base-dir",
+        type=str,
+        default=os.environ.get('SLAMRENDER_ROSBAGS', ''),
+        help="Carpeta base de --input y --output (por defecto $SLAMRENDER_ROSBAGS o la carpeta actual)."
+    )
+    parser.add_argument(
+        "--rgbd-msg",
+        type=str,
+        default=DEFAULT_RGBD_MSG,
+        help="Definición del mensaje realsense2_camera_msgs/msg/RGBD (por defecto la copia en config/msg)."
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Imprimir una línea por cada mensaje guardado.")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Imprimir solo los errores.")
+    parser.add_argument("--report", type=str, help="Archivo JSON donde guardar los tiempos por etapa y los mensajes/s por tópico.")
+    parser.add_argument(
+        "--depth-format",
+        choices=["png", "zdepth"],
+        default="png",
+        help="Formato de las imágenes de profundidad: PNG de 16 bits o el códec sin pérdidas zdepth (depth_codec.py)."
     )
     args = parser.parse_args()
-
-    # Base path para los ROSBAGs
-    rosbag_base_path = "/home/samuel/dev/environment_modeling/ROSBAGS"
-    output_base_path = "/home/samuel/dev/environment_modeling/ROSBAGS"
+    depth_ext = ZDEPTH_EXT if args.depth_format == "zdepth" else ".png"
+    verbosity = QUIET if args.quiet else DEBUG if args.verbose else INFO
+    profiler = Profiler('rosbag2TUM', verbosity)
+    log = lambda text: profiler.log(INFO, text)
 
     # Combinamos el base path con los argumentos
-    rosbag_path = os.path.join(rosbag_base_path, args.input)
-    output_dir = os.path.join(output_base_path, args.output)
+    rosbag_path = os.path.join(args.base_dir, args.input)
+    output_dir = os.path.join(args.base_dir, args.output)
 
     if not os.path.exists(rosbag_path):
         raise FileNotFoundError(f"El archivo de entrada '{rosbag_path}' no existe.")
@@ -269,8 +331,8 @@ def main():
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    print(f"Procesando el archivo de entrada: {rosbag_path}")
-    print(f"Guardando datos procesados en: {output_dir}")
+    profiler.log(INFO, f"Procesando el archivo de entrada: {rosbag_path}")
+    profiler.log(INFO, f"Guardando datos procesados en: {output_dir}")
 
     # Aquí puedes incluir el resto del flujo del script, como cargar los mensajes, procesar las imágenes, etc.
     topics = {
@@ -281,31 +343,39 @@ def main():
         'imu': '/camera/camera/imu'
     }
 
-    path_to_RGBDmsg = os.path.expandvars("/home/ros2_ws/install/realsense2_camera_msgs/share/realsense2_camera_msgs/msg/RGBD.msg")
+    path_to_RGBDmsg = os.path.expandvars(args.rgbd_msg)
     typestore = load_custom_types(path_to_RGBDmsg)
 
     try:
         with Reader(rosbag_path) as reader:
-            available_topics = list_topics(reader)
-            print(available_topics)
+            available_topics = list_topics(reader, log)
+            log(str(available_topics))
             
-            print("\nLeyendo y extrayendo datos del ROSBAG...\n")
+            log("\nLeyendo y extrayendo datos del ROSBAG...\n")
             rgb_path, depth_path, joint_data_path, imu_data_path = create_output_directories(output_dir, available_topics, topics)
             joints_header_written = False
 
             rgb_timestamps, depth_timestamps = extract_and_save_data(
                 reader, typestore, rgb_path, depth_path, joint_data_path, imu_data_path,
-                available_topics, topics, joints_header_written
+                available_topics, topics, joints_header_written, profiler, depth_ext
             )
 
-            associations = find_closest_timestamps(rgb_timestamps, depth_timestamps)
-            create_associations_file(output_dir, associations)
+            with profiler.stage('match'):
+                associations = find_closest_timestamps(rgb_timestamps, depth_timestamps)
+            with profiler.stage('write'):
+                create_associations_file(output_dir, associations, log, depth_ext)
+
+        profiler.log(INFO, "\n" + profiler.summary())
+        if args.report:
+            profiler.write_json(args.report)
+            profiler.log(INFO, f"Informe guardado en: {args.report}")
     
     except Exception as e:
         print(f"Error procesando el ROSBAG: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
     
 # Ejemplo de uso
-# python3 rosbag2TUM.py --input planar --output planar_data
\ No newline at end of file
+# python3 rosbag2TUM.py --base-dir ~/ROSBAGS --input planar --output planar_data
\ No newline at end of file
@@ -0,0 +1,130 @@
+import argparse
+import heapq
+import os
+import time
+from collections import Counter, namedtuple
+from alignment_utils import format_timestamp_ns, ns_to_sec, parse_timestamp_ns
+
+# stream name -> file relative to the sequence folder
+STREAM_FILES = {
+    'camera': "associations.txt",
+    'joints': "robot_data/joint_states.txt",
+    'flange': "robot_data/flange_poses.txt",
+    'groundtruth': "groundtruth.txt",
+    'imu': "imu.txt",
+}
+
+# streams whose values are file names rather than numbers
+TEXT_STREAMS = {'camera'}
+
+SensorEvent = namedtuple('SensorEvent', ['timestamp', 'stream', 'values'])
+
+
+def read_stream(txt_path, stream, start=None, end=None, predicate=None):
+    """
+    Lazily reads a whitespace-separated stream file, one event per line.
+
+    Parameters:
+    - txt_path (str): Path to the stream file (first column is the timestamp).
+    - stream (str): Stream name attached to the events.
+    - start (int): Skip events before this timestamp (nanoseconds).
+    - end (int): Stop at the first event after this timestamp (nanoseconds; files are time-ordered).
+    - predicate (callable): Optional filter applied to every SensorEvent.
+
+    Yields:
+    - event (SensorEvent): Timestamp (int nanoseconds), stream name and the remaining columns.
+    """
+    with open(txt_path, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.split(None, 1)
+            ts = parse_timestamp_ns(fields[0])
+            if start is not None and ts < start:
+                continue
+            if end is not None and ts > end:
+                break
+            values = fields[1].split() if len(fields) > 1 else []
+            if stream not in TEXT_STREAMS:
+                values = [float(v) for v in values]
+            event = SensorEvent(ts, stream, values)
+            if predicate is None or predicate(event):
+                yield event
+
+def merged_stream(dataset_path, streams=None, start=None, end=None, filters=None):
+    """
+    Yields the events of several sensor streams in global timestamp order.
+
+    Each file is read lazily and the streams are combined with a heap merge, so memory only
+    holds one pending event per stream, whatever the length of the sequence.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - streams (list): Stream names to include (default: every stream file present).
+    - start (int): Start of the time window (nanoseconds).
+    - end (int): End of the time window (nanoseconds).
+    - filters (dict): Optional stream name -> predicate on SensorEvent.
+
+    Yields:
+    - event (SensorEvent): Events ordered by timestamp.
+    """
+    filters = filters or {}
+    if streams is None:
+        streams = [s for s, rel_path in STREAM_FILES.items() if os.path.exists(os.path.join(dataset_path, rel_path))]
+    iterators = [read_stream(os.path.join(dataset_path, STREAM_FILES[s]), s, start, end, filters.get(s))
+                 for s in streams]
+    return heapq.merge(*iterators, key=lambda event: event.timestamp)
+
+def replay(events, speed=1.0):
+    """
+    Paces an event iterator in (scaled) real time, as an online system would receive it.
+
+    Parameters:
+    - events (iterable): Time-ordered SensorEvents.
+    - speed (float): Playback speed factor (2.0 = twice as fast).
+
+    Yields:
+    - event (SensorEvent): The same events, released at their due time.
+    """
+    wall_start = None
+    for event in events:
+        if wall_start is None:
+            wall_start, data_start = time.perf_counter(), event.timestamp
+        delay = ns_to_sec(event.timestamp - data_start) / speed - (time.perf_counter() - wall_start)
+        if delay > 0:
+            time.sleep(delay)
+        yield event
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the sensor streams of a sequence in timestamp order')
+    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
+    parser.add_argument('--streams', type=str, nargs='+', choices=list(STREAM_FILES), help='Streams to replay (default: all)')
+    parser.add_argument('--start', type=parse_timestamp_ns, help='Start timestamp (seconds)')
+    parser.add_argument('--end', type=parse_timestamp_ns, help='End timestamp (seconds)')
+    parser.add_argument('--speed', type=float, help='Replay in real time at this speed factor')
+    parser.add_argument('--print', dest='print_events', action='store_true', help='Print every event')
+    args = parser.parse_args()
+
+    events = merged_stream(args.path, args.streams, args.start, args.end)
+    if args.speed:
+        events = replay(events, args.speed)
+
+    counts = Counter()
+    start = time.perf_counter()
+    for event in events:
+        counts[event.stream] += 1
+        if args.print_events:
+            print(f"{format_timestamp_ns(event.timestamp)} {event.stream} {' '.join(map(str, event.values))}")
+    elapsed = time.perf_counter() - start
+
+    total = sum(counts.values())
+    print(f"{total} events in {elapsed:.2f} s ({total / max(elapsed, 1e-9):.0f} events/s)")
+    for stream, count in sorted(counts.items()):
+        print(f"  {stream}: {count}")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 sensor_stream.py --path data/4-natural-tr --streams camera imu --speed 1.0
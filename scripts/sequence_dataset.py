@@ -0,0 +1,291 @@
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from alignment_utils import *
+from depth_codec import read_depth
+from rgb_video import read_rgb
+
+
+def read_associations(association_file):
+    """
+    Reads an associations file.
+
+    Parameters:
+    - association_file (str): Path to associations.txt.
+
+    Returns:
+    - ts_rgb (np.array): RGB timestamps (int64 nanoseconds).
+    - rgb_files (list): RGB file paths, relative to the sequence folder.
+    - ts_depth (np.array): Depth timestamps (int64 nanoseconds).
+    - depth_files (list): Depth file paths, relative to the sequence folder.
+    """
+    ts_rgb, rgb_files, ts_depth, depth_files = [], [], [], []
+    with open(association_file, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            values = line.split()
+            ts_rgb.append(parse_timestamp_ns(values[0]))
+            rgb_files.append(values[1])
+            ts_depth.append(parse_timestamp_ns(values[2]))
+            depth_files.append(values[3])
+    return np.array(ts_rgb, dtype=np.int64), rgb_files, np.array(ts_depth, dtype=np.int64), depth_files
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a fixed number of entries.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SequenceDataset:
+    """
+    Random-access loader for a SLAM&Render sequence.
+
+    The associations are indexed once; frames are returned as (rgb, depth, pose), where rgb is the
+    8-bit BGR image, depth the 16-bit depth image and pose the 4x4 camera-to-world transform obtained
+    from the ground truth through the extrinsics chain. Only frames inside the common time range of
+    the camera, flange and ground-truth streams are indexed (see process_timestamps).
+
+    Decoded frames are kept in a bounded LRU cache. A thread pool prefetches the next frames when
+    the dataset is read sequentially, and any access order can be prefetched with iterate(order).
+    With shared_cache (a SharedFrameCache), frames are cached once in shared memory for every
+    data-loader process instead of in a private cache per process. The frames returned are then
+    private copies, since the caller may keep them after their slot is evicted; for zero-copy reads
+    inside a with block use shared_cache.pin(dataset.sequence, dataset.timestamps[index]).
+
+    The dataset can be pickled to data-loader worker processes (spawn or fork): the thread pool,
+    the pending prefetches and the private cache are per process and are rebuilt on first use.
+    """
+
+    def __init__(self, dataset_path, cache_size=256, prefetch=8, num_workers=4, shared_cache=None):
+        self.dataset_path = dataset_path
+        self.sequence = os.path.basename(os.path.normpath(dataset_path))
+        self.prefetch = prefetch
+        self.cache_size = cache_size
+        self.num_workers = num_workers
+        self.shared_cache = shared_cache
+
+        ts_rgb, rgb_files, _, depth_files = read_associations(os.path.join(dataset_path, "associations.txt"))
+        ts_assoc, _, _, _, matched_gt_poses = process_timestamps(dataset_path)
+
+        # both sides are integer nanoseconds, so the lookup is exact
+        row_of_ts = {ts: row for row, ts in enumerate(ts_rgb.tolist())}
+        rows = [row_of_ts[ts] for ts in ts_assoc.tolist()]
+        self.timestamps = ts_assoc
+        self.rgb_files = [os.path.join(dataset_path, rgb_files[row]) for row in rows]
+        self.depth_files = [os.path.join(dataset_path, depth_files[row]) for row in rows]
+
+        transforms = load_yaml_transformations(os.path.join(dataset_path, "extrinsics.yaml"))
+        T_rgb_flange_markers = compute_T_rgb_flange_markers(transforms)
+        poses_gt = [(list(map(float, q)), list(map(float, t))) for q, t in matched_gt_poses]
+        quats, positions = compute_camera_world_positions_gt(poses_gt, T_rgb_flange_markers)
+        self.poses = np.tile(np.eye(4), (len(self.timestamps), 1, 1))
+        if len(self.timestamps) > 0:
+            self.poses[:, :3, :3] = R.from_quat(quats).as_matrix()
+            self.poses[:, :3, 3] = positions
+
+        self._pid = None
+        self._ensure_pool()
+        self._last_index = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_cache', '_pool', '_pending', '_pending_lock'):
+            del state[name]
+        state['_pid'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def _ensure_pool(self):
+        # a forked or unpickled copy must not reuse the threads, locks and private cache of its parent
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._cache = LRUCache(self.cache_size)
+        self._pool = ThreadPoolExecutor(max_workers=self.num_workers)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Frame index {index} out of range for a sequence of {len(self)} frames")
+
+        # sequential access: keep the next frames decoding in the background
+        if self._last_index is not None and index == self._last_index + 1:
+            self.prefetch_indices(range(index + 1, min(index + 1 + self.prefetch, len(self))))
+        self._last_index = index
+
+        rgb, depth = self._load(index)
+        return rgb, depth, self.poses[index]
+
+    def index_of(self, timestamp, tolerance=None):
+        """
+        Finds the frame whose timestamp is closest to the given one.
+
+        Parameters:
+        - timestamp (int or float): Query timestamp, int nanoseconds or float seconds.
+        - tolerance (float): Maximum allowed difference in seconds; None accepts any.
+
+        Returns:
+        - index (int): Frame index.
+        """
+        if isinstance(timestamp, float):
+            timestamp = sec_to_ns(timestamp)
+        idx = int(np.searchsorted(self.timestamps, timestamp))
+        candidates = [i for i in (idx - 1, idx) if 0 <= i < len(self)]
+        if not candidates:
+            raise KeyError("No frames in the sequence")
+        best = min(candidates, key=lambda i: abs(int(self.timestamps[i]) - timestamp))
+        if tolerance is not None and abs(int(self.timestamps[best]) - timestamp) > sec_to_ns(tolerance):
+            raise KeyError(f"No frame within {tolerance} s of timestamp {format_timestamp_ns(timestamp)}")
+        return best
+
+    def get_by_timestamp(self, timestamp, tolerance=None):
+        return self[self.index_of(timestamp, tolerance)]
+
+    def prefetch_indices(self, indices):
+        """
+        Schedules frames to be decoded in the background.
+
+        Parameters:
+        - indices (iterable): Frame indices to prefetch.
+        """
+        self._ensure_pool()
+        submitted = []
+        with self._pending_lock:
+            for index in indices:
+                if index in self._pending or self._is_cached(index):
+                    continue
+                future = self._pool.submit(self._decode_and_store, index)
+                self._pending[index] = future
+                submitted.append((index, future))
+        # outside the lock: a future that is already done runs its callback right here
+        for index, future in submitted:
+            future.add_done_callback(lambda future, index=index: self._forget(index, future))
+
+    def iterate(self, order=None):
+        """
+        Yields (index, rgb, depth, pose) following an arbitrary access order, prefetching ahead.
+
+        Parameters:
+        - order (iterable): Frame indices to visit; defaults to the sequence order.
+        """
+        order = list(range(len(self))) if order is None else list(order)
+        self.prefetch_indices(order[:self.prefetch])
+        for pos, index in enumerate(order):
+            self.prefetch_indices(order[pos + 1:pos + 1 + self.prefetch])
+            rgb, depth = self._load(index)
+            yield index, rgb, depth, self.poses[index]
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _decode(self, index):
+        rgb = read_rgb(self.rgb_files[index])
+        depth = read_depth(self.depth_files[index])
+        if rgb is None or depth is None:
+            raise FileNotFoundError(f"Could not read frame {index} ({self.rgb_files[index]}, {self.depth_files[index]})")
+        return rgb, depth
+
+    def _is_cached(self, index):
+        if self.shared_cache is not None:
+            return (self.sequence, int(self.timestamps[index])) in self.shared_cache
+        return index in self._cache
+
+    def _decode_and_store(self, index):
+        if self.shared_cache is not None:
+            return self.shared_cache.get_or_load(self.sequence, int(self.timestamps[index]), lambda: self._decode(index))
+        frame = self._decode(index)
+        self._cache.put(index, frame)
+        return frame
+
+    def _forget(self, index, future):
+        # done (also failed or cancelled) prefetch; a newer prefetch of the same frame stays pending
+        with self._pending_lock:
+            if self._pending.get(index) is future:
+                del self._pending[index]
+
+    def _load(self, index):
+        self._ensure_pool()
+        # the shared cache is looked up once, by get_or_load below, so every read counts one hit or miss
+        if self.shared_cache is None:
+            frame = self._cache.get(index)
+            if frame is not None:
+                return frame
+        with self._pending_lock:
+            future = self._pending.get(index)
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass   # the prefetch failed (or was cancelled): decode again so the error surfaces here
+        return self._decode_and_store(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read a sequence through SequenceDataset and report the throughput')
+    parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
+    parser.add_argument('--shuffle', action='store_true', help='Read the frames in random order')
+    parser.add_argument('--workers', type=int, default=4, help='Decoding threads')
+    args = parser.parse_args()
+
+    with SequenceDataset(args.path, num_workers=args.workers) as dataset:
+        order = np.random.permutation(len(dataset)) if args.shuffle else None
+        start = time.perf_counter()
+        for _ in dataset.iterate(order):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{len(dataset)} frames in {elapsed:.2f} s ({len(dataset) / max(elapsed, 1e-9):.1f} frames/s)")
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 sequence_dataset.py --path data/4-natural-tr --shuffle
@@ -0,0 +1,496 @@
+import argparse
+import fcntl
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from depth_codec import read_depth
+from rgb_video import read_rgb
+from sequence_dataset import read_associations
+
+DEFAULT_NAME = "slamrender_frames"
+DEFAULT_FRAME_SHAPE = (480, 848)
+
+# slot states
+EMPTY, LOADING, READY = 0, 1, 2
+
+SLOT_DTYPE = np.dtype([
+    ('sequence', np.int64),       # hash of the sequence name
+    ('timestamp', np.int64),      # association timestamp (nanoseconds)
+    ('state', np.int32),
+    ('pins', np.int32),           # readers holding zero-copy views
+    ('owner', np.int32),          # pid of the process decoding a LOADING slot
+    ('last_used', np.int64),      # shared clock value of the last access
+    ('rgb_shape', np.int32, 3),
+    ('depth_shape', np.int32, 2),
+])
+HEADER_DTYPE = np.dtype([
+    ('capacity', np.int64),
+    ('slot_bytes', np.int64),
+    ('clock', np.int64),
+    ('hits', np.int64),
+    ('misses', np.int64),
+    ('evictions', np.int64),
+    ('reclaimed', np.int64),
+    ('pin_capacity', np.int64),
+])
+PIN_DTYPE = np.dtype([
+    ('slot', np.int32),           # -1: free entry
+    ('pid', np.int32),            # process holding the pin
+])
+MAX_PINS = 1024
+
+
+def sequence_key(sequence):
+    """
+    Stable 63-bit key of a sequence name, identical in every process.
+    """
+    return int.from_bytes(hashlib.blake2b(sequence.encode(), digest_size=8).digest(), 'little') >> 1
+
+def pid_alive(pid):
+    """
+    True if a process with this pid exists.
+    """
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def frame_bytes(shape):
+    """
+    Bytes of one decoded frame (8-bit BGR + 16-bit depth) of the given (height, width).
+    """
+    height, width = shape
+    return height * width * 3 + height * width * 2
+
+
+class SharedFrameCache:
+    """
+    Cache of decoded (rgb, depth) frames in POSIX shared memory, shared by every process that attaches to it.
+
+    The cache is a fixed number of frame slots plus an index table, keyed by (sequence, association
+    timestamp). One process creates it with a memory budget; data-loader workers attach by name (or
+    receive it pickled) and read frames as zero-copy views. All processes share the LRU eviction:
+    the least recently used unpinned slot is reused when the budget is full.
+
+    Coordination uses a file lock, so unrelated processes can attach; a slot is only visible once
+    it is completely written, and pinned slots (see pin()) are never evicted. Every pin and every
+    slot being decoded records the pid of its process, so the pins and half-written slots left by a
+    process that died (e.g. a killed data-loader worker) are reclaimed instead of blocking the
+    slots forever.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, budget_bytes=None, frame_shape=DEFAULT_FRAME_SHAPE, create=False):
+        self.name = name
+        self._owner = create
+        if create:
+            slot_bytes = frame_bytes(frame_shape)
+            capacity = max(1, int(budget_bytes // slot_bytes))
+            index_bytes = HEADER_DTYPE.itemsize + capacity * SLOT_DTYPE.itemsize + MAX_PINS * PIN_DTYPE.itemsize
+            self._index_shm = shared_memory.SharedMemory(f"{name}_index", create=True, size=index_bytes)
+            self._data_shm = shared_memory.SharedMemory(f"{name}_data", create=True, size=capacity * slot_bytes)
+            self._header = np.ndarray(1, dtype=HEADER_DTYPE, buffer=self._index_shm.buf)
+            self._header[0] = (capacity, slot_bytes, 0, 0, 0, 0, 0, MAX_PINS)
+        else:
+            self._index_shm = self._attach(f"{name}_index")
+            self._data_shm = self._attach(f"{name}_data")
+            self._header = np.ndarray(1, dtype=HEADER_DTYPE, buffer=self._index_shm.buf)
+        # the segments may be rounded up to whole pages, so the capacity comes from the header
+        self._slots = np.ndarray(int(self._header[0]['capacity']), dtype=SLOT_DTYPE, buffer=self._index_shm.buf, offset=HEADER_DTYPE.itemsize)
+        self._pins = np.ndarray(int(self._header[0]['pin_capacity']), dtype=PIN_DTYPE, buffer=self._index_shm.buf,
+                                offset=HEADER_DTYPE.itemsize + self._slots.nbytes)
+        if create:
+            self._slots[:] = np.zeros(len(self._slots), dtype=SLOT_DTYPE)
+            self._pins['slot'] = -1
+        self._open_lock()
+
+    @staticmethod
+    def _attach(shm_name):
+        # attaching processes must not unlink the segments when they exit (only the creator does)
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(shm_name, track=False)
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(shm_name)
+        finally:
+            resource_tracker.register = register
+
+    def _open_lock(self):
+        self._pid = os.getpid()
+        self._thread_lock = threading.Lock()
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"), 'a')
+
+    @contextmanager
+    def _locked(self):
+        if os.getpid() != self._pid:
+            # forked: flock is shared with the parent through the inherited file, so reopen it
+            self._open_lock()
+        with self._thread_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def __getstate__(self):
+        return {'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'])
+
+    @property
+    def capacity(self):
+        return len(self._slots)
+
+    @property
+    def slot_bytes(self):
+        return int(self._header[0]['slot_bytes'])
+
+    def _find(self, sequence, timestamp, states=(READY,)):
+        hits = np.flatnonzero((self._slots['timestamp'] == timestamp) & (self._slots['sequence'] == sequence_key(sequence))
+                              & np.isin(self._slots['state'], states))
+        return int(hits[0]) if len(hits) else None
+
+    def _touch(self, slot):
+        self._header[0]['clock'] += 1
+        self._slots[slot]['last_used'] = self._header[0]['clock']
+
+    def _views(self, slot):
+        entry = self._slots[slot]
+        rgb_shape, depth_shape = tuple(entry['rgb_shape']), tuple(entry['depth_shape'])
+        offset = slot * self.slot_bytes
+        rgb = np.ndarray(rgb_shape, dtype=np.uint8, buffer=self._data_shm.buf, offset=offset)
+        depth = np.ndarray(depth_shape, dtype=np.uint16, buffer=self._data_shm.buf, offset=offset + rgb.nbytes)
+        rgb.flags.writeable = False
+        depth.flags.writeable = False
+        return rgb, depth
+
+    def __contains__(self, key):
+        sequence, timestamp = key
+        with self._locked():
+            return self._find(sequence, timestamp) is not None
+
+    @contextmanager
+    def pin(self, sequence, timestamp):
+        """
+        Zero-copy access to a cached frame; the slot cannot be evicted inside the with block.
+
+        Yields:
+        - (rgb, depth): Read-only views into shared memory.
+
+        Raises:
+        - KeyError: If the frame is not cached.
+        """
+        with self._locked():
+            slot = self._find(sequence, timestamp)
+            if slot is None:
+                self._header[0]['misses'] += 1
+                raise KeyError((sequence, timestamp))
+            self._header[0]['hits'] += 1
+            self._pin(slot)
+        try:
+            yield self._views(slot)
+        finally:
+            self._unpin(slot)
+
+    def get(self, sequence, timestamp):
+        """
+        Returns a private copy of a cached frame as (rgb, depth), or None if it is not cached.
+        """
+        try:
+            with self.pin(sequence, timestamp) as (rgb, depth):
+                return rgb.copy(), depth.copy()
+        except KeyError:
+            return None
+
+    def _pin(self, slot):
+        # called with the lock held
+        free = np.flatnonzero(self._pins['slot'] < 0)
+        if not len(free) and self._reclaim():
+            free = np.flatnonzero(self._pins['slot'] < 0)
+        if not len(free):
+            raise RuntimeError(f"More than {len(self._pins)} frames pinned at once in the shared frame cache '{self.name}'")
+        self._pins[int(free[0])] = (slot, os.getpid())
+        self._slots[slot]['pins'] += 1
+        self._touch(slot)
+
+    def _unpin(self, slot):
+        with self._locked():
+            mine = np.flatnonzero((self._pins['slot'] == slot) & (self._pins['pid'] == os.getpid()))
+            if len(mine):   # otherwise already reclaimed
+                self._pins[int(mine[0])]['slot'] = -1
+                self._slots[slot]['pins'] -= 1
+
+    def _reclaim(self):
+        # called with the lock held: drops the pins and LOADING slots of processes that no longer exist
+        used = self._pins['slot'] >= 0
+        loading = self._slots['state'] == LOADING
+        pids = set(self._pins['pid'][used].tolist()) | set(self._slots['owner'][loading].tolist())
+        dead = [pid for pid in pids if not pid_alive(pid)]
+        if not dead:
+            return 0
+        stale_pins = used & np.isin(self._pins['pid'], dead)
+        np.subtract.at(self._slots['pins'], self._pins['slot'][stale_pins], 1)
+        self._pins['slot'][stale_pins] = -1
+        stale_slots = loading & np.isin(self._slots['owner'], dead)
+        self._slots['state'][stale_slots] = EMPTY
+        reclaimed = int(stale_pins.sum() + stale_slots.sum())
+        self._header[0]['reclaimed'] += reclaimed
+        return reclaimed
+
+    def _loading(self, sequence, timestamp):
+        # slot of the frame if a live process is decoding it (a dead decoder's slot is reclaimed)
+        slot = self._find(sequence, timestamp, (LOADING,))
+        if slot is not None and not pid_alive(int(self._slots[slot]['owner'])):
+            self._reclaim()
+            return None
+        return slot
+
+    def _allocate(self, sequence, timestamp):
+        # free slot first, then the least recently used unpinned frame
+        for attempt in range(2):
+            free = np.flatnonzero(self._slots['state'] == EMPTY)
+            candidates = np.flatnonzero((self._slots['state'] == READY) & (self._slots['pins'] == 0))
+            if len(free) or len(candidates) or not self._reclaim():
+                break
+        if len(free):
+            slot = int(free[0])
+        elif len(candidates):
+            slot = int(candidates[np.argmin(self._slots['last_used'][candidates])])
+            self._header[0]['evictions'] += 1
+        else:
+            return None
+        self._slots[slot] = (sequence_key(sequence), timestamp, LOADING, 0, os.getpid(), 0, (0, 0, 0), (0, 0))
+        self._touch(slot)
+        return slot
+
+    def put(self, sequence, timestamp, rgb, depth):
+        """
+        Stores a decoded frame, evicting the least recently used one if the budget is full.
+
+        Returns:
+        - stored (bool): False if the frame does not fit in a slot or every slot is pinned.
+        """
+        if rgb.nbytes + depth.nbytes > self.slot_bytes:
+            return False
+        with self._locked():
+            if self._find(sequence, timestamp) is not None or self._loading(sequence, timestamp) is not None:
+                return True
+            slot = self._allocate(sequence, timestamp)
+        if slot is None:
+            return False
+        self._write(slot, rgb, depth)
+        return True
+
+    def _write(self, slot, rgb, depth):
+        offset = slot * self.slot_bytes
+        buf = np.ndarray(rgb.nbytes + depth.nbytes, dtype=np.uint8, buffer=self._data_shm.buf, offset=offset)
+        buf[:rgb.nbytes] = np.ascontiguousarray(rgb, dtype=np.uint8).reshape(-1)
+        buf[rgb.nbytes:] = np.ascontiguousarray(depth, dtype=np.uint16).reshape(-1).view(np.uint8)
+        with self._locked():
+            entry = self._slots[slot]
+            entry['rgb_shape'] = rgb.shape if rgb.ndim == 3 else rgb.shape + (1,)
+            entry['depth_shape'] = depth.shape
+            entry['state'] = READY
+
+    def _release(self, slot):
+        with self._locked():
+            self._slots[slot]['state'] = EMPTY
+
+    def get_or_load(self, sequence, timestamp, loader, timeout=30.0):
+        """
+        Returns a private copy of a frame, decoding it with loader() and caching it on a miss.
+
+        If another process is already decoding the same frame, waits for it instead of decoding it
+        twice (or takes over if that process died). Each call counts as one hit or one miss.
+
+        Parameters:
+        - sequence (str): Sequence name.
+        - timestamp (int): Association timestamp (nanoseconds).
+        - loader (callable): Returns (rgb, depth).
+        - timeout (float): Maximum wait (seconds) for a frame being decoded elsewhere.
+
+        Returns:
+        - (rgb, depth): Decoded frame.
+        """
+        deadline = time.monotonic() + timeout
+        missed = False
+        while True:
+            with self._locked():
+                slot = self._find(sequence, timestamp)
+                if slot is not None:
+                    if not missed:
+                        self._header[0]['hits'] += 1
+                    self._pin(slot)
+                    ready = True
+                else:
+                    if not missed:
+                        self._header[0]['misses'] += 1
+                        missed = True
+                    ready = False
+                    if self._loading(sequence, timestamp) is not None and time.monotonic() < deadline:
+                        slot = -1
+                    else:
+                        slot = self._allocate(sequence, timestamp)
+            if ready:
+                try:
+                    rgb, depth = self._views(slot)
+                    return rgb.copy(), depth.copy()
+                finally:
+                    self._unpin(slot)
+            if slot != -1:
+                break
+            time.sleep(0.001)
+
+        try:
+            rgb, depth = loader()
+        except BaseException:
+            if slot is not None:
+                self._release(slot)
+            raise
+        if slot is not None:
+            if rgb.nbytes + depth.nbytes <= self.slot_bytes:
+                self._write(slot, rgb, depth)
+            else:
+                self._release(slot)
+        return rgb, depth
+
+    def stats(self):
+        with self._locked():
+            header = self._header[0]
+            states = self._slots['state']
+            return {'capacity': self.capacity, 'slot_bytes': self.slot_bytes, 'ready': int((states == READY).sum()),
+                    'loading': int((states == LOADING).sum()), 'pinned': int((self._slots['pins'] > 0).sum()),
+                    'hits': int(header['hits']), 'misses': int(header['misses']), 'evictions': int(header['evictions']),
+                    'reclaimed': int(header['reclaimed'])}
+
+    def close(self):
+        """
+        Detaches from the shared memory (views handed out must not be used afterwards).
+        """
+        self._header = self._slots = None
+        self._index_shm.close()
+        self._data_shm.close()
+        self._lock_file.close()
+
+    def unlink(self):
+        """
+        Removes the shared memory segments (creator only, once every process is done).
+        """
+        self._index_shm.unlink()
+        self._data_shm.unlink()
+        try:
+            os.remove(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"))
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self._owner:
+            self.unlink()
+
+
+def load_frame(dataset_path, rgb_file, depth_file):
+    rgb = read_rgb(os.path.join(dataset_path, rgb_file))
+    depth = read_depth(os.path.join(dataset_path, depth_file))
+    if rgb is None or depth is None:
+        raise FileNotFoundError(f"Could not read {rgb_file} / {depth_file} in {dataset_path}")
+    return rgb, depth
+
+def warm_cache(cache, dataset_path, num_workers=4, stop_event=None, max_frames=None):
+    """
+    Decodes the frames listed in associations.txt into the cache, in file order.
+
+    Stops when every frame is cached, when max_frames frames (default: the cache capacity) have
+    been loaded, or when stop_event is set.
+
+    Returns:
+    - loaded (int): Number of frames decoded by this call.
+    """
+    sequence = os.path.basename(os.path.normpath(dataset_path))
+    ts_rgb, rgb_files, _, depth_files = read_associations(os.path.join(dataset_path, "associations.txt"))
+    max_frames = cache.capacity if max_frames is None else max_frames
+    todo = [i for i in range(len(ts_rgb)) if (sequence, int(ts_rgb[i])) not in cache][:max_frames]
+
+    def load(i):
+        if stop_event is not None and stop_event.is_set():
+            return 0
+        cache.get_or_load(sequence, int(ts_rgb[i]), lambda: load_frame(dataset_path, rgb_files[i], depth_files[i]))
+        return 1
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        return sum(pool.map(load, todo))
+
+def start_producer(cache, dataset_paths, num_workers=4):
+    """
+    Warms the cache from the associations of one or more sequences in a background thread.
+
+    Returns:
+    - thread (threading.Thread): The producer thread; set thread.stop_event to stop it early.
+    """
+    stop_event = threading.Event()
+
+    def run():
+        budget = cache.capacity
+        for dataset_path in dataset_paths:
+            if stop_event.is_set() or budget <= 0:
+                break
+            budget -= warm_cache(cache, dataset_path, num_workers, stop_event, budget)
+
+    thread = threading.Thread(target=run, name='frame-cache-producer', daemon=True)
+    thread.stop_event = stop_event
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create a shared-memory frame cache and warm it from associations.txt')
+    parser.add_argument('--path', type=str, nargs='+', help='Sequence folder(s) to warm')
+    parser.add_argument('--name', type=str, default=DEFAULT_NAME, help='Shared memory name')
+    parser.add_argument('--budget-gb', type=float, default=4.0, help='Memory budget (GB)')
+    parser.add_argument('--size', type=int, nargs=2, default=DEFAULT_FRAME_SHAPE[::-1], metavar=('W', 'H'), help='Largest frame size')
+    parser.add_argument('--workers', type=int, default=4, help='Decoding threads')
+    parser.add_argument('--stats', action='store_true', help='Print the statistics of a running cache and exit')
+    args = parser.parse_args()
+
+    if args.stats:
+        cache = SharedFrameCache(args.name)
+        print(cache.stats())
+        cache.close()
+        return
+
+    with SharedFrameCache(args.name, args.budget_gb * 1e9, (args.size[1], args.size[0]), create=True) as cache:
+        print(f"Shared frame cache '{args.name}': {cache.capacity} frames of {cache.slot_bytes / 1e6:.2f} MB")
+        start = time.perf_counter()
+        producer = start_producer(cache, args.path or [], args.workers)
+        producer.join()
+        print(f"Warmed {cache.stats()['ready']} frames in {time.perf_counter() - start:.1f} s; serving until interrupted (Ctrl-C)")
+        try:
+            while True:
+                time.sleep(10)
+        except KeyboardInterrupt:
+            pass
+        print(cache.stats())
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 shared_frame_cache.py --path data/4-natural-tr data/4-dark-tr --budget-gb 8
+#           (trainer workers) SequenceDataset(path, shared_cache=SharedFrameCache())
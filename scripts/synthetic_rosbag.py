@@ -0,0 +1,161 @@
+import argparse
+
+import numpy as np
+from rosbags.rosbag2 import StoragePlugin, Writer
+from alignment_utils import NS_PER_SEC
+from rosbag2TUM import DEFAULT_RGBD_MSG, load_custom_types
+
+TOPICS = {
+    'rgbd': ('/camera/camera/rgbd', 'realsense2_camera_msgs/msg/RGBD'),
+    'joint_states': ('/joint_states', 'sensor_msgs/msg/JointState'),
+    'imu': ('/camera/camera/imu', 'sensor_msgs/msg/Imu'),
+}
+JOINT_NAMES = ['joint1', 'joint2', 'joint3', 'joint4', 'joint5', 'joint6']
+START_NS = 1728571428 * NS_PER_SEC
+
+
+class MessageFactory:
+    """
+    Builds the synthetic messages of every topic, with the same layout as the recorded bags.
+
+    Images are a textured scene shifted by the camera motion plus sensor noise, so PNG encoding
+    costs about as much as on real frames; joints and IMU follow smooth sinusoids.
+    """
+
+    def __init__(self, typestore, width=848, height=480, seed=0):
+        self.types = typestore.types
+        self.width, self.height = width, height
+        self.rng = np.random.default_rng(seed)
+        y, x = np.mgrid[0:height, 0:width]
+        texture = self.rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+        self.rgb_base = (texture + np.stack([x * 191 // width, y * 191 // height, (x + y) * 95 // (width + height)], axis=-1)).astype(np.uint8)
+        self.depth_base = (800 + 1200 * y / height + 100 * np.sin(x / 40)).astype(np.uint16)
+
+    def header(self, timestamp, frame_id):
+        Time = self.types['builtin_interfaces/msg/Time']
+        Header = self.types['std_msgs/msg/Header']
+        return Header(stamp=Time(sec=timestamp // NS_PER_SEC, nanosec=timestamp % NS_PER_SEC), frame_id=frame_id)
+
+    def image(self, timestamp, frame_id, encoding, data):
+        Image = self.types['sensor_msgs/msg/Image']
+        step = data.shape[1] * data.itemsize * (data.shape[2] if data.ndim == 3 else 1)
+        return Image(header=self.header(timestamp, frame_id), height=data.shape[0], width=data.shape[1], encoding=encoding,
+                     is_bigendian=0, step=step, data=data.reshape(-1).view(np.uint8))
+
+    def camera_info(self, timestamp, frame_id):
+        CameraInfo = self.types['sensor_msgs/msg/CameraInfo']
+        RegionOfInterest = self.types['sensor_msgs/msg/RegionOfInterest']
+        fx, cx, cy = 0.72 * self.width, self.width / 2, self.height / 2
+        k = np.array([fx, 0, cx, 0, fx, cy, 0, 0, 1], dtype=np.float64)
+        p = np.array([fx, 0, cx, 0, 0, fx, cy, 0, 0, 0, 1, 0], dtype=np.float64)
+        return CameraInfo(header=self.header(timestamp, frame_id), height=self.height, width=self.width, distortion_model='plumb_bob',
+                          d=np.zeros(5), k=k, r=np.eye(3).reshape(-1), p=p, binning_x=0, binning_y=0,
+                          roi=RegionOfInterest(x_offset=0, y_offset=0, height=0, width=0, do_rectify=False))
+
+    def rgbd(self, timestamp, t):
+        shift = int(40 * np.sin(0.5 * t))
+        rgb = np.roll(self.rgb_base, shift, axis=1)
+        rgb = rgb + self.rng.integers(0, 4, rgb.shape, dtype=np.uint8)
+        depth = np.roll(self.depth_base, shift, axis=1) + self.rng.integers(0, 8, self.depth_base.shape, dtype=np.uint16)
+        RGBD = self.types['realsense2_camera_msgs/msg/RGBD']
+        return RGBD(header=self.header(timestamp, 'camera_link'),
+                    rgb_camera_info=self.camera_info(timestamp, 'camera_color_optical_frame'),
+                    depth_camera_info=self.camera_info(timestamp, 'camera_depth_optical_frame'),
+                    rgb=self.image(timestamp, 'camera_color_optical_frame', 'rgb8', rgb),
+                    depth=self.image(timestamp, 'camera_depth_optical_frame', '16UC1', depth))
+
+    def joint_state(self, timestamp, t):
+        JointState = self.types['sensor_msgs/msg/JointState']
+        phase = np.arange(len(JOINT_NAMES))
+        position = 0.5 * np.sin(0.3 * t + phase)
+        velocity = 0.15 * np.cos(0.3 * t + phase)
+        return JointState(header=self.header(timestamp, ''), name=list(JOINT_NAMES), position=position,
+                          velocity=velocity, effort=np.zeros(len(JOINT_NAMES)))
+
+    def imu(self, timestamp, t):
+        Imu = self.types['sensor_msgs/msg/Imu']
+        Vector3 = self.types['geometry_msgs/msg/Vector3']
+        Quaternion = self.types['geometry_msgs/msg/Quaternion']
+        accel = np.array([0.2 * np.sin(t), 0.1 * np.cos(t), 9.81]) + self.rng.normal(0, 0.02, 3)
+        gyro = np.array([0.05 * np.cos(0.5 * t), 0.02, 0.1 * np.sin(0.5 * t)]) + self.rng.normal(0, 0.002, 3)
+        covariance = np.zeros(9)
+        return Imu(header=self.header(timestamp, 'camera_imu_optical_frame'), orientation=Quaternion(x=0.0, y=0.0, z=0.0, w=1.0),
+                   orientation_covariance=np.array([-1.0] + [0.0] * 8),
+                   angular_velocity=Vector3(x=gyro[0], y=gyro[1], z=gyro[2]), angular_velocity_covariance=covariance,
+                   linear_acceleration=Vector3(x=accel[0], y=accel[1], z=accel[2]), linear_acceleration_covariance=covariance)
+
+
+def message_schedule(duration, rates, start=START_NS):
+    """
+    Returns the (timestamp, topic key) pairs of all messages, in time order.
+
+    Parameters:
+    - duration (float): Bag duration in seconds.
+    - rates (dict): Topic key -> rate in Hz.
+    - start (int): First timestamp (nanoseconds).
+    """
+    timestamps, keys = [], []
+    for key, rate in rates.items():
+        ts = start + (np.arange(int(duration * rate)) * (NS_PER_SEC / rate)).astype(np.int64)
+        timestamps.append(ts)
+        keys.append(np.full(len(ts), key, dtype=object))
+    timestamps = np.concatenate(timestamps)
+    keys = np.concatenate(keys)
+    order = np.argsort(timestamps, kind='stable')
+    return list(zip(timestamps[order].tolist(), keys[order].tolist()))
+
+def write_synthetic_bag(bag_path, duration=10.0, camera_rate=30.0, joint_rate=25.0, imu_rate=210.0,
+                        width=848, height=480, storage='sqlite3', rgbd_msg=DEFAULT_RGBD_MSG, seed=0):
+    """
+    Writes a rosbag2 with the RGBD, joint state and IMU topics of the recorded sequences.
+
+    Parameters:
+    - bag_path (str): Output bag folder (must not exist).
+    - duration (float): Duration in seconds.
+    - camera_rate, joint_rate, imu_rate (float): Topic rates in Hz (defaults: the recorded 30, 25 and ~210 Hz).
+    - width, height (int): Image size.
+    - storage (str): 'sqlite3' or 'mcap'.
+    - rgbd_msg (str): Path to the RGBD.msg definition.
+    - seed (int): Random seed.
+
+    Returns:
+    - counts (dict): Topic key -> number of messages written.
+    """
+    typestore = load_custom_types(rgbd_msg)
+    factory = MessageFactory(typestore, width, height, seed)
+    builders = {'rgbd': factory.rgbd, 'joint_states': factory.joint_state, 'imu': factory.imu}
+    rates = {'rgbd': camera_rate, 'joint_states': joint_rate, 'imu': imu_rate}
+    counts = dict.fromkeys(rates, 0)
+
+    plugin = StoragePlugin.MCAP if storage == 'mcap' else StoragePlugin.SQLITE3
+    with Writer(bag_path, version=8, storage_plugin=plugin) as writer:
+        connections = {key: writer.add_connection(topic, msgtype, typestore=typestore) for key, (topic, msgtype) in TOPICS.items()}
+        for timestamp, key in message_schedule(duration, rates):
+            msg = builders[key](timestamp, (timestamp - START_NS) / NS_PER_SEC)
+            writer.write(connections[key], timestamp, typestore.serialize_cdr(msg, TOPICS[key][1]))
+            counts[key] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic rosbag2 with the topics of the recorded sequences')
+    parser.add_argument('--output', type=str, required=True, help='Output bag folder')
+    parser.add_argument('--duration', type=float, default=10.0, help='Duration in seconds')
+    parser.add_argument('--camera-rate', type=float, default=30.0, help='RGBD rate (Hz)')
+    parser.add_argument('--joint-rate', type=float, default=25.0, help='Joint state rate (Hz)')
+    parser.add_argument('--imu-rate', type=float, default=210.0, help='IMU rate (Hz)')
+    parser.add_argument('--size', type=int, nargs=2, default=[848, 480], metavar=('W', 'H'), help='Image size')
+    parser.add_argument('--storage', type=str, choices=['sqlite3', 'mcap'], default='sqlite3', help='rosbag2 storage plugin')
+    parser.add_argument('--rgbd-msg', type=str, default=DEFAULT_RGBD_MSG, help='RGBD.msg definition')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    counts = write_synthetic_bag(args.output, args.duration, args.camera_rate, args.joint_rate, args.imu_rate,
+                                 args.size[0], args.size[1], args.storage, args.rgbd_msg, args.seed)
+    print(f"Synthetic bag written to {args.output}: " + ', '.join(f"{TOPICS[key][0]} {n}" for key, n in counts.items()))
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 synthetic_rosbag.py --output /tmp/synthetic_bag --duration 20
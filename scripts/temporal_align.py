@@ -4,26 +4,120 @@ import yaml
 from scipy.spatial.transform import Rotation as R
 import os
 import argparse
+import json
 from alignment_utils import *
+from alignment_cache import AlignmentCache, DEFAULT_CACHE_DIR, cached_process_timestamps
+from sequence_dataset import read_associations
+from rgb_video import read_rgb
+from instrumentation import Profiler, QUIET, INFO
+
+# OpenCV camera (x right, y down, z forward) --> OpenGL/NeRF camera (x right, y up, z backward)
+T_CV_TO_GL = np.diag([1.0, -1.0, -1.0, 1.0])
+
+def compute_aligned_camera_poses(dataset_path, matched_flange_poses, matched_gt_poses):
+    """
+    Computes the per-frame camera poses from the matched flange and ground-truth poses, in one batched pass.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory (for extrinsics.yaml).
+    - matched_flange_poses (list of tuples): Flange poses matched to each frame.
+    - matched_gt_poses (list of tuples): Ground-truth (flange-markers) poses matched to each frame.
+
+    Returns:
+    - poses (dict): 'kinematics' and 'groundtruth' -> (Nx4 quaternions, Nx3 positions) of the camera in the world frame.
+    """
+    transforms = load_yaml_transformations(os.path.join(dataset_path, "extrinsics.yaml"))
+    T_world_base_marker = transforms[('base_marker_ring', 'world')]                     # base markers --> world
+    T_robot_base_base_marker = transforms[('base_marker_ring', 'robot_base')]           # base markers --> robot base
+    T_robot_flange_rgb = transforms[('rgb_sensor', 'robot_flange')]                     # camera  --> flange
+    T_rgb_flange_markers = compute_T_rgb_flange_markers(transforms)                     # flange markers --> camera
+    return {
+        'kinematics': compute_camera_world_positions(matched_flange_poses, T_world_base_marker, T_robot_base_base_marker, T_robot_flange_rgb),
+        'groundtruth': compute_camera_world_positions_gt(matched_gt_poses, T_rgb_flange_markers),
+    }
+
+def export_transforms_json(json_path, dataset_path, ts_assoc, quats, positions, intrinsics=None):
+    """
+    Writes a NeRF/3DGS transforms.json camera list (camera-to-world matrices in the OpenGL convention).
+
+    Parameters:
+    - json_path (str): Output path.
+    - dataset_path (str): Path to the dataset directory.
+    - ts_assoc (np.array): Frame timestamps (int64 nanoseconds).
+    - quats (np.array): Nx4 camera orientations in the world frame.
+    - positions (np.array): Nx3 camera positions in the world frame.
+    - intrinsics (tuple): Optional (fx, fy, cx, cy) in pixels.
+    """
+    ts_rgb, rgb_files, _, _ = read_associations(os.path.join(dataset_path, "associations.txt"))
+    file_of_ts = dict(zip(ts_rgb.tolist(), rgb_files))
+
+    T_world_cam = np.tile(np.eye(4), (len(quats), 1, 1))
+    T_world_cam[:, :3, :3] = R.from_quat(quats).as_matrix()
+    T_world_cam[:, :3, 3] = positions
+    T_world_cam = T_world_cam @ T_CV_TO_GL
+
+    data = {}
+    first = read_rgb(os.path.join(dataset_path, file_of_ts[int(ts_assoc[0])]))
+    if first is not None:
+        data['h'], data['w'] = first.shape[:2]
+    if intrinsics is not None:
+        data['fl_x'], data['fl_y'], data['cx'], data['cy'] = intrinsics
+    data['frames'] = [{'file_path': file_of_ts[int(ts)], 'timestamp': format_timestamp_ns(ts), 'transform_matrix': T.tolist()}
+                      for ts, T in zip(ts_assoc, T_world_cam)]
+    with open(json_path, 'w') as f:
+        json.dump(data, f, indent=2)
 
 def main():
     # pointing to the dataset folder
     parser = argparse.ArgumentParser(description='Time alignment')
     parser.add_argument('--path', type=str, required=True, help='Folder containing dataset')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute instead of using the alignment cache')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, help='Alignment cache folder')
+    parser.add_argument('--export', action='store_true', help='Write groundtruth_rgb.txt and kinematics_rgb.txt (camera poses per frame)')
+    parser.add_argument('--transforms-json', type=str, choices=['groundtruth', 'kinematics'], help='Also write transforms.json from this source')
+    parser.add_argument('--intrinsics', type=float, nargs=4, metavar=('FX', 'FY', 'CX', 'CY'), help='Camera intrinsics for transforms.json')
+    parser.add_argument('--report', type=str, help='Write the stage timings to this JSON file')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print errors')
     args = parser.parse_args()
         
     dataset_path = os.path.join(args.path)
+    profiler = Profiler('temporal_align', QUIET if args.quiet else INFO)
     # we retrieve the data from the files
 
-    ts_assoc, matched_ts_flange, matched_flange_poses, matched_ts_gt, matched_gt_poses = process_timestamps(dataset_path)
+    if args.no_cache:
+        ts_assoc, matched_ts_flange, matched_flange_poses, matched_ts_gt, matched_gt_poses = process_timestamps(dataset_path, profiler)
+    else:
+        ts_assoc, matched_ts_flange, matched_flange_poses, matched_ts_gt, matched_gt_poses = cached_process_timestamps(dataset_path, AlignmentCache(args.cache_dir), profiler)
+    profiler.count('frames', len(ts_assoc))
+
+    if args.export or args.transforms_json:
+        with profiler.stage('transform'):
+            camera_poses = compute_aligned_camera_poses(dataset_path, matched_flange_poses, matched_gt_poses)
+        if args.export:
+            for source, file_name in [('groundtruth', "groundtruth_rgb.txt"), ('kinematics', "kinematics_rgb.txt")]:
+                quats, positions = camera_poses[source]
+                with profiler.stage('write'):
+                    save_poses(os.path.join(dataset_path, file_name), ts_assoc, quats, positions)
+                profiler.log(INFO, f"{len(ts_assoc)} camera poses ({source}) written to {os.path.join(dataset_path, file_name)}")
+        if args.transforms_json:
+            quats, positions = camera_poses[args.transforms_json]
+            json_path = os.path.join(dataset_path, "transforms.json")
+            with profiler.stage('write'):
+                export_transforms_json(json_path, dataset_path, ts_assoc, quats, positions, args.intrinsics)
+            profiler.log(INFO, f"transforms.json ({args.transforms_json}) written to {json_path}")
+        if args.report:
+            profiler.write_json(args.report)
+        return
 
     # retrieve an especific element
     i = 10
-    print((ts_assoc[i]))
-    print((matched_ts_flange[i]))
-    print((matched_flange_poses[i]))
-    print((matched_ts_gt[i]))
-    print((matched_gt_poses[i]))
+    profiler.log(INFO, format_timestamp_ns(ts_assoc[i]))
+    profiler.log(INFO, format_timestamp_ns(matched_ts_flange[i]))
+    profiler.log(INFO, matched_flange_poses[i])
+    profiler.log(INFO, format_timestamp_ns(matched_ts_gt[i]))
+    profiler.log(INFO, matched_gt_poses[i])
+    if args.report:
+        profiler.write_json(args.report)
 
     
 if __name__ == '__main__':
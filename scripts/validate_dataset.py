@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from alignment_utils import format_timestamp_ns, load_stream, ns_to_sec, parse_timestamp_ns
+from depth_codec import HEADER as ZDEPTH_HEADER, ZDEPTH_EXT, read_header as read_zdepth_header
+from rgb_video import RGB_INDEX, read_index as read_video_index
+from sensor_stream import STREAM_FILES
+from sequence_dataset import read_associations
+
+REPORT_NAME = "integrity_report.json"
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG color types
+PNG_GRAY, PNG_RGB = 0, 2
+
+# expected (bit depth, color type) of each image folder: 8-bit BGR color, 16-bit single-channel depth
+EXPECTED_FORMAT = {
+    'rgb': (8, PNG_RGB),
+    'depth': (16, PNG_GRAY),
+}
+
+# at most this many offending entries are listed per check
+MAX_LISTED = 20
+
+
+def read_png_header(path):
+    """
+    Reads the IHDR chunk of a PNG file without decoding the image.
+
+    Parameters:
+    - path (str): PNG file path.
+
+    Returns:
+    - header (tuple): (width, height, bit_depth, color_type), or None if the file is missing or is not a PNG.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(33)
+    except OSError:
+        return None
+    if len(data) < 33 or data[:8] != PNG_SIGNATURE or data[12:16] != b'IHDR':
+        return None
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', data[16:26])
+    return width, height, bit_depth, color_type
+
+def read_image_header(path):
+    """
+    Reads the header of a PNG or zdepth file (a zdepth frame is reported as a 16-bit grayscale PNG).
+    """
+    if not path.endswith(ZDEPTH_EXT):
+        return read_png_header(path)
+    try:
+        with open(path, 'rb') as f:
+            width, height, _, _ = read_zdepth_header(f.read(ZDEPTH_HEADER.size))
+    except (OSError, ValueError, struct.error):
+        return None
+    return width, height, 16, PNG_GRAY
+
+def probe_images(dataset_path, rel_paths, workers=16):
+    """
+    Reads the image headers of many files in parallel.
+
+    Returns:
+    - headers (np.array): Nx4 int64 array (width, height, bit_depth, color_type), -1 for unreadable files.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(read_image_header, [os.path.join(dataset_path, p) for p in rel_paths])
+        headers = [h if h is not None else (-1, -1, -1, -1) for h in results]
+    return np.array(headers, dtype=np.int64).reshape(-1, 4)
+
+def video_headers(dataset_path, ts, headers):
+    """
+    Fills the headers of RGB frames without a PNG that are packed in the sequence video (see rgb_video.py).
+    """
+    video, video_ts, _ = read_video_index(os.path.join(dataset_path, RGB_INDEX))
+    packed = (headers[:, 0] < 0) & np.isin(ts, video_ts)
+    headers = headers.copy()
+    headers[packed] = (video['width'], video['height'], 8, PNG_RGB)
+    return headers
+
+def check_images(kind, rel_paths, headers, size=None):
+    """
+    Checks the probed headers of one image folder.
+
+    Parameters:
+    - kind (str): 'rgb' or 'depth'.
+    - rel_paths (list): File paths, relative to the sequence folder.
+    - headers (np.array): Nx4 headers as returned by probe_images.
+    - size (tuple): Expected (width, height); defaults to the most common size.
+
+    Returns:
+    - result (dict): Counts and the first offending files of every check.
+    """
+    bit_depth, color_type = EXPECTED_FORMAT[kind]
+    missing = headers[:, 0] < 0
+    if size is None and (~missing).any():
+        sizes, counts = np.unique(headers[~missing, :2], axis=0, return_counts=True)
+        size = tuple(int(v) for v in sizes[np.argmax(counts)])
+    bad_format = ~missing & ((headers[:, 2] != bit_depth) | (headers[:, 3] != color_type))
+    bad_size = ~missing & ((headers[:, 0] != size[0]) | (headers[:, 1] != size[1])) if size is not None else np.zeros_like(missing)
+
+    def listed(mask):
+        return [rel_paths[i] for i in np.flatnonzero(mask)[:MAX_LISTED]]
+
+    return {
+        'checked': len(rel_paths),
+        'size': list(size) if size is not None else None,
+        'missing': int(missing.sum()),
+        'bad_format': int(bad_format.sum()),
+        'bad_size': int(bad_size.sum()),
+        'missing_files': listed(missing),
+        'bad_format_files': listed(bad_format),
+        'bad_size_files': listed(bad_size),
+        'ok': not (missing.any() or bad_format.any() or bad_size.any()),
+    }
+
+def file_timestamps(rel_paths):
+    """
+    Parses the timestamps encoded in file names (rgb/<ts>.png), -1 when a name is not a timestamp.
+    """
+    ts = np.full(len(rel_paths), -1, dtype=np.int64)
+    for i, rel_path in enumerate(rel_paths):
+        try:
+            ts[i] = parse_timestamp_ns(os.path.splitext(os.path.basename(rel_path))[0])
+        except ValueError:
+            pass
+    return ts
+
+def check_timestamps(ts, gap_factor=5.0, allow_duplicates=False):
+    """
+    Checks that a stream is strictly increasing and has no large gaps.
+
+    Parameters:
+    - ts (np.array): Timestamps (int64 nanoseconds), in file order.
+    - gap_factor (float): A step longer than gap_factor times the median step is a gap.
+    - allow_duplicates (bool): Report repeated timestamps without failing the check (e.g. the depth
+      column of associations.txt, where one depth frame can be associated with several RGB frames).
+
+    Returns:
+    - result (dict): Sample count, time range, rate and the monotonicity and gap checks.
+    """
+    if len(ts) == 0:
+        return {'samples': 0, 'ok': False}
+    dt = np.diff(ts)
+    backwards = np.flatnonzero(dt < 0)
+    duplicates = np.flatnonzero(dt == 0)
+    median_dt = np.median(dt[dt > 0]) if (dt > 0).any() else 0
+    gaps = np.flatnonzero(dt > gap_factor * median_dt) if median_dt > 0 else np.array([], dtype=np.int64)
+    return {
+        'samples': len(ts),
+        'start': format_timestamp_ns(ts[0]),
+        'end': format_timestamp_ns(ts[-1]),
+        'rate_hz': float(1 / ns_to_sec(median_dt)) if median_dt > 0 else None,
+        'backwards': len(backwards),
+        'duplicates': len(duplicates),
+        'gaps': len(gaps),
+        'max_gap_s': float(ns_to_sec(dt.max())) if len(dt) else 0.0,
+        'first_backwards': [format_timestamp_ns(ts[i + 1]) for i in backwards[:MAX_LISTED]],
+        'first_duplicates': [format_timestamp_ns(ts[i + 1]) for i in duplicates[:MAX_LISTED]],
+        'first_gaps': [[format_timestamp_ns(ts[i]), format_timestamp_ns(ts[i + 1])] for i in gaps[:MAX_LISTED]],
+        'ok': len(backwards) == 0 and (allow_duplicates or len(duplicates) == 0),
+    }
+
+def check_coverage(frame_ts, stream_ts, max_offset_ns):
+    """
+    Checks that every camera frame lies inside a stream and has a sample within max_offset_ns.
+
+    Returns:
+    - result (dict): Number of frames outside the stream range and frames without a close sample.
+    """
+    order = np.sort(stream_ts)
+    inside = (frame_ts >= order[0]) & (frame_ts <= order[-1])
+    idx = np.clip(np.searchsorted(order, frame_ts), 1, len(order) - 1)
+    offset = np.minimum(np.abs(frame_ts - order[idx - 1]), np.abs(order[idx] - frame_ts)) if len(order) > 1 else np.abs(frame_ts - order[0])
+    unmatched = inside & (offset > max_offset_ns)
+    return {
+        'frames_outside': int((~inside).sum()),
+        'frames_unmatched': int(unmatched.sum()),
+        'max_offset_s': float(ns_to_sec(offset[inside].max())) if inside.any() else None,
+        'ok': not unmatched.any(),
+    }
+
+def validate_sequence(dataset_path, workers=16, size=None, gap_factor=5.0, max_offset=0.05):
+    """
+    Validates the images and timestamp streams of a sequence.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset directory.
+    - workers (int): Number of threads used to probe the images.
+    - size (tuple): Expected image (width, height); defaults to the most common size.
+    - gap_factor (float): Gap threshold, in multiples of the median sampling step.
+    - max_offset (float): Maximum distance (seconds) from a frame to the nearest sample of every stream.
+
+    Returns:
+    - report (dict): Machine-readable report; report['ok'] is False if any check failed.
+    """
+    report = {'sequence': os.path.basename(os.path.normpath(dataset_path)), 'path': os.path.abspath(dataset_path),
+              'images': {}, 'streams': {}, 'coverage': {}, 'errors': []}
+    association_file = os.path.join(dataset_path, STREAM_FILES['camera'])
+    if not os.path.exists(association_file):
+        report['errors'].append(f"{STREAM_FILES['camera']} not found")
+        report['ok'] = False
+        return report
+
+    ts_rgb, rgb_files, ts_depth, depth_files = read_associations(association_file)
+    for kind, ts, rel_paths in [('rgb', ts_rgb, rgb_files), ('depth', ts_depth, depth_files)]:
+        headers = probe_images(dataset_path, rel_paths, workers)
+        if kind == 'rgb' and os.path.exists(os.path.join(dataset_path, RGB_INDEX)):
+            headers = video_headers(dataset_path, ts, headers)
+        result = check_images(kind, rel_paths, headers, size)
+        name_ts = file_timestamps(rel_paths)
+        result['name_mismatch'] = int((name_ts != ts).sum())
+        result['ok'] = result['ok'] and result['name_mismatch'] == 0
+        report['images'][kind] = result
+    report['streams']['camera'] = check_timestamps(ts_rgb, gap_factor)
+    report['streams']['depth'] = check_timestamps(ts_depth, gap_factor, allow_duplicates=True)
+
+    for stream, rel_path in STREAM_FILES.items():
+        if stream == 'camera' or not os.path.exists(os.path.join(dataset_path, rel_path)):
+            continue
+        try:
+            ts, _ = load_stream(os.path.join(dataset_path, rel_path))
+        except ValueError as e:
+            report['errors'].append(f"{rel_path}: {e}")
+            continue
+        report['streams'][stream] = check_timestamps(ts, gap_factor)
+        if len(ts):
+            report['coverage'][stream] = check_coverage(ts_rgb, ts, int(max_offset * 1e9))
+
+    sections = list(report['images'].values()) + list(report['streams'].values()) + list(report['coverage'].values())
+    report['ok'] = not report['errors'] and all(section['ok'] for section in sections)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the images and timestamps of dataset sequences without decoding the images')
+    parser.add_argument('--path', type=str, nargs='+', required=True, help='Sequence folder(s)')
+    parser.add_argument('--report-dir', type=str, help=f'Write <sequence>.json here instead of <path>/{REPORT_NAME}')
+    parser.add_argument('--size', type=int, nargs=2, metavar=('W', 'H'), help='Expected image size (default: most common size)')
+    parser.add_argument('--gap-factor', type=float, default=5.0, help='Gap threshold in multiples of the median sampling step')
+    parser.add_argument('--max-offset', type=float, default=0.05, help='Maximum frame-to-sample distance per stream (seconds)')
+    parser.add_argument('--workers', type=int, default=16, help='Threads used to probe the images')
+    args = parser.parse_args()
+
+    all_ok = True
+    for dataset_path in args.path:
+        report = validate_sequence(dataset_path, args.workers, args.size, args.gap_factor, args.max_offset)
+        if args.report_dir:
+            os.makedirs(args.report_dir, exist_ok=True)
+            report_file = os.path.join(args.report_dir, f"{report['sequence']}.json")
+        else:
+            report_file = os.path.join(dataset_path, REPORT_NAME)
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"{report['sequence']}: {'OK' if report['ok'] else 'FAILED'} ({report_file})")
+        all_ok &= report['ok']
+    sys.exit(0 if all_ok else 1)
+
+if __name__ == '__main__':
+    main()
+
+# example:
+#           python3 validate_dataset.py --path data/4-natural-tr data/4-dark-tr --report-dir reports
@@ -4,91 +4,177 @@ import yaml
 from scipy.spatial.transform import Rotation as R
 import os
 import argparse
+from contextlib import nullcontext
+from decimal import Decimal, ROUND_HALF_UP
 
-def process_timestamps(dataset_path):
+NS_PER_SEC = 1_000_000_000
+
+def parse_timestamp_ns(text):
+    """
+    Parses a decimal timestamp in seconds (e.g. "1728571428.866459717") into integer nanoseconds.
+
+    The conversion is exact: the string is never turned into a float, so timestamps around 1.7e9 s
+    keep their full nanosecond resolution. Digits beyond the ninth decimal are rounded.
+
+    Parameters:
+    - text (str): Timestamp in seconds.
+
+    Returns:
+    - ts_ns (int): Timestamp in nanoseconds.
+    """
+    text = text.strip()
+    sign = -1 if text.startswith('-') else 1
+    text = text.lstrip('+-')
+    if 'e' in text or 'E' in text:
+        return sign * int(Decimal(text).scaleb(9).to_integral_value(rounding=ROUND_HALF_UP))
+    sec, _, frac = text.partition('.')
+    ts_ns = int(sec or 0) * NS_PER_SEC + int((frac[:9] or '0').ljust(9, '0'))
+    if len(frac) > 9 and frac[9] >= '5':
+        ts_ns += 1
+    return sign * ts_ns
+
+def format_timestamp_ns(ts_ns):
+    """
+    Formats integer nanoseconds as seconds with 9 decimals (the format used in file names and text files).
+    """
+    ts_ns = int(ts_ns)
+    sign = '-' if ts_ns < 0 else ''
+    sec, nsec = divmod(abs(ts_ns), NS_PER_SEC)
+    return f"{sign}{sec}.{nsec:09d}"
+
+def ns_to_sec(ts_ns):
+    """
+    Float view (seconds) of nanosecond timestamps; only meant for APIs that need floats.
+    """
+    if isinstance(ts_ns, np.ndarray):
+        sec, nsec = np.divmod(ts_ns, NS_PER_SEC)
+        return sec.astype(float) + nsec.astype(float) / NS_PER_SEC
+    return int(ts_ns) / NS_PER_SEC
+
+def sec_to_ns(ts_sec):
+    """
+    Converts float seconds to integer nanoseconds (for legacy float inputs).
+    """
+    if isinstance(ts_sec, np.ndarray):
+        return np.round(ts_sec * NS_PER_SEC).astype(np.int64)
+    return int(round(ts_sec * NS_PER_SEC))
+
+def find_nearest_indices(ts_list, targets):
+    """
+    Finds, for every target, the index of the nearest timestamp in a sorted list (ties go to the earlier one).
+
+    Parameters:
+    - ts_list (np.array): Sorted int64 timestamps.
+    - targets (np.array): Query timestamps.
+
+    Returns:
+    - indices (np.array): Index into ts_list of the nearest timestamp of each target.
+    """
+    ts_list = np.asarray(ts_list)
+    targets = np.asarray(targets)
+    right = np.clip(np.searchsorted(ts_list, targets), 0, len(ts_list) - 1)
+    left = np.clip(right - 1, 0, len(ts_list) - 1)
+    use_left = np.abs(targets - ts_list[left]) <= np.abs(ts_list[right] - targets)
+    return np.where(use_left, left, right)
+
+def load_stream(txt_path):
+    """
+    Loads a whitespace-separated text stream whose first column is a timestamp.
+
+    Parameters:
+    - txt_path (str): Path to the text file.
+
+    Returns:
+    - timestamps (np.array): int64 timestamps in nanoseconds.
+    - values (np.array): NxK float array with the remaining columns.
+    """
+    timestamps, values = [], []
+    with open(txt_path, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.split()
+            timestamps.append(parse_timestamp_ns(fields[0]))
+            values.append([float(v) for v in fields[1:]])
+    return np.array(timestamps, dtype=np.int64), np.array(values, dtype=float).reshape(len(timestamps), -1)
+
+def process_timestamps(dataset_path, profiler=None):
     """
     Reads and processes timestamps from association, flange poses, and ground truth files.
     Filters timestamps to a common range and finds the nearest match for each association timestamp.
+    Timestamps are handled as int64 nanoseconds, so matching is exact.
     
     Args:
         dataset_path (str): Path to the dataset directory.
+        profiler (Profiler): Optional profiler; the 'read' and 'match' stages are timed.
     
     Returns:
-        tuple: (ts_assoc, matched_ts_flange, matched_flange_poses, matched_ts_gt, matched_gt_poses)
+        tuple: (ts_assoc, matched_ts_flange, matched_flange_poses, matched_ts_gt, matched_gt_poses),
+               timestamps as int64 nanosecond arrays.
     """
     # Define file paths
     association_file = os.path.join(dataset_path, "associations.txt")
     flange_poses_file = os.path.join(dataset_path, "robot_data/flange_poses.txt")
     gt_file = os.path.join(dataset_path, "groundtruth.txt")
 
-    # Read association timestamps
-    ts_assoc = []
-    with open(association_file, 'r') as f:
-        for line in f:
-            if line.startswith('#'):
-                continue
-            values = list(line.split())
-            ts_assoc.append(float(values[0]))
-
-    # Read flange poses timestamps and data
-    ts_flange, flange_poses = [], []
-    with open(flange_poses_file, 'r') as f:
-        for line in f:
-            if line.startswith('#'):
-                continue
-            values = list(line.split())
-            ts = float(values[0])
-            ts_flange.append(ts)
-            q = values[1:5]  # Quaternion (qx, qy, qz, qw)
-            t = values[5:8]  # Translation (tx, ty, tz)
-            flange_poses.append((q, t))
-
-    # Read ground truth timestamps and data
-    ts_gt, gt_poses = [], []
-    with open(gt_file, 'r') as f:
-        for line in f:
-            if line.startswith('#'):
-                continue
-            values = list(line.split())
-            ts = float(values[0])
-            ts_gt.append(ts)
-            q = values[1:5]  # Quaternion (qx, qy, qz, qw)
-            t = values[5:8]  # Translation (tx, ty, tz)
-            gt_poses.append((q, t))
-
-    # Determine the common timestamp range
-    min_ts = max(min(ts_assoc), min(ts_flange), min(ts_gt))
-    max_ts = min(max(ts_assoc), max(ts_flange), max(ts_gt))
-
-    # Filter timestamps within the common range
-    ts_assoc = [t for t in ts_assoc if min_ts <= t <= max_ts]
-    ts_flange, flange_poses = zip(*[(t, p) for t, p in zip(ts_flange, flange_poses) if min_ts <= t <= max_ts])
-    ts_gt, gt_poses = zip(*[(t, p) for t, p in zip(ts_gt, gt_poses) if min_ts <= t <= max_ts])
-
-    # Convert back to lists
-    ts_flange, flange_poses = list(ts_flange), list(flange_poses)
-    ts_gt, gt_poses = list(ts_gt), list(gt_poses)
-
-    # Function to find the nearest timestamp
-    def find_nearest(ts_list, target):
-        ts_list = np.array(ts_list, dtype=float)  # Ensure array of floats
-        target = float(target)  # Ensure target is float
-        idx = np.argmin(np.abs(ts_list - target))
-        return ts_list[idx]
-
-    # Match each association timestamp with the closest flange and ground truth timestamp
-    matched_ts_flange, matched_flange_poses = [], []
-    matched_ts_gt, matched_gt_poses = [], []
-
-    for ts in ts_assoc:
-        nearest_flange = find_nearest(ts_flange, ts)
-        nearest_gt = find_nearest(ts_gt, ts)
-
-        matched_ts_flange.append(nearest_flange)
-        matched_flange_poses.append(flange_poses[ts_flange.index(nearest_flange)])
-
-        matched_ts_gt.append(nearest_gt)
-        matched_gt_poses.append(gt_poses[ts_gt.index(nearest_gt)])
+    stage = profiler.stage if profiler is not None else (lambda name: nullcontext())
+
+    with stage('read'):
+        # Read association timestamps
+        ts_assoc = []
+        with open(association_file, 'r') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                values = list(line.split())
+                ts_assoc.append(parse_timestamp_ns(values[0]))
+
+        # Read flange poses timestamps and data
+        ts_flange, flange_poses = [], []
+        with open(flange_poses_file, 'r') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                values = list(line.split())
+                ts_flange.append(parse_timestamp_ns(values[0]))
+                q = values[1:5]  # Quaternion (qx, qy, qz, qw)
+                t = values[5:8]  # Translation (tx, ty, tz)
+                flange_poses.append((q, t))
+
+        # Read ground truth timestamps and data
+        ts_gt, gt_poses = [], []
+        with open(gt_file, 'r') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                values = list(line.split())
+                ts_gt.append(parse_timestamp_ns(values[0]))
+                q = values[1:5]  # Quaternion (qx, qy, qz, qw)
+                t = values[5:8]  # Translation (tx, ty, tz)
+                gt_poses.append((q, t))
+
+        ts_assoc = np.array(ts_assoc, dtype=np.int64)
+        ts_flange = np.array(ts_flange, dtype=np.int64)
+        ts_gt = np.array(ts_gt, dtype=np.int64)
+
+    with stage('match'):
+        # Determine the common timestamp range
+        min_ts = max(ts_assoc.min(), ts_flange.min(), ts_gt.min())
+        max_ts = min(ts_assoc.max(), ts_flange.max(), ts_gt.max())
+
+        # Filter timestamps within the common range
+        ts_assoc = ts_assoc[(ts_assoc >= min_ts) & (ts_assoc <= max_ts)]
+        keep_flange = np.flatnonzero((ts_flange >= min_ts) & (ts_flange <= max_ts))
+        keep_gt = np.flatnonzero((ts_gt >= min_ts) & (ts_gt <= max_ts))
+        ts_flange, flange_poses = ts_flange[keep_flange], [flange_poses[i] for i in keep_flange]
+        ts_gt, gt_poses = ts_gt[keep_gt], [gt_poses[i] for i in keep_gt]
+
+        # Match each association timestamp with the closest flange and ground truth timestamp
+        idx_flange = find_nearest_indices(ts_flange, ts_assoc)
+        idx_gt = find_nearest_indices(ts_gt, ts_assoc)
+
+        matched_ts_flange, matched_flange_poses = ts_flange[idx_flange], [flange_poses[i] for i in idx_flange]
+        matched_ts_gt, matched_gt_poses = ts_gt[idx_gt], [gt_poses[i] for i in idx_gt]
 
     # Ensure all sets have the same length
     assert len(ts_assoc) == len(matched_ts_flange) == len(matched_ts_gt), "Data sets do not match in size"
@@ -118,6 +204,21 @@ def load_yaml_transformations(yaml_path):
     
     return transformations
 
+def compute_T_rgb_flange_markers(transforms):
+    """
+    Computes the transformation from the flange markers to the RGB camera.
+
+    Parameters:
+    - transforms (dict): Transformations as returned by load_yaml_transformations.
+
+    Returns:
+    - T_rgb_flange_markers (np.array): 4x4 transformation matrix (flange markers --> camera).
+    """
+    T_robot_flange_flange_marker = transforms[('flange_marker_ring', 'robot_flange')]   # flange markers --> flange
+    T_robot_flange_rgb = transforms[('rgb_sensor', 'robot_flange')]                     # camera  --> flange
+    T_flange_marker_robot_flange = np.linalg.inv(T_robot_flange_flange_marker)          # flange  --> flange markers
+    return np.linalg.inv(T_robot_flange_rgb) @ np.linalg.inv(T_flange_marker_robot_flange)
+
 def load_poses(txt_path):
     """
     Loads poses from a text file.
@@ -126,7 +227,7 @@ def load_poses(txt_path):
     - txt_path (str): Path to the text file.
 
     Returns:
-    - timestamps (np.array): Array of timestamps.
+    - timestamps (np.array): Array of int64 timestamps in nanoseconds.
     - poses (list of tuples): Each tuple contains a quaternion (qx, qy, qz, qw) and a translation vector (tx, ty, tz).
     """
     timestamps = []
@@ -135,12 +236,28 @@ def load_poses(txt_path):
         for line in f:
             if line.startswith('#'):
                 continue
-            values = list(map(float, line.split()))
-            timestamps.append(values[0])
-            q = values[1:5]  # Quaternion (qx, qy, qz, qw)
-            t = values[5:8]  # Translation (tx, ty, tz)
+            fields = line.split()
+            timestamps.append(parse_timestamp_ns(fields[0]))
+            values = list(map(float, fields[1:]))
+            q = values[0:4]  # Quaternion (qx, qy, qz, qw)
+            t = values[4:7]  # Translation (tx, ty, tz)
             poses.append((q, t))
-    return np.array(timestamps), poses
+    return np.array(timestamps, dtype=np.int64), poses
+
+def save_poses(txt_path, timestamps, quats, positions):
+    """
+    Saves poses to a text file in the same format read by load_poses.
+
+    Parameters:
+    - txt_path (str): Path to the text file.
+    - timestamps (np.array): Array of N int64 timestamps in nanoseconds.
+    - quats (np.array): Nx4 quaternions (qx, qy, qz, qw).
+    - positions (np.array): Nx3 translations (tx, ty, tz).
+    """
+    with open(txt_path, 'w') as f:
+        f.write("#timestamp qx qy qz qw tx ty tz\n")
+        for ts, q, t in zip(timestamps, quats, positions):
+            f.write(f"{format_timestamp_ns(ts)} {q[0]} {q[1]} {q[2]} {q[3]} {t[0]} {t[1]} {t[2]}\n")
 
 def pose_to_homogeneous(q, t):
     """
@@ -211,6 +328,24 @@ def transform_poses_right(poses, transform):
         transformed_poses.append(T_transformed[:3, 3])
     return np.array(transformed_poses)
 
+def poses_to_homogeneous(poses):
+    """
+    Converts a list of poses (quaternion and translation) into a stack of homogeneous transformation matrices.
+
+    Parameters:
+    - poses (list of tuples): List of (quaternion, translation) tuples.
+
+    Returns:
+    - T (np.array): Nx4x4 homogeneous transformation matrices.
+    """
+    q = np.array([p[0] for p in poses], dtype=float).reshape(-1, 4)
+    t = np.array([p[1] for p in poses], dtype=float).reshape(-1, 3)
+    T = np.tile(np.eye(4), (len(q), 1, 1))
+    if len(q) > 0:
+        T[:, :3, :3] = R.from_quat(q).as_matrix()
+    T[:, :3, 3] = t
+    return T
+
 def compute_camera_world_positions(poses_flange, T_world_base_marker, T_robot_base_base_marker, T_robot_flange_rgb):
     """
     Computes the world positions and orientations (as quaternions) of a camera given a set of flange poses.
@@ -226,29 +361,20 @@ def compute_camera_world_positions(poses_flange, T_world_base_marker, T_robot_ba
             - numpy.ndarray: Nx4 array of camera orientations as quaternions.
             - numpy.ndarray: Nx3 array of camera positions in the world frame.
     """
-    camera_world_positions = []
-    camera_world_orientations = []
-    
-    for f_pose in poses_flange:
-        # Convert pose information to a homogeneous transformation matrix
-        T_hom = pose_to_homogeneous(f_pose[0], f_pose[1])
-        
-        # Compute the transformed pose in the world frame
-        T_transformed = (T_world_base_marker @ 
-                         np.linalg.inv(T_robot_base_base_marker) @ 
-                         T_hom @ 
-                         T_robot_flange_rgb)
-        
-        # Extract the translation component (position)
-        position = T_transformed[:3, 3]
-        camera_world_positions.append(position)
-        
-        # Extract the rotation component and convert it to quaternion
-        rotation_matrix = T_transformed[:3, :3]
-        quaternion = R.from_matrix(rotation_matrix).as_quat()
-        camera_world_orientations.append(quaternion)
-    
-    return np.array(camera_world_orientations), np.array(camera_world_positions)
+    # Convert all the poses to homogeneous transformation matrices at once
+    T_hom = poses_to_homogeneous(poses_flange)
+
+    # Compute the transformed poses in the world frame
+    T_transformed = (T_world_base_marker @ 
+                     np.linalg.inv(T_robot_base_base_marker) @ 
+                     T_hom @ 
+                     T_robot_flange_rgb)
+
+    # Extract the translation (position) and rotation (as quaternion) components
+    camera_world_positions = T_transformed[:, :3, 3]
+    camera_world_orientations = R.from_matrix(T_transformed[:, :3, :3]).as_quat() if len(T_transformed) else np.zeros((0, 4))
+
+    return camera_world_orientations, camera_world_positions
 
 def compute_camera_world_positions_gt(poses_gt, T_rgb_flange_markers):
     """
@@ -263,23 +389,14 @@ def compute_camera_world_positions_gt(poses_gt, T_rgb_flange_markers):
             - numpy.ndarray: Nx4 array of camera orientations as quaternions.
             - numpy.ndarray: Nx3 array of camera positions in the world frame.
     """
-    camera_world_positions_gt = []
-    camera_world_orientations_gt = []
-    
-    for gt_pose in poses_gt:
-        # Convert ground truth pose information to a homogeneous transformation matrix
-        T_hom = pose_to_homogeneous(gt_pose[0], gt_pose[1])
-        
-        # Compute the transformed pose in the world frame
-        T_transformed = T_hom @ np.linalg.inv(T_rgb_flange_markers)
-        
-        # Extract the translation component (position)
-        position = T_transformed[:3, 3]
-        camera_world_positions_gt.append(position)
-        
-        # Extract the rotation component and convert it to quaternion
-        rotation_matrix = T_transformed[:3, :3]
-        quaternion = R.from_matrix(rotation_matrix).as_quat()
-        camera_world_orientations_gt.append(quaternion)
-    
-    return np.array(camera_world_orientations_gt), np.array(camera_world_positions_gt)
+    # Convert all the ground truth poses to homogeneous transformation matrices at once
+    T_hom = poses_to_homogeneous(poses_gt)
+
+    # Compute the transformed poses in the world frame
+    T_transformed = T_hom @ np.linalg.inv(T_rgb_flange_markers)
+
+    # Extract the translation (position) and rotation (as quaternion) components
+    camera_world_positions_gt = T_transformed[:, :3, 3]
+    camera_world_orientations_gt = R.from_matrix(T_transformed[:, :3, :3]).as_quat() if len(T_transformed) else np.zeros((0, 4))
+
+    return camera_world_orientations_gt, camera_world_positions_gt